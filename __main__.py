@@ -1,12 +1,31 @@
 
-from .facetracker import FaceTracker
 from .gui import run
+from .facerecord import ReplayTracker
+from tracing import TRACER
 
 
+import sys
 import threading
 if __name__ == "__main__":
-    tracker = FaceTracker()
+    replay = [arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--replay=")]
+    if replay:
+        tracker = ReplayTracker(replay[0], realtime="--replay-fast" not in sys.argv, loop="--loop" in sys.argv)
+    elif "--process" in sys.argv:
+        # Imported here so that replay does not need OpenSeeFace.
+        from .trackerprocess import ProcessFaceTracker
+        tracker = ProcessFaceTracker()
+    else:
+        from .facetracker import FaceTracker
+        tracker = FaceTracker()
     tracker.terminate = True
+    max_fps = 60
+    for arg in sys.argv:
+        if arg.startswith("--max-fps="):
+            max_fps = float(arg.split("=", 1)[1])
+        elif arg.startswith("--record=") and not replay:
+            tracker.record_path = arg.split("=", 1)[1]
+        elif arg.startswith("--trace="):
+            TRACER.start(arg.split("=", 1)[1])
 #    th = threading.Thread(target=tracker.run)
 #    th.start()
-    run(tracker)
\ No newline at end of file
+    run(tracker, max_fps)
\ No newline at end of file
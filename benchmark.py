@@ -0,0 +1,423 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+
+from facestate import FEATURES, FaceState, FaceStateBuffer
+from facerecord import FaceRecording
+from mapping import SOURCES, ParameterMapping
+from smoothing import FILTER_TYPES, create_filter
+from meshedit import MeshTopology, EditableMesh, edges_from_triangles, triangles_from_edges
+from spatial import VertexGrid
+
+
+# Each benchmark is a function(args) returning (step, items, params): step() runs one iteration, items is how
+# many units of work (frames, vertices, queries...) one iteration covers, params describes the workload.
+# Benchmarks whose dependencies are missing raise Skip and are reported as skipped.
+BENCHMARKS = []
+
+
+class Skip(Exception):
+    pass
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS.append((name, function))
+        return function
+    return register
+
+
+def grid_mesh(size):
+    # size x size vertices on a unit grid, two triangles per cell.
+    y, x = np.mgrid[0:size, 0:size]
+    verts = np.stack([x.ravel(), y.ravel()], axis=1).astype(np.float32)
+    index = np.arange(size * size).reshape((size, size))
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    triangles = np.concatenate([np.stack([a, b, c], axis=1), np.stack([b, d, c], axis=1)]).astype(np.int64)
+    return verts, triangles
+
+
+def face_stream(args):
+    # Samples from --recording, or a synthetic head motion at 30 Hz.
+    if args.recording:
+        recording = FaceRecording(args.recording)
+        states = []
+        for state in recording.states():
+            copy = FaceState(len(state.features))
+            state.copy_to(copy)
+            states.append(copy)
+        if states:
+            return states
+    rng = np.random.default_rng(args.seed)
+    states = []
+    for i in range(args.frames):
+        t = i / 30
+        state = FaceState(len(FEATURES))
+        state.seq       = i + 1
+        state.timestamp = t
+        state.euler[:]  = (180 + 10 * np.sin(t), 20 * np.sin(0.7 * t), 90 + 5 * np.sin(1.3 * t))
+        state.eye_blink[:] = 0.5 + 0.5 * np.cos(t * 3) ** 16
+        state.features[:]  = rng.random(len(FEATURES)) * 0.1 + 0.5 + 0.4 * np.sin(t + np.arange(len(FEATURES)))
+        states.append(state)
+    return states
+
+
+class SyntheticParameter:
+    def __init__(self, name, is_vec2):
+        self.name    = name
+        self.is_vec2 = is_vec2
+        self.value   = (0., 0.)
+
+
+class NullParameterView:
+    def setValue(self, value):
+        pass
+
+
+def synthetic_parameters(n, seed):
+    # n parameters with one rule each, reading random sources with random transforms.
+    rng = np.random.default_rng(seed)
+    params = {}
+    rules  = []
+    for i in range(n):
+        name = "Param %d"%i
+        params[name] = (SyntheticParameter(name, i % 2 == 0), NullParameterView())
+        rule = {"param": name}
+        for axis in ("x", "y"):
+            rule[axis] = {"source": SOURCES[int(rng.integers(len(SOURCES) - 1))], "scale": float(rng.uniform(-1, 1)),
+                          "deadzone": 0.01, "curve": float(rng.uniform(0.5, 2)), "min": -1, "max": 1}
+        rules.append(rule)
+    return params, rules
+
+
+@benchmark("tracker.handoff")
+def bench_handoff(args):
+    # Publishing a sample through the triple buffer and reading it back, per face.
+    states = face_stream(args)
+    buffer = FaceStateBuffer(len(FEATURES))
+    out = buffer.new_state()
+    position = [0]
+    def step():
+        state = states[position[0] % len(states)]
+        position[0] += 1
+        buffer.publish_state(state)
+        buffer.read(out)
+    return step, 1, {"features": len(FEATURES)}
+
+
+@benchmark("tracker.predict")
+def bench_predict(args):
+    # OpenSeeFace inference on a synthetic frame; needs OpenSeeFace and its ONNX models.
+    try:
+        sys.path.append("OpenSeeFace")
+        from OpenSeeFace.tracker import Tracker
+    except Exception as e:
+        raise Skip("OpenSeeFace unavailable: %s"%e)
+    width, height = 640, 480
+    rng = np.random.default_rng(args.seed)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    tracker = Tracker(width, height, max_threads=1, max_faces=1, silent=True, model_type=3, no_gaze=True, static_model=True)
+    def step():
+        tracker.predict(frame)
+    return step, 1, {"width": width, "height": height, "model": 3}
+
+
+@benchmark("mapping.update")
+def bench_mapping(args):
+    # One render frame of ParameterMapping: filter update and resample, evaluation, and parameter writes.
+    params, rules = synthetic_parameters(args.params, args.seed)
+    mapping = ParameterMapping(params, rules, 0.5, {"type": args.filter})
+    states = face_stream(args)
+    position = [0]
+    def step():
+        i = position[0]
+        position[0] += 1
+        state = states[i % len(states)]
+        # Successive passes over the stream keep moving forward in time.
+        state.seq = i + 1
+        mapping.update(state, state.timestamp + (i // len(states)) * (len(states) / 30.))
+    return step, 1, {"params": args.params, "filter": args.filter, "stream": len(states)}
+
+
+@benchmark("mapping.filter")
+def bench_filter(args):
+    # Filter update plus resample for every source, per tracker sample.
+    states = face_stream(args)
+    raw = np.zeros((len(SOURCES),), dtype=np.float64)
+    out = np.zeros((len(SOURCES),), dtype=np.float64)
+    smoothing = create_filter(len(SOURCES), {"type": args.filter})
+    position = [0]
+    def step():
+        i = position[0]
+        position[0] += 1
+        state = states[i % len(states)]
+        now = i / 30
+        raw[0:3] = state.euler
+        raw[3:5] = state.eye_blink
+        raw[5:5 + len(state.features)] = state.features
+        smoothing.update(raw, now)
+        smoothing.sample(now + 1 / 60, out)
+    return step, 1, {"filter": args.filter, "sources": len(SOURCES)}
+
+
+@benchmark("mesh.triangles_from_edges")
+def bench_edges_to_triangles(args):
+    verts, triangles = grid_mesh(args.mesh_size)
+    edges = edges_from_triangles(triangles)
+    def step():
+        triangles_from_edges(edges)
+    return step, len(edges), {"vertices": len(verts), "edges": len(edges)}
+
+
+@benchmark("mesh.edges_from_triangles")
+def bench_triangles_to_edges(args):
+    verts, triangles = grid_mesh(args.mesh_size)
+    def step():
+        edges_from_triangles(triangles)
+    return step, len(triangles), {"vertices": len(verts), "triangles": len(triangles)}
+
+
+@benchmark("mesh.toggle_link")
+def bench_toggle_link(args):
+    # Toggling a link off and on again, with the triangles it bounds updated incrementally.
+    verts, triangles = grid_mesh(args.mesh_size)
+    topology = MeshTopology.from_triangles(triangles)
+    links = topology.links()
+    rng = np.random.default_rng(args.seed)
+    picks = links[rng.integers(len(links), size=256)].tolist()
+    position = [0]
+    def step():
+        a, b = picks[position[0] % len(picks)]
+        position[0] += 1
+        topology.toggle_link(a, b)
+        topology.toggle_link(a, b)
+    return step, 2, {"vertices": len(verts), "links": len(links)}
+
+
+@benchmark("mesh.triangle_array")
+def bench_triangle_array(args):
+    # Flattening the triangle set after an edit, as applying or redrawing an edited mesh does.
+    verts, triangles = grid_mesh(args.mesh_size)
+    topology = MeshTopology.from_triangles(triangles)
+    def step():
+        topology._changed()
+        topology.triangle_array()
+    return step, len(topology.triangles), {"vertices": len(verts), "triangles": len(topology.triangles)}
+
+
+@benchmark("mesh.materialize")
+def bench_materialize(args):
+    # Compacting an edited mesh (1% of the vertices removed) into the arrays handed to inochi2d.
+    verts, triangles = grid_mesh(args.mesh_size)
+    mesh = EditableMesh(verts, None, triangles)
+    rng = np.random.default_rng(args.seed)
+    for slot in rng.choice(len(verts), size=max(1, len(verts) // 100), replace=False):
+        mesh.remove_vertex(int(slot))
+    def step():
+        mesh.materialize()
+    return step, len(mesh), {"vertices": len(mesh)}
+
+
+@benchmark("selection.rect")
+def bench_select_rect(args):
+    # Rectangle selection covering about 1% of the mesh.
+    verts, _ = grid_mesh(args.mesh_size)
+    grid = VertexGrid(verts)
+    rng = np.random.default_rng(args.seed)
+    side = args.mesh_size / 10
+    corners = rng.uniform(0, args.mesh_size - side, size=(256, 2))
+    position = [0]
+    def step():
+        corner = corners[position[0] % len(corners)]
+        position[0] += 1
+        grid.query_rect(corner, corner + side)
+    return step, 1, {"vertices": len(verts)}
+
+
+@benchmark("selection.pick")
+def bench_select_pick(args):
+    # Radius pick under the pointer.
+    verts, _ = grid_mesh(args.mesh_size)
+    grid = VertexGrid(verts)
+    rng = np.random.default_rng(args.seed)
+    centers = rng.uniform(0, args.mesh_size, size=(256, 2))
+    position = [0]
+    def step():
+        grid.query_radius(centers[position[0] % len(centers)], 1.5)
+        position[0] += 1
+    return step, 1, {"vertices": len(verts)}
+
+
+@benchmark("selection.drag")
+def bench_select_drag(args):
+    # Moving 1% of the points, as dragging a selection does, and keeping the grid in sync.
+    verts, _ = grid_mesh(args.mesh_size)
+    grid = VertexGrid(verts)
+    rng = np.random.default_rng(args.seed)
+    moved = rng.choice(len(verts), size=max(1, len(verts) // 100), replace=False)
+    position = [0]
+    def step():
+        position[0] += 1
+        grid.update(moved, verts[moved] + 0.01 * position[0])
+    return step, len(moved), {"vertices": len(verts), "moved": len(moved)}
+
+
+@benchmark("overlay.mesh")
+def bench_overlay(args):
+    # Rebuilding the mesh editor's overlay buffers after an edit; needs tool.py's dependencies (inochi2d, Qt).
+    try:
+        from tool import OverlayBuffer
+    except Exception as e:
+        raise Skip("tool.py unavailable: %s"%e)
+    verts, triangles = grid_mesh(args.mesh_size)
+    mesh = EditableMesh(verts, None, triangles)
+    links = mesh.links().ravel()
+    slots, lines, points = OverlayBuffer(), OverlayBuffer(), OverlayBuffer()
+    position = [0]
+    def step():
+        position[0] += 1
+        slots.add_xy(mesh.verts, mesh.deformation, position[0])
+        lines.gather(slots.data, links, position[0])
+        points.set_xy(slots.data[:, 0:2], position[0])
+    return step, len(verts), {"vertices": len(verts), "links": len(links) // 2}
+
+
+@benchmark("render.frame")
+def bench_render(args):
+    # A full headless frame (mapping, puppet update, draw, composite); needs --model, inochi2d and an offscreen
+    # GL context (e.g. Mesa llvmpipe).
+    if not args.model:
+        raise Skip("no --model given")
+    try:
+        from headless import HeadlessRenderer
+        renderer = HeadlessRenderer(args.width, args.height)
+        renderer.load(args.model)
+    except Exception as e:
+        raise Skip("headless renderer unavailable: %s"%e)
+    states = face_stream(args)
+    position = [0]
+    def step():
+        i = position[0]
+        position[0] += 1
+        state = states[i % len(states)]
+        renderer.render(state, i / 30)
+    return step, 1, {"model": os.path.basename(args.model), "width": args.width, "height": args.height}
+
+
+def measure(step, min_time, min_iterations, warmup):
+    for _ in range(warmup):
+        step()
+    times = []
+    start = time.perf_counter()
+    while len(times) < min_iterations or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        step()
+        times.append(time.perf_counter() - t0)
+    return np.array(times)
+
+
+def run_benchmarks(args):
+    results = {}
+    for name, function in BENCHMARKS:
+        if args.only and not any(pattern in name for pattern in args.only):
+            continue
+        try:
+            step, items, params = function(args)
+        except Skip as e:
+            results[name] = {"skipped": str(e)}
+            print("%-28s skipped: %s"%(name, e))
+            continue
+        times = measure(step, args.min_time, args.min_iterations, args.warmup)
+        p50, p95, p99 = np.percentile(times, (50, 95, 99))
+        mean = float(np.mean(times))
+        results[name] = {
+            "iterations": len(times),
+            "mean_ms": mean * 1000,
+            "p50_ms":  float(p50) * 1000,
+            "p95_ms":  float(p95) * 1000,
+            "p99_ms":  float(p99) * 1000,
+            "items_per_sec": items / mean if mean > 0 else 0.,
+            "params": params,
+        }
+        print("%-28s p50 %9.4f ms  p99 %9.4f ms  %12.0f items/s"%(name, p50 * 1000, p99 * 1000, results[name]["items_per_sec"]))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Prints p50 against the baseline; returns the names that got slower by more than tolerance.
+    regressions = []
+    print("\n%-28s %12s %12s %9s"%("benchmark", "p50 (ms)", "baseline", "change"))
+    for name, result in results.items():
+        base = baseline.get(name)
+        if "p50_ms" not in result or not base or "p50_ms" not in base:
+            continue
+        if result["params"] != base.get("params"):
+            print("%-28s %12.4f %12s %9s"%(name, result["p50_ms"], "-", "params differ"))
+            continue
+        change = result["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] > 0 else 0.
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-28s %12.4f %12.4f %+8.1f%%%s"%(name, result["p50_ms"], base["p50_ms"], change * 100, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tracking hand-off, mapping, mesh editing, selection, overlay and render paths.")
+    parser.add_argument("--only", nargs="*", help="Run only benchmarks whose name contains one of these")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    parser.add_argument("--mesh-size", type=int, default=100, help="Synthetic meshes are MESH_SIZE x MESH_SIZE vertices")
+    parser.add_argument("--params", type=int, default=64, help="Number of synthetic parameters to map")
+    parser.add_argument("--frames", type=int, default=900, help="Length of the synthetic face stream")
+    parser.add_argument("--recording", help="Face recording to use instead of the synthetic face stream")
+    parser.add_argument("--filter", choices=FILTER_TYPES, default="one_euro", help="Smoothing filter for the mapping benchmarks")
+    parser.add_argument("--model", help="Inochi2D model for render.frame")
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum seconds per benchmark")
+    parser.add_argument("--min-iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against results previously written with --output")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed p50 slowdown against the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, _ in BENCHMARKS:
+            print(name)
+        return 0
+
+    results = run_benchmarks(args)
+    report = {
+        "meta": {
+            "time":     time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python":   platform.python_version(),
+            "numpy":    np.__version__,
+            "platform": platform.platform(),
+            "machine":  platform.machine(),
+            "args":     vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n%d regression(s): %s"%(len(regressions), ", ".join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
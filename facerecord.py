@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import struct
+import numpy as np
+
+from facestate import FEATURES, FaceState, FaceStateBuffer
+
+
+# File layout: MAGIC, u32 little endian header length, JSON header ({"version", "features"}), space padding up to
+# a multiple of HEADER_ALIGN, then fixed-size records of record_dtype(len(features)) until the end of the file.
+MAGIC = b"CPFACE01"
+HEADER_ALIGN = 64
+VERSION = 1
+
+
+def record_dtype(n_features):
+    # Times are perf_counter seconds of the recording process; everything else is what FaceState carries plus the
+    # quaternion and confidence OpenSeeFace reports.
+    return np.dtype([
+        ("capture_time",   "<f8"),
+        ("inference_time", "<f8"),
+        ("face",           "<i4"),
+        ("confidence",     "<f4"),
+        ("euler",          "<f4", (3,)),
+        ("quaternion",     "<f4", (4,)),
+        ("eye_blink",      "<f4", (2,)),
+        ("features",       "<f4", (n_features,)),
+    ])
+
+
+class FaceRecorder:
+    # Appends one record per tracked face to a recording. Records are buffered by the file object and only
+    # complete records are ever read back, so a recording cut short by a crash is still usable.
+    def __init__(self, path, features=FEATURES):
+        self.features = list(features)
+        self.record   = np.zeros((1,), dtype=record_dtype(len(self.features)))
+        header = json.dumps({"version": VERSION, "features": self.features}).encode("utf-8")
+        size = len(MAGIC) + 4 + len(header)
+        padding = -size % HEADER_ALIGN
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + struct.pack("<I", len(header) + padding) + header + b" " * padding)
+        self.count = 0
+
+    def write(self, f, face_id, capture_time, inference_time):
+        # f is an OpenSeeFace face.
+        record = self.record[0]
+        record["capture_time"]   = capture_time
+        record["inference_time"] = inference_time
+        record["face"]           = face_id
+        record["confidence"]     = f.conf if f.conf is not None else 0
+        record["euler"]          = f.euler
+        record["quaternion"]     = f.quaternion if f.quaternion is not None else (0, 0, 0, 1)
+        record["eye_blink"]      = f.eye_blink if f.eye_blink is not None else (1, 1)
+        current = f.current_features
+        for i, feature in enumerate(self.features):
+            record["features"][i] = current.get(feature, 0) if current else 0
+        self.file.write(self.record.tobytes())
+        self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class FaceRecording:
+    # Read-only, memory-mapped view of a recording; records is a structured array of record_dtype().
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError("%s: not a face recording"%path)
+            header_length, = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        if header.get("version") != VERSION:
+            raise ValueError("%s: unsupported recording version %s"%(path, header.get("version")))
+        self.features = header["features"]
+        dtype  = record_dtype(len(self.features))
+        offset = len(MAGIC) + 4 + header_length
+        count  = (os.path.getsize(path) - offset) // dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+        else:
+            self.records = np.zeros((0,), dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        if len(self.records) == 0:
+            return 0.
+        return float(self.records["capture_time"][-1] - self.records["capture_time"][0])
+
+    def faces(self, face=0):
+        # Indices of the records of one face, in recording order.
+        return np.flatnonzero(self.records["face"] == face)
+
+    def load(self, index, out):
+        # Copies record index into the FaceState out; seq is left to the caller.
+        record = self.records[index]
+        out.timestamp      = float(record["capture_time"])
+        out.inference_time = float(record["inference_time"])
+        out.euler[:]       = record["euler"]
+        out.eye_blink[:]   = record["eye_blink"]
+        n = min(len(out.features), len(self.features))
+        out.features[:n]   = record["features"][:n]
+        return out
+
+    def states(self, face=0):
+        # Yields the samples of one face as a single reused FaceState, with seq counting from 1 and the recorded
+        # timestamps; for deterministic, as-fast-as-possible consumers such as benchmarks.
+        state = FaceState(len(self.features))
+        for seq, index in enumerate(self.faces(face), 1):
+            self.load(index, state)
+            state.seq = seq
+            yield state
+
+
+class ReplayTracker:
+    # Stand-in for FaceTracker that publishes a recording into face_buffers instead of running inference, so the
+    # player and renderer can be driven without a camera, OpenSeeFace or ONNX. Timestamps are moved onto this
+    # process's perf_counter clock. With realtime, samples are published at their recorded spacing; otherwise
+    # as fast as possible. run(), terminate and the counters the GUI reads behave like FaceTracker's.
+    def __init__(self, path, realtime=True, loop=False, faces=1):
+        self.recording = FaceRecording(path)
+        self.realtime  = realtime
+        self.loop      = loop
+        self.faces     = faces
+        self.features  = self.recording.features
+        self.face_buffers = [FaceStateBuffer(len(self.features)) for _ in range(faces)]
+        self.on_frame  = None
+        self.terminate = False
+        self.last_fps_counter = 0
+        self.last_jitter = 0
+        self.last_max_jitter = 0
+        self.last_frame_age = 0
+        self.last_tracking_time = 0
+        self.dropped_frames = 0
+        self.stale_frames = 0
+
+    def run(self):
+        records = self.recording.records
+        if len(records) == 0:
+            return
+        state = FaceState(len(self.features))
+        first = float(records["capture_time"][0])
+        frame_count = 0
+        perf_time = time.perf_counter()
+        while not self.terminate:
+            start = time.perf_counter()
+            for index in range(len(records)):
+                if self.terminate:
+                    break
+                face = int(records["face"][index])
+                if face >= len(self.face_buffers):
+                    continue
+                self.recording.load(index, state)
+                if self.realtime:
+                    # Publish when inference originally finished, keeping the recorded capture-to-inference delay.
+                    capture_time   = start + state.timestamp - first
+                    inference_time = start + state.inference_time - first
+                    delay = inference_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    self.last_jitter += (abs(time.perf_counter() - inference_time) - self.last_jitter) * 0.1
+                else:
+                    # Yield the GIL per record so that the GUI thread keeps rendering.
+                    time.sleep(0)
+                    inference_time = time.perf_counter()
+                    capture_time   = inference_time - (state.inference_time - state.timestamp)
+                self.last_frame_age  = time.perf_counter() - capture_time
+                state.timestamp      = capture_time
+                state.inference_time = inference_time
+                self.face_buffers[face].publish_state(state)
+                if self.on_frame is not None:
+                    self.on_frame(capture_time)
+                frame_count += 1
+                time_diff = time.perf_counter() - perf_time
+                if time_diff >= 1:
+                    self.last_fps_counter = frame_count / time_diff
+                    frame_count = 0
+                    perf_time = time.perf_counter()
+            if not self.loop:
+                break
+        print("Replay finished")
@@ -0,0 +1,162 @@
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+
+FEATURES = ["eye_l", "eye_r", "eyebrow_steepness_l", "eyebrow_updown_l", "eyebrow_quirk_l",
+            "eyebrow_steepness_r", "eyebrow_updown_r", "eyebrow_quirk_r", "mouth_corner_updown_l", "mouth_corner_inout_l", "mouth_corner_updown_r",
+            "mouth_corner_inout_r", "mouth_open", "mouth_wide"]
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURES)}
+
+
+class FaceState:
+    def __init__(self, n_features=len(FEATURES)):
+        self.seq       = 0
+        # Capture time of the camera frame and the time inference finished on it, both on the perf_counter clock.
+        self.timestamp = 0.
+        self.inference_time = 0.
+        self.euler     = np.zeros((3,), dtype=np.float32)
+        self.eye_blink = np.ones((2,), dtype=np.float32)
+        self.features  = np.zeros((n_features,), dtype=np.float32)
+
+    def feature(self, name):
+        return self.features[FEATURE_INDEX[name]]
+
+    def set_from_face(self, f, features, timestamp, seq, inference_time=0.):
+        # Copy an OpenSeeFace face into the preallocated arrays without keeping a reference to it.
+        self.euler[:] = f.euler
+        if f.eye_blink is None:
+            self.eye_blink[:] = 1
+        else:
+            self.eye_blink[:] = f.eye_blink
+        current = f.current_features
+        for i, feature in enumerate(features):
+            self.features[i] = current.get(feature, 0) if current else 0
+        self.timestamp = timestamp
+        self.inference_time = inference_time
+        self.seq       = seq
+
+    def copy_to(self, other):
+        np.copyto(other.euler, self.euler)
+        np.copyto(other.eye_blink, self.eye_blink)
+        np.copyto(other.features, self.features)
+        other.timestamp = self.timestamp
+        other.inference_time = self.inference_time
+        other.seq       = self.seq
+
+
+class FaceStateBuffer:
+    # Triple buffer published through a sequence counter.
+    # The writer fills slot (seq + 1) % 3 and then publishes seq + 1 with a single attribute store,
+    # so the slot a reader copies from cannot be rewritten until two more samples are published.
+    # The reader validates that after copying and retries otherwise, so neither side ever takes a lock.
+    SLOTS = 3
+
+    def __init__(self, n_features=len(FEATURES)):
+        self.n_features = n_features
+        self.slots      = [FaceState(n_features) for _ in range(self.SLOTS)]
+        self.seq        = 0
+
+    def new_state(self):
+        return FaceState(self.n_features)
+
+    def publish(self, f, features, timestamp, inference_time=None):
+        # inference_time defaults to now, i.e. the sample is published right after inference.
+        if inference_time is None:
+            inference_time = time.perf_counter()
+        seq = self.seq + 1
+        self.slots[seq % self.SLOTS].set_from_face(f, features, timestamp, seq, inference_time)
+        self.seq = seq
+        return seq
+
+    def publish_state(self, state):
+        seq = self.seq + 1
+        slot = self.slots[seq % self.SLOTS]
+        state.copy_to(slot)
+        slot.seq = seq
+        self.seq = seq
+        return seq
+
+    def read(self, out):
+        # Returns the sequence number copied into out, or 0 if nothing was published yet.
+        while True:
+            seq = self.seq
+            if seq == 0:
+                return 0
+            if out.seq == seq:
+                return seq
+            slot = self.slots[seq % self.SLOTS]
+            slot.copy_to(out)
+            if out.seq == seq and self.seq - seq < self.SLOTS - 1:
+                return seq
+
+
+class SharedFaceState(FaceState):
+    # FaceState whose fields are views into a shared memory block:
+    # float64 [seq, timestamp, inference_time] followed by float32 [euler(3), eye_blink(2), features(n)].
+    def __init__(self, buf, offset, n_features):
+        self.header    = np.ndarray((3,), dtype=np.float64, buffer=buf, offset=offset)
+        values         = np.ndarray((5 + n_features,), dtype=np.float32, buffer=buf, offset=offset + 24)
+        self.euler     = values[0:3]
+        self.eye_blink = values[3:5]
+        self.features  = values[5:]
+
+    @staticmethod
+    def record_size(n_features):
+        size = 24 + 4 * (5 + n_features)
+        return (size + 7) // 8 * 8
+
+    @property
+    def seq(self):
+        return int(self.header[0])
+
+    @seq.setter
+    def seq(self, value):
+        self.header[0] = value
+
+    @property
+    def timestamp(self):
+        return float(self.header[1])
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self.header[1] = value
+
+    @property
+    def inference_time(self):
+        return float(self.header[2])
+
+    @inference_time.setter
+    def inference_time(self, value):
+        self.header[2] = value
+
+
+class SharedFaceStateBuffer(FaceStateBuffer):
+    # FaceStateBuffer living in multiprocessing.shared_memory, so another process can publish into it.
+    # Pass name to attach to a buffer created elsewhere.
+    def __init__(self, n_features=len(FEATURES), name=None):
+        record = SharedFaceState.record_size(n_features)
+        create = name is None
+        self.shm        = shared_memory.SharedMemory(name=name, create=create, size=8 + record * self.SLOTS)
+        self.name       = self.shm.name
+        self.n_features = n_features
+        self.header     = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.slots      = [SharedFaceState(self.shm.buf, 8 + i * record, n_features) for i in range(self.SLOTS)]
+        if create:
+            self.shm.buf[:] = bytes(len(self.shm.buf))
+
+    @property
+    def seq(self):
+        return int(self.header[0])
+
+    @seq.setter
+    def seq(self, value):
+        self.header[0] = value
+
+    def close(self):
+        self.header = None
+        self.slots  = []
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
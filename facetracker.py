@@ -7,13 +7,69 @@ import socket
 import struct
 import json
 import sys
-import copy
+import traceback
+import gc
+import threading
+import collections
 
 
 sys.path.append("OpenSeeFace")
 
 from OpenSeeFace.input_reader import InputReader, VideoReader, DShowCaptureReader, try_int
 from OpenSeeFace.tracker import Tracker, get_model_base_path
+from facestate import FEATURES, FaceStateBuffer
+from timing import TIMINGS
+from tracing import TRACER
+from facerecord import FaceRecorder
+from pacing import FrameScheduler
+
+class FrameRing:
+    # Bounded queue between the capture thread and inference.
+    # Live sources drop the oldest frame when full and inference always takes the freshest one;
+    # otherwise the producer blocks so that every frame is processed in order.
+    def __init__(self, capacity=2, drop_frames=True):
+        self.frames      = collections.deque(maxlen=capacity if drop_frames else None)
+        self.capacity    = capacity
+        self.drop_frames = drop_frames
+        self.cond        = threading.Condition()
+        self.dropped     = 0
+        self.closed      = False
+
+    def push(self, frame, capture_time, cancelled=None):
+        with self.cond:
+            if self.drop_frames:
+                if len(self.frames) == self.capacity:
+                    self.dropped += 1
+            else:
+                while len(self.frames) >= self.capacity and not (cancelled and cancelled()):
+                    self.cond.wait(0.1)
+            self.frames.append((frame, capture_time))
+            self.cond.notify_all()
+
+    def pop(self, timeout=None):
+        with self.cond:
+            if not self.frames and not self.closed:
+                self.cond.wait(timeout)
+            if not self.frames:
+                return None
+            if self.drop_frames:
+                item = self.frames.pop()
+                self.dropped += len(self.frames)
+                self.frames.clear()
+            else:
+                item = self.frames.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def finished(self):
+        with self.cond:
+            return self.closed and not self.frames
+
 
 class FaceTracker:
     def __init__(self):
@@ -37,65 +93,52 @@ class FaceTracker:
         self.no_3d_adapt = 1
         self.try_hard = 0
         self.model_dir = None
+        self.pacing = FrameScheduler.PACING_DEADLINE
+        # GC thresholds, freezing and idle-time collections are process-wide, so they are only applied when
+        # the tracker owns its process (ProcessFaceTracker's child); in-process, the GC policy is the app's.
+        self.own_gc = False
+        self.gc_threshold = (5000, 50, 100)
+        self.gc_freeze = True
+        self.frame_queue_size = 2
+        # Every tracked face is appended to this face recording (see facerecord) when set.
+        self.record_path = None
+        # Called from the inference thread after each processed frame, with its capture time.
+        self.on_frame = None
 
-        self.latest_faces = [None] * self.faces
-        self.features = ["eye_l", "eye_r", "eyebrow_steepness_l", "eyebrow_updown_l", "eyebrow_quirk_l", 
-                         "eyebrow_steepness_r", "eyebrow_updown_r", "eyebrow_quirk_r", "mouth_corner_updown_l", "mouth_corner_inout_l", "mouth_corner_updown_r", 
-                         "mouth_corner_inout_r", "mouth_open", "mouth_wide"]
+        self.features = FEATURES
+        self.face_buffers = [FaceStateBuffer(len(self.features)) for _ in range(self.faces)]
         
         self.terminate = False
         self.last_fps_counter = 0
+        self.last_jitter = 0
+        self.last_max_jitter = 0
+        self.last_frame_age = 0
+        self.last_tracking_time = 0
+        self.dropped_frames = 0
+        self.stale_frames = 0
 
-    def run(self):
-        model_base_path = get_model_base_path(self.model_dir)
-        im = cv2.imread(os.path.join(model_base_path, "benchmark.bin"), cv2.IMREAD_COLOR)
-        results = []
-
-        fps = self.fps
+    def _open_input(self, fps):
         dcap = None
         use_dshowcapture_flag = False
         if os.name == 'nt':
             dcap = self.dcap
             use_dshowcapture_flag = True if self.use_dshowcapture else False
-            input_reader = InputReader(self.capture, self.raw_rgb, self.width, self.height, fps, use_dshowcapture=use_dshowcapture_flag, dcap=dcap)
-            if self.dcap == -1 and type(input_reader) == DShowCaptureReader:
-                fps = min(fps, input_reader.device.get_fps())
-        else:
-            print("open input")
-            input_reader = InputReader(self.capture, self.raw_rgb, self.width, self.height, fps)
-            print("open input done")
-        if type(input_reader.reader) == VideoReader:
-            fps = 0
+        print("open input")
+        input_reader = InputReader(self.capture, self.raw_rgb, self.width, self.height, fps, use_dshowcapture=use_dshowcapture_flag, dcap=dcap)
+        print("open input done")
+        return input_reader
 
-        first = True
-        height = 0
-        width = 0
-        tracker = None
-        sock = None
-        total_tracking_time = 0.0
-        tracking_time = 0.0
-        tracking_frames = 0
-        frame_count = 0
-
-        features = self.features
+    def _capture_loop(self, input_reader, ring, fps, stop):
         is_camera = self.capture == str(try_int(self.capture))
-        perf_time = time.perf_counter()
-
+        source_name = input_reader.name
+        attempt = 0
+        repeat = False
+        need_reinit = 0
         try:
-            attempt = 0
-            frame_time = time.perf_counter()
-            target_duration = 0
-            if fps > 0:
-                target_duration = 1. / float(fps)
-            repeat = False
-            need_reinit = 0
-            failures = 0
-            source_name = input_reader.name
-            while not self.terminate and (repeat or input_reader.is_open()):
+            while not self.terminate and not stop.is_set() and (repeat or input_reader.is_open()):
 
                 if not input_reader.is_open() or need_reinit == 1:
-                    print("open input")
-                    input_reader = InputReader(self.capture, self.raw_rgb, self.width, self.height, fps, use_dshowcapture=use_dshowcapture_flag, dcap=dcap)
+                    input_reader = self._open_input(fps)
                     if input_reader.name != source_name:
                         print(f"Failed to reinitialize camera and got {input_reader.name} instead of {source_name}.")
                     need_reinit = 1
@@ -106,7 +149,9 @@ class FaceTracker:
                     time.sleep(0.02)
                     continue
 
-                ret, frame = input_reader.read()
+                with TIMINGS.span("capture"), TRACER.span("capture", "tracker"):
+                    ret, frame = input_reader.read()
+                capture_time = time.perf_counter()
                 if not ret:
                     if repeat:
                         if need_reinit == 0:
@@ -115,7 +160,6 @@ class FaceTracker:
                     elif is_camera:
                         attempt += 1
                         if attempt > 30:
-                            pass
                             break
                         else:
                             time.sleep(0.02)
@@ -123,12 +167,80 @@ class FaceTracker:
                                 need_reinit = 1
                             continue
                     else:
-                        break;
+                        break
 
                 attempt = 0
                 need_reinit = 0
+                ring.push(frame, capture_time, lambda: self.terminate or stop.is_set())
+                del frame
+                repeat = True
+        except Exception:
+            traceback.print_exc()
+        finally:
+            input_reader.close()
+            ring.close()
+
+    def _open_source(self):
+        fps = self.fps
+        input_reader = self._open_input(fps)
+        if os.name == 'nt' and self.dcap == -1 and type(input_reader) == DShowCaptureReader:
+            fps = min(fps, input_reader.device.get_fps())
+        # Video files are processed frame by frame, so only live sources may drop frames.
+        drop_frames = True
+        if type(input_reader.reader) == VideoReader:
+            fps = 0
+            drop_frames = False
+        return input_reader, fps, drop_frames
+
+    def run(self):
+        input_reader, fps, drop_frames = self._open_source()
+
+        ring = FrameRing(self.frame_queue_size, drop_frames)
+        stop_capture = threading.Event()
+        capture_thread = threading.Thread(target=self._capture_loop, args=(input_reader, ring, fps, stop_capture), daemon=True, name="capture")
+        capture_thread.start()
+
+        self._inference_loop(ring, fps)
+
+        # Stop the capture stage too when inference gives up on its own.
+        stop_capture.set()
+        capture_thread.join()
+        print("Terminated")
+
+    def _inference_loop(self, ring, fps):
+        first = True
+        height = 0
+        width = 0
+        tracker = None
+        sock = None
+        total_tracking_time = 0.0
+        tracking_time = 0.0
+        tracking_frames = 0
+        frame_count = 0
+        self.dropped_frames = 0
+        self.stale_frames = 0
+
+        features = self.features
+        perf_time = time.perf_counter()
+        gc_threshold = gc.get_threshold()
+        recorder = FaceRecorder(self.record_path, features) if self.record_path else None
+
+        try:
+            scheduler = FrameScheduler(fps, self.pacing, FrameScheduler.GC_SLACK if self.own_gc else None)
+            failures = 0
+            while not self.terminate:
+                item = ring.pop(0.1)
+                if item is None:
+                    if ring.finished():
+                        break
+                    continue
+                frame, capture_time = item
+                self.last_frame_age = time.perf_counter() - capture_time
+                if scheduler.target_duration > 0 and self.last_frame_age > scheduler.target_duration:
+                    self.stale_frames += 1
+                self.dropped_frames = ring.dropped
+
                 frame_count += 1
-                now = time.time()
 
                 if first:
                     first = False
@@ -138,31 +250,37 @@ class FaceTracker:
                                       no_gaze=False if self.gaze_tracking and self.model != -1 else True, detection_threshold=self.detection_threshold, 
                                       use_retinaface=self.scan_retinaface, max_feature_updates=self.max_feature_updates, static_model=True if self.no_3d_adapt else False, 
                                       try_hard=self.try_hard == 1)
+                    if self.own_gc:
+                        # Models are loaded now; move everything alive into the permanent generation.
+                        gc.collect()
+                        if self.gc_threshold:
+                            gc.set_threshold(*self.gc_threshold)
+                        if self.gc_freeze:
+                            gc.freeze()
 
                 try:
                     inference_start = time.perf_counter()
-                    faces = tracker.predict(frame)
+                    with TRACER.span("predict", "tracker"):
+                        faces = tracker.predict(frame)
+                    inference_time = time.perf_counter() - inference_start
+                    TIMINGS.record("predict", inference_time)
                     if len(faces) > 0:
-                        inference_time = (time.perf_counter() - inference_start)
                         total_tracking_time += inference_time
                         tracking_time += inference_time / len(faces)
                         tracking_frames += 1
                     detected = False
+                    published = time.perf_counter()
                     for face_num, f in enumerate(faces):
-                        f = copy.copy(f)
-                        if f.eye_blink is None:
-                            f.eye_blink = [1, 1]
-                        self.latest_faces[face_num] = f
-
-                        if f.current_features is None:
-                            f.current_features = {}
-                        for feature in features:
-                            if not feature in f.current_features:
-                                f.current_features[feature] = 0
+                        if face_num < len(self.face_buffers):
+                            self.face_buffers[face_num].publish(f, features, capture_time, published)
+                        if recorder is not None:
+                            recorder.write(f, face_num, capture_time, published)
 
                     if detected and len(faces) < 40:
                         sock.sendto(packet, (target_ip, target_port))
-                        
+
+                    if self.on_frame is not None:
+                        self.on_frame(capture_time)
                     failures = 0
                 except Exception as e:
                     if e.__class__ == KeyboardInterrupt:
@@ -174,33 +292,34 @@ class FaceTracker:
                     if failures > 30:
                         break
 
-                collected = False
                 del frame
-                
-                duration = time.perf_counter() - frame_time
-                while duration < target_duration:
-                    if not collected:
-                        gc.collect()
-                        collected = True
-                    duration = time.perf_counter() - frame_time
-                    sleep_time = target_duration - duration
-                    if sleep_time > 0:
-                        time.sleep(sleep_time)
-                    duration = time.perf_counter() - frame_time
-                frame_time = time.perf_counter()
-                
+                del item
+
+                scheduler.sync(capture_time)
+                with TRACER.span("wait", "tracker"):
+                    scheduler.wait()
+
                 time_diff = time.perf_counter() - perf_time
                 if time_diff >= 1:
                     self.last_fps_counter = frame_count / time_diff
+                    self.last_jitter = scheduler.jitter
+                    self.last_max_jitter = scheduler.max_jitter
+                    self.last_tracking_time = tracking_time / tracking_frames if tracking_frames > 0 else 0
+                    tracking_time = 0.0
+                    tracking_frames = 0
+                    scheduler.reset_stats()
                     frame_count = 0
                     perf_time = time.perf_counter()
                     if self.silent == 0:
-                        print("%5.2f fps"%self.last_fps_counter)
-
-                repeat = True
+                        print("%5.2f fps (jitter %5.2f ms, dropped %d, stale %d)"%(self.last_fps_counter, self.last_jitter * 1000, self.dropped_frames, self.stale_frames))
         except KeyboardInterrupt:
             if not self.silent:
                 print("Quitting")
 
-        input_reader.close()
-        print("Terminated")
\ No newline at end of file
+        if recorder is not None:
+            recorder.close()
+            print("Recorded %d faces to %s"%(recorder.count, self.record_path))
+        if self.own_gc:
+            if self.gc_freeze:
+                gc.unfreeze()
+            gc.set_threshold(*gc_threshold)
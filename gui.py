@@ -1,4 +1,5 @@
 import sys
+import os
 sys.path.append("inochi2d-py")
 
 from PySide2 import QtWidgets, QtOpenGL, QtGui, QtCore
@@ -13,31 +14,167 @@ import cv2
 import qtawesome as qta
 
 from tool import *
+from mapping import ParameterMapping, profile_path, load_profile
+from output import FrameOutput, create_sink
+from thumbnails import ThumbnailCache
+from textures import TextureStore
+from timing import TIMINGS
+from tracing import TRACER
+from latency import LatencyRecorder
 
 #from qt_material import apply_stylesheet
 
 WINDOW_WIDTH = 1300
 WINDOW_HEIGHT = 1200
 
+class RenderScheduler(QtCore.QObject):
+    # Repaints the view only when something can have changed on screen: a new tracker sample, an edit
+    # (parameter, tool, camera, node selection), or physics / smoothing still settling after one.
+    # Polls at max_fps while there is work to do and drops to idle_fps otherwise.
+    def __init__(self, view, max_fps=60, idle_fps=4, settle_time=1.5):
+        super(RenderScheduler, self).__init__(view)
+        self.view        = view
+        self.max_fps     = max_fps
+        self.idle_fps    = idle_fps
+        self.settle_time = settle_time
+        self.dirty       = True
+        self.settle_until = 0
+        self.skipped     = 0
+        self.idle        = False
+        self.timer       = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self._set_idle(False)
+        self.timer.start()
+
+    def set_max_fps(self, max_fps):
+        self.max_fps = max_fps
+        self._set_idle(self.idle, True)
+
+    def _set_idle(self, idle, force=False):
+        if idle != self.idle or force:
+            self.idle = idle
+            self.timer.setInterval(int(1000 / (self.idle_fps if idle else self.max_fps)))
+
+    def request(self, settle=True):
+        self.dirty = True
+        if settle:
+            self.settle_until = time.perf_counter() + self.settle_time
+        if self.idle:
+            self._set_idle(False)
+            self.tick()
+
+    def tick(self):
+        view = self.view
+        tracking = view.tracker is not None and not view.tracker.terminate
+        if self.dirty or view.has_new_sample() or view.output is not None or time.perf_counter() < self.settle_until:
+            self.dirty = False
+            view.update()
+        else:
+            self.skipped += 1
+        self._set_idle(not tracking and not self.dirty and time.perf_counter() >= self.settle_until and view.output is None)
+
+
+class LoadPipeline(QtCore.QObject):
+    # Runs a model load as a list of (name, generator) stages on the GUI thread without freezing it.
+    # Each generator yields (done, total) after every small piece of work, or None while it waits on a worker
+    # thread; stages are stepped for at most BUDGET seconds per event loop turn so that rendering and input
+    # go on between slices. Wall time spent in each stage is kept in timings as (name, seconds, slices).
+    BUDGET = 0.008
+
+    def __init__(self, stages, on_progress=None, on_finished=None, parent=None):
+        super(LoadPipeline, self).__init__(parent)
+        self.stages      = list(stages)
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.index       = 0
+        self.elapsed     = 0
+        self.slices      = 0
+        self.progress    = (0, 1)
+        self.timings     = []
+        self.cancelled   = False
+        self.timer       = QtCore.QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.step)
+
+    def start(self):
+        self.timer.start()
+
+    def cancel(self):
+        self.cancelled = True
+        self.timer.stop()
+        for _, stage in self.stages[self.index:]:
+            stage.close()
+
+    def step(self):
+        start = time.perf_counter()
+        deadline = start + self.BUDGET
+        while self.index < len(self.stages) and time.perf_counter() < deadline:
+            name, stage = self.stages[self.index]
+            try:
+                with TRACER.span("load_model: " + name, "load"):
+                    progress = next(stage)
+            except StopIteration:
+                now = time.perf_counter()
+                self.timings.append((name, self.elapsed + now - start, self.slices + 1))
+                self.elapsed = 0
+                self.slices  = 0
+                self.progress = (0, 1)
+                self.index  += 1
+                start = now
+                continue
+            except Exception:
+                self.cancel()
+                raise
+            if progress is None:
+                break
+            self.progress = progress
+        if self.index < len(self.stages):
+            self.elapsed += time.perf_counter() - start
+            self.slices  += 1
+            if self.on_progress:
+                self.on_progress(self.stages[self.index][0], self.index, len(self.stages), *self.progress)
+        else:
+            self.timer.stop()
+            if self.on_finished:
+                self.on_finished(self)
+
 class Inochi2DView(QtOpenGL.QGLWidget):
     def __init__(self, parent=None):
         format = QtOpenGL.QGLFormat()
         format.setVersion(3, 2)
         format.setSampleBuffers(True)
+        format.setSwapInterval(1)
         super(Inochi2DView, self).__init__(format, parent)
+        # Buffers are swapped by hand at the end of paintGL so the swap can be timed.
+        self.setAutoBufferSwap(False)
         self.tracker = None
+        self.scheduler = RenderScheduler(self)
 
         self.puppet = None
         self.params = []
+        self.mapping = None
+        self.profile_path = None
+        self.profile_mtime = None
         self.perf_time = None
         self.perf_counter = 0
         self.draw_counter = 0
         self.drag = False
         self.on_update_tracking = None
+        self.face     = None
+        self.face_seq = 0
+        self.output   = None
+        self.loader   = None
+        self.textures = None
+        self.latency  = LatencyRecorder()
+        self.mapping_time = None
+        self.draw_time    = None
 
         self.initialized = False
         self.tool = None
         self.active_node = None
+        # Bumped whenever the camera or viewport changes, so tools know when their cached screen matrix is stale.
+        self.camera_version = 0
 
     def initializeGL(self):
         inochi2d.init()
@@ -49,6 +186,20 @@ class Inochi2DView(QtOpenGL.QGLWidget):
 
     def resizeGL(self, w, h):
         inochi2d.Viewport.set(self.width(), self.height())
+        self.camera_version += 1
+        self.scheduler.request(False)
+
+    def has_new_sample(self):
+        if self.tracker is None or self.tracker.terminate or len(self.tracker.face_buffers) == 0:
+            return False
+        return self.tracker.face_buffers[0].seq != self.face_seq
+
+    def event(self, event):
+        # Any input on the view may edit the puppet or move the camera.
+        if event.type() in (QtCore.QEvent.MouseButtonPress, QtCore.QEvent.MouseMove, QtCore.QEvent.MouseButtonRelease,
+                            QtCore.QEvent.MouseButtonDblClick, QtCore.QEvent.Wheel, QtCore.QEvent.KeyPress):
+            self.scheduler.request()
+        return super(Inochi2DView, self).event(event)
 
     def mousePressEvent(self, event):
         if event.button() is QtCore.Qt.MouseButton.MidButton:
@@ -57,7 +208,8 @@ class Inochi2DView(QtOpenGL.QGLWidget):
             self.drag_camera_pos = self.camera.position
             self.matrix = self.camera.screen_to_global
         elif self.tool:
-            self.tool.mousePressEvent(event)
+            with TRACER.span(type(self.tool).__name__ + ".mousePressEvent", "tool"):
+                self.tool.mousePressEvent(event)
 
     def mouseMoveEvent(self, event):
         if self.drag:
@@ -67,30 +219,42 @@ class Inochi2DView(QtOpenGL.QGLWidget):
             ascalev = 1 / self.scale if self.scale > 0 else 1
             pos = event.pos() - self.drag_start
             self.camera.position = (self.drag_camera_pos[0] + pos.x() * ascalev, self.drag_camera_pos[1] + pos.y() * ascalev)
-            self.update()
+            self.camera_version += 1
         elif self.tool:
-            self.tool.mouseMoveEvent(event)
+            with TRACER.span(type(self.tool).__name__ + ".mouseMoveEvent", "tool"):
+                self.tool.mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
         if event.button() is QtCore.Qt.MouseButton.MidButton:
             self.drag = False
         elif self.tool:
+            with TRACER.span(type(self.tool).__name__ + ".mouseReleaseEvent", "tool"):
                 self.tool.mouseReleaseEvent(event)
 
     def mouseDoubleClickEvent(self, event):
         if self.tool:
-            self.tool.mouseDoubleClickEvent(event)
+            with TRACER.span(type(self.tool).__name__ + ".mouseDoubleClickEvent", "tool"):
+                self.tool.mouseDoubleClickEvent(event)
 
     def wheelEvent(self, event):
         delta = 1 + (event.angleDelta().y() / 180.0) * .3
         self.scale *= delta
         self.camera.zoom = self.scale
+        self.camera_version += 1
 
     def paintGL(self):
+        with TRACER.span("paintGL", "render"):
+            self._paint()
+            self.swapBuffers()
+        if self.mapping_time is not None:
+            self.latency.record(self.face, self.mapping_time, self.draw_time, time.perf_counter())
+
+    def _paint(self):
         if self.perf_time is None:
             self.perf_time = time.time()
         self.perf_counter += 1
         draw_start = time.perf_counter()
+        self.mapping_time = None
         try:
             # It seems inochi2d leaves some GL error, and OpenGL.GL see it as an error for successive command.
             GL.glClearColor(1.0, 1.0, 1.0, 1.0)
@@ -99,166 +263,278 @@ class Inochi2DView(QtOpenGL.QGLWidget):
         GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
 
         self.timer += 1
-        if self.tracker is not None and not self.tracker.terminate and len(self.tracker.latest_faces) > 0 and self.tracker.latest_faces[0] is not None:
-            face = self.tracker.latest_faces[0]
-            for name, p_info in self.params.items():
-                param, list_item = p_info
-                vals = param.value
-                nvs = vals
-                def dampen(vals, new_vals, r = 2):
-                    return [v + (tv - v) / r for v, tv in zip(vals, new_vals)]
-                if name == "Eye:: Left:: Blink":
-                    nvs = dampen (vals, [1 - face.eye_blink[0], 0])
-                elif name == "Eye:: Right:: Blink":
-                    nvs = dampen(vals, [1 - face.eye_blink[1], 0])
-                elif name == "Mouth:: Shape":
-                    nvs = dampen(vals, [0.5, face.current_features["mouth_open"]])
-                elif name == "Mouth:: Width":
-                    nvs = dampen(vals, [face.current_features["mouth_wide"], 0])
-                elif name == "Head:: Yaw-Pitch" or name == "Body:: Yaw-Pitch":
-                    nvs = dampen(vals, [min(1, max(-1, -face.euler[1]/30)), min(1, max(-1, -(180 - face.euler[0])%360/30))])
-                elif name == "Head:: Roll" or name == "Body:: Roll":
-                    nvs = dampen(vals, [min(1, max(-1, (face.euler[2]-90)/30)), 0])
-                if nvs[0] != vals[0] or nvs[1] != vals[0]:
-                    param.value = nvs
-#                    list_item.setText("%s, %f, %f"%(name, nx, ny))
-                list_item.setValue(nvs)
+        if self.tracker is not None and not self.tracker.terminate and len(self.tracker.face_buffers) > 0:
+            face_buffer = self.tracker.face_buffers[0]
+            if self.face is None:
+                self.face = face_buffer.new_state()
+            self.face_seq = face_buffer.read(self.face)
+        if self.face_seq > 0 and not self.tracker.terminate:
+            face = self.face
+            if self.mapping is not None:
+                with TIMINGS.span("mapping"):
+                    changed = self.mapping.update(face, time.perf_counter())
+                self.mapping_time = time.perf_counter()
+                if changed:
+                    # Parameters moved: keep rendering while smoothing and physics catch up.
+                    self.scheduler.request()
+        if self.tool and self.tool.flush():
+            # A drag edited bindings since the last frame; let physics settle after it.
+            self.scheduler.request()
         if self.puppet:
             with inochi2d.Scene(0, 0, self.width(), self.height()) as scene:
-                self.puppet.update()
-                api.inUpdate()
-                self.puppet.draw()
+                with TIMINGS.span("puppet.update"):
+                    self.puppet.update()
+                with TIMINGS.span("inUpdate"):
+                    api.inUpdate()
+                with TIMINGS.span("puppet.draw"):
+                    self.puppet.draw()
 
                 if self.active_node and self.tool:
-                    drawable = inochi2d.Drawable(self.active_node)
-                    drawable.draw_mesh_lines()
-                    self.tool.draw(self.active_node)
+                    with TIMINGS.span("overlay"):
+                        drawable = inochi2d.Drawable(self.active_node)
+                        drawable.draw_mesh_lines()
+                        self.tool.draw(self.active_node)
+        self.draw_time = time.perf_counter()
+
+        if self.output is not None:
+            self.output.capture(self.width(), self.height(), self.face.timestamp if self.face is not None else None)
     
         if self.on_update_tracking:
             self.on_update_tracking(self)
         
         self.draw_counter += time.perf_counter() - draw_start
+        TIMINGS.record("frame", time.perf_counter() - draw_start)
         time_diff = time.time() - self.perf_time
         if time_diff > 1:
-            self.statusbar.showMessage("%5.2f fps (%5.2f secs) | %5.2f fps(OpenSeeFace)"%(self.perf_counter / time_diff, self.draw_counter, self.tracker.last_fps_counter))
+            message = "%5.2f fps, %d skipped%s (%5.2f secs) | %5.2f fps(OpenSeeFace, jitter %4.1f ms)"%(self.perf_counter / time_diff, self.scheduler.skipped, " (idle)" if self.scheduler.idle else "", self.draw_counter, self.tracker.last_fps_counter, self.tracker.last_jitter * 1000)
+            if self.latency.count > 0:
+                latency = self.latency.summary()["motion-to-photon"]
+                message += " | motion-to-photon %4.1f ms (p99 %4.1f)"%(latency["mean"] * 1000, latency["p99"] * 1000)
+            if self.textures is not None:
+                message += " | textures: %5.1f MB decoded / %5.1f MB mapped"%(self.textures.resident_bytes / 1e6, self.textures.mapped_bytes / 1e6)
+            if self.output is not None:
+                message += " | output: readback %4.1f ms, encode %4.1f ms, %d dropped"%(self.output.latency * 1000, self.output.sink.encode_time * 1000, self.output.dropped)
+            self.statusbar.showMessage(message)
             self.perf_time = time.time()
             self.perf_counter = 0
             self.draw_counter = 0
-        self.update()
-
-class ParameterView(QtWidgets.QWidget):
-    def __init__(self, param, parent=None):
-        super(ParameterView, self).__init__(parent)
-        self.param_list = parent
-        self.param = param
-        self.setMinimumSize(120, 120 + 16 if self.param.is_vec2 else 16 + 16)
-        self.min = self.param.min
-        self.max = self.param.max
-        self.setSizePolicy(
-            QtWidgets.QSizePolicy.MinimumExpanding,
-            QtWidgets.QSizePolicy.MinimumExpanding
-        )
+            self.scheduler.skipped = 0
+
+class ParameterRow:
+    # One parameter in a ParameterPanel. setValue() is what ParameterMapping calls after writing the parameter.
+    __slots__ = ("panel", "index", "param", "is_vec2", "min", "max", "painted")
+
+    def __init__(self, panel, index, param):
+        self.panel   = panel
+        self.index   = index
+        self.param   = param
+        self.is_vec2 = param.is_vec2
+        self.min     = param.min
+        self.max     = param.max
+        self.painted = None
+
+    @property
+    def height(self):
+        return ParameterPanel.VEC2_HEIGHT if self.is_vec2 else ParameterPanel.ROW_HEIGHT
 
+    def setValue(self, value):
+        self.panel.mark(self)
+
+
+class ParameterPanel(QtWidgets.QAbstractScrollArea):
+    # All puppet parameters in one custom-painted scrolling widget instead of a widget per parameter.
+    # Rows are placed from a prefix sum of their heights, so painting and hit tests only visit the rows in view.
+    # Value changes only mark a row dirty; a timer at refresh_fps, independent of the render rate, repaints the
+    # visible dirty rows whose value moved since they were last painted, as one region update.
+    ROW_HEIGHT  = 32
+    VEC2_HEIGHT = 136
+
+    def __init__(self, parent=None, refresh_fps=30):
+        super(ParameterPanel, self).__init__(parent)
+        self.rows     = []
+        self.offsets  = np.zeros((1,), dtype=np.int64)
+        self.dirty    = set()
+        self.editable = False
+        self.selected = None
+        self.drag_row = None
         self.on_select = None
-        self.on_update = None
-        self.drag      = False
-        self.active    = False
+        self.on_change = None
+        self.verticalScrollBar().setSingleStep(16)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(int(1000 / refresh_fps))
+        self.timer.timeout.connect(self.flush)
+        self.timer.start()
+
+    def set_parameters(self, params):
+        self.rows     = [ParameterRow(self, i, param) for i, param in enumerate(params)]
+        self.offsets  = np.concatenate([[0], np.cumsum([row.height for row in self.rows], dtype=np.int64)])
+        self.dirty    = set()
+        self.selected = None
+        self.drag_row = None
+        self._layout()
+        self.viewport().update()
+        return self.rows
+
+    def set_editable(self, editable):
+        self.editable = editable
+        self.viewport().update()
+
+    def select(self, row):
+        if self.selected is row:
+            return
+        previous, self.selected = self.selected, row
+        for r in (previous, row):
+            if r is not None:
+                self.viewport().update(self.row_rect(r))
+        if self.on_select:
+            self.on_select(row)
+
+    def mark(self, row):
+        self.dirty.add(row.index)
+
+    def flush(self):
+        if not self.dirty:
+            return
+        top = self.verticalScrollBar().value()
+        bottom = top + self.viewport().height()
+        region = QtGui.QRegion()
+        for i in self.dirty:
+            row = self.rows[i]
+            if self.offsets[i + 1] <= top or self.offsets[i] >= bottom:
+                continue
+            if tuple(np.atleast_1d(row.param.value)) != row.painted:
+                region += self.row_rect(row)
+        self.dirty.clear()
+        if not region.isEmpty():
+            self.viewport().update(region)
+
+    def _layout(self):
+        scrollbar = self.verticalScrollBar()
+        scrollbar.setPageStep(self.viewport().height())
+        scrollbar.setRange(0, max(0, int(self.offsets[-1]) - self.viewport().height()))
+
+    def resizeEvent(self, event):
+        super(ParameterPanel, self).resizeEvent(event)
+        self._layout()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    def row_rect(self, row):
+        top = int(self.offsets[row.index]) - self.verticalScrollBar().value()
+        return QtCore.QRect(0, top, self.viewport().width(), row.height)
+
+    def row_at(self, y):
+        y += self.verticalScrollBar().value()
+        i = int(np.searchsorted(self.offsets, y, side="right")) - 1
+        return self.rows[i] if 0 <= i < len(self.rows) else None
 
     def paintEvent(self, event):
-        painter = QtGui.QPainter(self)
-        if self.active:
-            rect = QtCore.QRect(0, 0, painter.device().width(), painter.device().height())
-            painter.fillRect(rect, self.palette().highlight())
+        painter = QtGui.QPainter(self.viewport())
+        exposed = event.rect()
+        scroll = self.verticalScrollBar().value()
+        first = max(int(np.searchsorted(self.offsets, exposed.top() + scroll, side="right")) - 1, 0)
+        last  = int(np.searchsorted(self.offsets, exposed.bottom() + scroll, side="right"))
+        width = self.viewport().width()
+        for row in self.rows[first:last]:
+            painter.save()
+            painter.translate(0, int(self.offsets[row.index]) - scroll)
+            self._paint_row(painter, row, width, row.height)
+            painter.restore()
+
+    def _paint_row(self, painter, row, width, height):
+        if row is self.selected:
+            painter.fillRect(QtCore.QRect(0, 0, width, height), self.palette().highlight())
 
         brush = QtGui.QBrush()
         brush.setColor(QtGui.QColor('#eeeeee'))
         brush.setStyle(QtCore.Qt.SolidPattern)
 
-        rect = QtCore.QRect(2, 2, painter.device().width()-4, painter.device().height()-4)
+        rect = QtCore.QRect(2, 2, width-4, height-4)
         painter.fillRect(rect, brush)
 
         painter.setPen(QtGui.QColor('#a0a0a0'))
-        rect = QtCore.QRect(8, 8 + 16, painter.device().width()-16, painter.device().height()-16-16)
-        dev_w = painter.device().width() - 16
-        dev_h = painter.device().height() - 16 - 16
-        if self.param_list.active:
+        rect = QtCore.QRect(8, 8 + 16, width-16, height-16-16)
+        dev_w = width - 16
+        dev_h = height - 16 - 16
+        if self.editable:
             brush.setColor(QtGui.QColor('#f8f8f8'))
             painter.fillRect(rect, brush)
         painter.drawRect(rect)
 
         painter.setPen(QtGui.QColor('black'))
-        painter.drawText(8, 8 + 12, self.param.name)
-
-        if self.param:
-            value = self.param.value
+        painter.drawText(8, 8 + 12, row.param.name)
 
-            radius = 4
-            if self.param_list.active:
-                brush.setColor(QtGui.QColor("red"))
-            else:
-                brush.setColor(QtGui.QColor("#808080"))
-            painter.setBrush(brush)
-            if self.param.is_vec2:
-                x_ratio = (value[0] - self.min[0])/(self.max[0] - self.min[0])
-                y_ratio = 1 - (value[1] - self.min[1])/(self.max[1] - self.min[1])
-                center_x = 8 + dev_w * x_ratio
-                center_y = 8 + 16 + dev_h * y_ratio
-            else:
-                x_ratio = (value[0] - self.min[0])/(self.max[0] - self.min[0])
-                center_x = 8 + dev_w * x_ratio
-                center_y = 8 + 16
-            painter.drawEllipse(center_x - radius, center_y - radius, radius * 2, radius * 2)
+        value = np.atleast_1d(row.param.value)
+        row.painted = tuple(value)
 
-    def setValue(self, value):
-        self.update()
+        radius = 4
+        if self.editable:
+            brush.setColor(QtGui.QColor("red"))
+        else:
+            brush.setColor(QtGui.QColor("#808080"))
+        painter.setBrush(brush)
+        if row.is_vec2:
+            x_ratio = (value[0] - row.min[0])/(row.max[0] - row.min[0])
+            y_ratio = 1 - (value[1] - row.min[1])/(row.max[1] - row.min[1])
+            center_x = 8 + dev_w * x_ratio
+            center_y = 8 + 16 + dev_h * y_ratio
+        else:
+            x_ratio = (value[0] - row.min[0])/(row.max[0] - row.min[0])
+            center_x = 8 + dev_w * x_ratio
+            center_y = 8 + 16
+        painter.drawEllipse(center_x - radius, center_y - radius, radius * 2, radius * 2)
 
     def mousePressEvent(self, event):
-        if not self.param_list.active:
+        if not self.editable:
             return
-        if self.on_select:
-            self.on_select(self)
-        if self._update_in_rect(event.pos()):
-            self.drag = True
+        row = self.row_at(event.pos().y())
+        if row is None:
             return
-        super(ParameterView, self).mousePressEvent(event)
+        self.select(row)
+        if self._update_in_rect(row, event.pos()):
+            self.drag_row = row
+            return
+        super(ParameterPanel, self).mousePressEvent(event)
 
     def mouseMoveEvent(self, event):
-        if not self.param_list.active:
+        if not self.editable:
             return
-        if self._update_in_rect(event.pos()) or self.drag:
+        row = self.drag_row or self.row_at(event.pos().y())
+        if row is not None and self._update_in_rect(row, event.pos()):
             return
-        super(ParameterView, self).mouseMoveEvent(event)
+        super(ParameterPanel, self).mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        if not self.param_list.active:
+        if not self.editable:
             return
-        if self.drag:
-            self.drag = False
-        super(ParameterView, self).mouseReleaseEvent(event)
-
-    def _update_in_rect(self, pos):
-        wide_rect = QtCore.QRect(8-4, 8 + 16-4, self.width() - 16+8, self.height() - 16-16+8)
-        rect = QtCore.QRect(8, 8 + 16, self.width() - 16, self.height() - 16-16)
-        if wide_rect.contains(pos) or self.drag:
+        self.drag_row = None
+        super(ParameterPanel, self).mouseReleaseEvent(event)
+
+    def _update_in_rect(self, row, pos):
+        row_rect = self.row_rect(row)
+        pos = pos - row_rect.topLeft()
+        width, height = row_rect.width(), row_rect.height()
+        wide_rect = QtCore.QRect(8-4, 8 + 16-4, width - 16+8, height - 16-16+8)
+        rect = QtCore.QRect(8, 8 + 16, width - 16, height - 16-16)
+        if wide_rect.contains(pos) or self.drag_row is row:
             pos = pos - rect.topLeft()
             pos_x = max(rect.left() - 8, min(pos.x(), rect.right() - 8))
             pos_y = max(rect.top() - 8 - 16, min(pos.y(), rect.bottom() - 8 - 16))
             pos_x = pos_x / rect.size().width()
             pos_y = ( pos_y / rect.size().height() ) if rect.size().height() > 0 else 0
             pos_y = 1 - pos_y
-            x = (self.max[0] - self.min[0]) * pos_x + self.min[0]
-            y = (self.max[1] - self.min[1]) * pos_y + self.min[1]
-            self.drag = True
-            if self.on_update:
-                self.on_update(self, x, y)
-            else:
-                self.param.value = (x, y)
-                self.update()
+            x = (row.max[0] - row.min[0]) * pos_x + row.min[0]
+            y = (row.max[1] - row.min[1]) * pos_y + row.min[1]
+            row.param.value = (x, y)
+            self.mark(row)
+            if self.on_change:
+                self.on_change(row)
             return True
         return False
 
 
-def run(tracker=None):
+def run(tracker=None, max_fps=60):
     ICON_SIZE=16
 
     app = QtWidgets.QApplication([])
@@ -268,6 +544,7 @@ def run(tracker=None):
     window = QtWidgets.QMainWindow()
     menubar = window.menuBar()
     file_menu = menubar.addMenu("&File")
+    view_menu = menubar.addMenu("&View")
 
     open_action = QtWidgets.QAction("&Open...", window)
     file_menu.addAction(open_action)
@@ -287,18 +564,63 @@ def run(tracker=None):
         )[0]
         if model_name == '':
             return
+        if self.loader is not None:
+            self.loader.cancel()
+        TRACER.instant("load_model", "load", {"path": model_name})
+        self.loader = LoadPipeline([
+            ("read",       read_model(model_name)),
+            ("parse",      parse_model(model_name)),
+            ("nodes",      build_tree(model_name)),
+            ("parameters", build_parameters()),
+            ("profile",    load_mapping(model_name)),
+        ], show_load_progress, finish_load, window)
+        self.loader.start()
+
+    def read_model(model_name):
+        # Read the file once on a worker thread so that Puppet.load, which has to run on the GUI thread
+        # with the GL context, finds it in the page cache.
+        total = max(os.path.getsize(model_name), 1)
+        done = [0]
+        def prefetch():
+            with open(model_name, "rb") as f:
+                while True:
+                    chunk = f.read(1 << 20)
+                    if not chunk:
+                        break
+                    done[0] += len(chunk)
+        thread = threading.Thread(target=prefetch, daemon=True)
+        thread.start()
+        while thread.is_alive():
+            yield None
+            yield done[0], total
+
+    def parse_model(model_name):
+        # Puppet.load blocks; give the event loop a turn first so the progress bar shows this stage.
+        self = gl_widget
+        yield None
+        self.makeCurrent()
         self.puppet = inochi2d.Puppet.load(model_name)
+        self.doneCurrent()
+        if self.textures is not None:
+            self.textures.close()
+        try:
+            self.textures = TextureStore(model_name)
+        except (OSError, ValueError) as e:
+            print("Texture store unavailable for %s: %s"%(model_name, e))
+            self.textures = None
         self.puppet.enable_drivers = True
         self.active_param = None
+        self.active_node  = None
+        self.mapping      = None
+        self.params       = {}
         name = api.inPuppetGetName(self.puppet.handle)
         print(name)
-        root = self.puppet.root
-        def on_select_node(item, col):
-            self.active_node = item.node
-            if self.tool:
-                self.tool.switch_node(item.node)
-            text_area.setPlainText(json.dumps(item.node.dumps(False), indent=4, ensure_ascii=False))
+        self.scheduler.request()
+        yield 1, 1
 
+    def build_tree(model_name):
+        self = gl_widget
+        root = self.puppet.root
         def dump_node(node, parent):
             name = node.name
             type_id = node.type_id
@@ -308,17 +630,10 @@ def run(tracker=None):
             if "textures" in node_prop:
                 texture_id = node_prop["textures"][0]
                 if texture_id <= 65535:
-                    texture = self.puppet.get_texture_from_id(texture_id)
-                    w,h = texture.size
-                    channels = texture.channels
-                    img = texture.data
-                    img = img.reshape([h, w, channels])
-                    scale = min(ICON_SIZE/w, ICON_SIZE/h)
-                    icon = cv2.resize(img, None, None, scale, scale)
-                    qimg = QtGui.QImage(icon.data, icon.shape[1], icon.shape[0], icon.strides[0], QtGui.QImage.Format_RGBA8888)
-                    qpixmap = QtGui.QPixmap(qimg)
-                    qicon = QtGui.QIcon(qpixmap)
-                    tree_item.setIcon(0, qicon)
+                    # The real icon is filled in by the thumbnail cache once the item scrolls into view.
+                    tree_item.setIcon(0, placeholder_icon)
+                    tree_item.setData(0, QtCore.Qt.UserRole, texture_id)
+                    thumbnail_items.setdefault(texture_id, []).append(tree_item)
                     tree_item.setText(0, "%s"%(name))
             elif type_id == "Node":
                 qicon = qta.icon("mdi.folder")
@@ -341,25 +656,28 @@ def run(tracker=None):
                 tree_widget.addTopLevelItem(tree_item)
             else:
                 parent.addChild(tree_item)
-            for c in node.children():
-                dump_node(c, tree_item)
+            return tree_item
+        thumbnail_items.clear()
+        thumbnail_requested.clear()
+        thumbnails.open_model(model_name, fetch_texture, self.textures)
+        placeholder_icon = qta.icon("mdi.image-outline")
         tree_widget.clear()
-        dump_node(root, None)
-        tree_widget.itemClicked.connect(on_select_node)
-        tree_widget.expandAll()
         tree_widget.setStyleSheet("QTreeWidget::item { padding: 0; margin: 0}")
-
-        # Parameter View
-
+        # Depth-first, one node per step, so the tree fills in while the window stays responsive.
+        stack = [(root, None)]
+        done = 0
+        while stack:
+            node, parent = stack.pop()
+            tree_item = dump_node(node, parent)
+            tree_item.setExpanded(True)
+            stack.extend((c, tree_item) for c in reversed(node.children()))
+            done += 1
+            yield done, done + len(stack)
+        icon_timer.start()
+
+    def build_parameters():
+        self = gl_widget
         def param_selected(item):
-            if param_list.active_widget != item:
-                prev_active = param_list.active_widget
-                if prev_active:
-                    prev_active.active = False
-                    prev_active.update()
-                param_list.active_widget = item
-                item.active = True
-                param_list.update()
             bind_list.clear()
             self.active_param = item.param
             bindings = item.param.bindings
@@ -380,39 +698,121 @@ def run(tracker=None):
                 bind_item.value = None
 
         params = self.puppet.parameters
-        self.params = {}
-        vbox = QtWidgets.QVBoxLayout()
-        param_list.setLayout(vbox)
-        param_list.active = False
-        for param in params:
-            uuid = param.uuid
-            name = param.name
-            if param.is_vec2:
-                x, y = param.value
-            else:
-                x = param.value
-                y = 0
-            list_item = ParameterView(param, param_list)
-            vbox.addWidget(list_item)
-            self.params[name] = (param, list_item)
-            list_item.on_select = param_selected
-
+        bind_list.clear()
+        rows = param_list.set_parameters(params)
+        param_list.on_select = param_selected
+        param_list.on_change = lambda row: self.scheduler.request()
+        params_by_name = {}
+        for i, row in enumerate(rows):
+            params_by_name[row.param.name] = (row.param, row)
+            yield i + 1, len(rows)
+        self.params = params_by_name
+
+    def load_mapping(model_name):
+        self = gl_widget
+        yield None
+        self.mapping       = None
+        self.profile_path  = profile_path(model_name)
+        self.profile_mtime = None
+        reload_profile()
+        watch_profile()
+        self.scheduler.request()
+        yield 1, 1
+
+    def show_load_progress(stage, index, count, done, total):
+        load_progress.show()
+        load_progress.setMaximum(1000)
+        fraction = (index + (done / total if total else 0)) / count
+        load_progress.setValue(int(fraction * 1000))
+        load_progress.setFormat("Loading: %s (%d/%d)"%(stage, done, total))
+
+    def finish_load(loader):
+        load_progress.hide()
+        gl_widget.loader = None
+        summary = ", ".join("%s %5.3f secs"%(stage, elapsed) for stage, elapsed, _ in loader.timings)
+        print("Loaded model: %s"%summary)
+        statusbar.showMessage("Loaded model: %s"%summary, 5000)
         transform_action.setChecked(True)
         transform_action.activate(QtWidgets.QAction.Trigger)
 
     open_action.triggered.connect(load_model)
 
+    record_action = QtWidgets.QAction("&Record Output...", window, checkable=True)
+    file_menu.addAction(record_action)
+
+    def toggle_record(isChecked):
+        self = gl_widget
+        if isChecked:
+            path = QtWidgets.QFileDialog.getSaveFileName(
+                None,
+                "Record Output",
+                "",
+                "Video (*.mp4 *.mkv *.webm);;Raw RGBA (*.rgba *.raw);;PNG sequence directory (*)",
+                "",
+                QtWidgets.QFileDialog.Options()
+            )[0]
+            if path == '':
+                record_action.setChecked(False)
+                return
+            self.makeCurrent()
+            self.output = FrameOutput(create_sink(path, 60), self.width(), self.height())
+            self.doneCurrent()
+        elif self.output is not None:
+            self.makeCurrent()
+            self.output.close()
+            self.doneCurrent()
+            self.output = None
+
+    record_action.toggled.connect(toggle_record)
+
+    # Mapping profile hot reload. The directory is watched too, so that profiles created later or
+    # replaced by an editor's atomic rename are picked up; reloads are debounced off the change signal.
+    profile_watcher = QtCore.QFileSystemWatcher(window)
+    profile_timer   = QtCore.QTimer(window)
+    profile_timer.setSingleShot(True)
+    profile_timer.setInterval(100)
+
+    def watch_profile():
+        paths = profile_watcher.files() + profile_watcher.directories()
+        if paths:
+            profile_watcher.removePaths(paths)
+        path = gl_widget.profile_path
+        profile_watcher.addPath(os.path.dirname(os.path.abspath(path)))
+        if os.path.exists(path):
+            profile_watcher.addPath(path)
+
+    def reload_profile():
+        self = gl_widget
+        path = self.profile_path
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if self.mapping is not None and mtime == self.profile_mtime:
+            return
+        self.profile_mtime = mtime
+        try:
+            rules, smoothing, filter_config = load_profile(path)
+            self.mapping = ParameterMapping(self.params, rules, smoothing, filter_config)
+            self.scheduler.request()
+            if mtime is not None:
+                print("Loaded mapping profile %s (%d parameters)"%(path, len(self.mapping)))
+        except (OSError, ValueError) as e:
+            print("Failed to load mapping profile %s:\n%s"%(path, e))
+        if mtime is not None and path not in profile_watcher.files():
+            profile_watcher.addPath(path)
+
+    profile_timer.timeout.connect(reload_profile)
+    profile_watcher.fileChanged.connect(lambda _: profile_timer.start())
+    profile_watcher.directoryChanged.connect(lambda _: profile_timer.start())
+
 
     statusbar = window.statusBar()
+    load_progress = QtWidgets.QProgressBar(window)
+    load_progress.setMaximumWidth(320)
+    load_progress.hide()
+    statusbar.addPermanentWidget(load_progress)
     toolbar = QtWidgets.QToolBar("Main", window) #window.addToolBar("Main")
     v_toolbar = QtWidgets.QToolBar("Tool", window)
 
-    list_container = QtWidgets.QScrollArea(window)
-    param_list = QtWidgets.QWidget()
-    param_list.active_widget = None
-    param_list.active = False
-    list_container.setWidget(param_list)
-    list_container.setWidgetResizable(True)
+    param_list = ParameterPanel(window)
     
     bind_list   = QtWidgets.QListWidget(window)
     
@@ -420,9 +820,56 @@ def run(tracker=None):
     tree_widget.setIconSize(QtCore.QSize(ICON_SIZE, ICON_SIZE))
     tree_widget.setHeaderHidden(True)
 
+    # Node icons are generated lazily for the items in view, off the GUI thread, and cached on disk.
+    thumbnails = ThumbnailCache(ICON_SIZE, parent=window)
+    thumbnail_items = {}
+    thumbnail_requested = set()
+    icon_timer = QtCore.QTimer(window)
+    icon_timer.setSingleShot(True)
+    icon_timer.setInterval(50)
+
+    def fetch_texture(texture_id):
+        texture = gl_widget.puppet.get_texture_from_id(texture_id)
+        w,h = texture.size
+        return texture.data.reshape([h, w, texture.channels])
+
+    def request_visible_icons():
+        bottom = tree_widget.viewport().rect().bottom()
+        item = tree_widget.itemAt(0, 0)
+        while item is not None and tree_widget.visualItemRect(item).top() <= bottom:
+            texture_id = item.data(0, QtCore.Qt.UserRole)
+            if texture_id in thumbnail_items and texture_id not in thumbnail_requested:
+                thumbnail_requested.add(texture_id)
+                thumbnails.request(texture_id)
+            item = tree_widget.itemBelow(item)
+
+    def on_thumbnail(generation, texture_id, icon):
+        if generation != thumbnails.generation:
+            return
+        qimg = QtGui.QImage(icon.data, icon.shape[1], icon.shape[0], icon.strides[0], QtGui.QImage.Format_RGBA8888).copy()
+        qicon = QtGui.QIcon(QtGui.QPixmap(qimg))
+        for tree_item in thumbnail_items.pop(texture_id, []):
+            tree_item.setIcon(0, qicon)
+
+    thumbnails.ready.connect(on_thumbnail)
+    icon_timer.timeout.connect(request_visible_icons)
+    tree_widget.verticalScrollBar().valueChanged.connect(lambda _: icon_timer.start())
+    tree_widget.verticalScrollBar().rangeChanged.connect(lambda *_: icon_timer.start())
+    tree_widget.itemExpanded.connect(lambda _: icon_timer.start())
+
+    def on_select_node(item, col):
+        self = gl_widget
+        self.active_node = item.node
+        if self.tool:
+            self.tool.switch_node(item.node)
+        text_area.setPlainText(json.dumps(item.node.dumps(False), indent=4, ensure_ascii=False))
+        self.scheduler.request(False)
+
+    tree_widget.itemClicked.connect(on_select_node)
+
     text_area = QtWidgets.QTextEdit(window)
     docked_widgets = {
-        "Parameters": list_container,
+        "Parameters": param_list,
         "Parameter Bindings": bind_list,
         "Node Tree View": tree_widget,
         "Node Inspection": text_area
@@ -442,6 +889,80 @@ def run(tracker=None):
     gl_widget = Inochi2DView(window)
     gl_widget.statusbar = statusbar
 
+    # Per-stage timing table drawn over the view; showing it turns timing on, hiding it turns timing back off
+    # unless CUTE_PLAYER_TIMING had it on from the start.
+    timing_at_startup = TIMINGS.enabled
+    timing_overlay = QtWidgets.QLabel(gl_widget)
+    timing_overlay.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+    timing_overlay.setStyleSheet("QLabel { background: rgba(0, 0, 0, 160); color: white; padding: 4px }")
+    timing_overlay.move(8, 8)
+    timing_overlay.hide()
+    timing_timer = QtCore.QTimer(window)
+    timing_timer.setInterval(500)
+
+    def refresh_timing():
+        timing_overlay.setText(TIMINGS.format())
+        timing_overlay.adjustSize()
+
+    def toggle_timing(isChecked):
+        if isChecked:
+            TIMINGS.enabled = True
+            refresh_timing()
+            timing_overlay.show()
+            timing_timer.start()
+        else:
+            TIMINGS.enabled = timing_at_startup
+            timing_timer.stop()
+            timing_overlay.hide()
+
+    timing_timer.timeout.connect(refresh_timing)
+    timing_action = QtWidgets.QAction("Show &Timing", window, checkable=True)
+    timing_action.toggled.connect(toggle_timing)
+    view_menu.addAction(timing_action)
+
+    trace_action = QtWidgets.QAction("&Record Trace", window, checkable=True)
+    trace_action.setChecked(TRACER.enabled)
+    trace_action.toggled.connect(lambda isChecked: TRACER.start() if isChecked else TRACER.stop())
+    view_menu.addAction(trace_action)
+    save_trace_action = QtWidgets.QAction("&Save Trace...", window)
+    view_menu.addAction(save_trace_action)
+
+    def save_trace(_):
+        path = QtWidgets.QFileDialog.getSaveFileName(
+            None,
+            "Save Trace",
+            "",
+            "Chrome trace (*.json)",
+            "",
+            QtWidgets.QFileDialog.Options()
+        )[0]
+        if path == '':
+            return
+        count = TRACER.dump(path)
+        statusbar.showMessage("Wrote %d trace events to %s"%(count, path), 5000)
+
+    save_trace_action.triggered.connect(save_trace)
+
+    save_latency_action = QtWidgets.QAction("Save &Latency Log...", window)
+    view_menu.addAction(save_latency_action)
+
+    def save_latency(_):
+        path = QtWidgets.QFileDialog.getSaveFileName(
+            None,
+            "Save Latency Log",
+            "",
+            "CSV (*.csv)",
+            "",
+            QtWidgets.QFileDialog.Options()
+        )[0]
+        if path == '':
+            return
+        count = gl_widget.latency.save(path)
+        print(gl_widget.latency.format())
+        statusbar.showMessage("Wrote %d latency records to %s"%(count, path), 5000)
+
+    save_latency_action.triggered.connect(save_latency)
+
     def onload(self):
         inochi2d.dbg.draw_mesh_outlines      = True
         inochi2d.dbg.draw_mesh_vertex_points = True
@@ -451,12 +972,14 @@ def run(tracker=None):
         self.camera = inochi2d.Camera.get_current()
         self.camera.zoom = self.scale
         self.camera.position = (0., 0.)
+        self.camera_version += 1
 
         self.timer = 0
 
     # Layout of Main Area
     gl_widget.onload = onload
     gl_widget.tracker = tracker
+    gl_widget.scheduler.set_max_fps(max_fps)
 
     main_container = QtWidgets.QWidget(window)
     sub_container = QtWidgets.QWidget(window)
@@ -499,6 +1022,7 @@ def run(tracker=None):
                     for widget in toolbar.option_widgets:
                         toolbar.removeAction(widget)
                     gl_widget.tool.show_toolbar(toolbar, spacer2)
+                gl_widget.scheduler.request(False)
         return on_select
     
 
@@ -511,11 +1035,11 @@ def run(tracker=None):
             for action in window.tool_actions:
                 v_toolbar.removeAction(action)
             window.tool_actions = []
-            param_list.active = False
-            param_list.update()
+            param_list.set_editable(False)
             if gl_widget.puppet:
                 for param in gl_widget.puppet.parameters:
                     param.reset()
+            gl_widget.scheduler.request()
 
 #            color = tree_widget.palette().color(QtGui.QPalette.Active, QtGui.QPalette.Base)
 #            tree_widget.setStyleSheet("""QTreeWidget {background: rgb(%d, %d, %d); }"""%(color.red(), color.green(), color.blue()))
@@ -570,8 +1094,8 @@ def run(tracker=None):
                 v_toolbar.removeAction(action)
             window.tool_actions = []
 
-            param_list.active = True
-            param_list.update()
+            param_list.set_editable(True)
+            gl_widget.scheduler.request()
 
             color = tree_widget.palette().color(QtGui.QPalette.Active, QtGui.QPalette.Window)
 #            tree_widget.setStyleSheet("""QTreeWidget {background: rgb(%d, %d, %d); }"""%(color.red(), color.green(), color.blue()))
@@ -665,9 +1189,10 @@ def run(tracker=None):
     def toggle_tracking(self):
         if gl_widget.tracker.terminate:
             gl_widget.tracker.terminate = False
-            threading.Thread(target=gl_widget.tracker.run).start()
+            threading.Thread(target=gl_widget.tracker.run, name="tracker").start()
         else:
             gl_widget.tracker.terminate = True
+        gl_widget.scheduler.request()
 
     spacer1 = QtWidgets.QWidget(window)
     spacer1.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
@@ -0,0 +1,228 @@
+import os
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+import sys
+sys.path.append("inochi2d-py")
+
+from PySide2 import QtGui
+from OpenGL import GL
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+import cv2
+import inochi2d.api as api
+import inochi2d.inochi2d as inochi2d
+
+from facestate import FaceState
+from facerecord import FaceRecording
+from mapping import ParameterMapping, profile_path, load_profile
+from output import FrameOutput, create_sink, VIDEO_EXTENSIONS, RAW_EXTENSIONS
+from timing import TIMINGS
+
+
+class NullParameterView:
+    def setValue(self, value):
+        pass
+
+
+class HeadlessRenderer:
+    # Renders a puppet into an offscreen framebuffer object without any window.
+    # Works with Qt's "offscreen" platform on Mesa (llvmpipe) or EGL.
+    def __init__(self, width, height, zoom=0.26):
+        self.width  = width
+        self.height = height
+        self.app    = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+
+        format = QtGui.QSurfaceFormat()
+        format.setVersion(3, 2)
+        format.setProfile(QtGui.QSurfaceFormat.CoreProfile)
+        self.surface = QtGui.QOffscreenSurface()
+        self.surface.setFormat(format)
+        self.surface.create()
+        self.context = QtGui.QOpenGLContext()
+        self.context.setFormat(format)
+        if not self.context.create():
+            raise RuntimeError("Failed to create an OpenGL context")
+        self.context.makeCurrent(self.surface)
+
+        fbo_format = QtGui.QOpenGLFramebufferObjectFormat()
+        fbo_format.setAttachment(QtGui.QOpenGLFramebufferObject.CombinedDepthStencil)
+        self.fbo = QtGui.QOpenGLFramebufferObject(width, height, fbo_format)
+
+        inochi2d.init()
+        inochi2d.Viewport.set(width, height)
+        self.camera = inochi2d.Camera.get_current()
+        self.camera.zoom = zoom
+        self.camera.position = (0., 0.)
+
+        self.puppet  = None
+        self.params  = {}
+        self.mapping = None
+        self.output  = None
+
+    def load(self, model_name):
+        self.puppet = inochi2d.Puppet.load(model_name)
+        self.puppet.enable_drivers = True
+        self.params = {param.name: (param, NullParameterView()) for param in self.puppet.parameters}
+        rules, smoothing, filter_config = load_profile(profile_path(model_name))
+        self.mapping = ParameterMapping(self.params, rules, smoothing, filter_config)
+
+    def render(self, face=None, now=None):
+        if face is not None and self.mapping is not None:
+            with TIMINGS.span("mapping"):
+                self.mapping.update(face, face.timestamp if now is None else now)
+        timestamp = now if now is not None else (face.timestamp if face is not None else None)
+
+        self.fbo.bind()
+        GL.glViewport(0, 0, self.width, self.height)
+        try:
+            # It seems inochi2d leaves some GL error, and OpenGL.GL see it as an error for successive command.
+            GL.glClearColor(0.0, 0.0, 0.0, 0.0)
+        except GL.GLError as e:
+            pass
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+        # inochi2d.Scene composites into framebuffer 0, which an offscreen surface may not have,
+        # so the scene is driven by hand and composited into our FBO.
+        api.inBeginScene()
+        with TIMINGS.span("puppet.update"):
+            self.puppet.update()
+        with TIMINGS.span("inUpdate"):
+            api.inUpdate()
+        with TIMINGS.span("puppet.draw"):
+            self.puppet.draw()
+        api.inEndScene()
+        self.fbo.bind()
+        api.inDrawScene(0, 0, self.width, self.height)
+        if self.output is not None:
+            self.output.capture(self.width, self.height, timestamp)
+        self.fbo.release()
+
+    def close(self):
+        if self.output is not None:
+            self.fbo.bind()
+            self.output.close()
+            self.fbo.release()
+            self.output = None
+        self.context.doneCurrent()
+
+
+def render_video(model_name, video, output, width=1024, height=1024, zoom=0.26, max_frames=0):
+    # Tracks every frame of video and renders the puppet for it. Timestamps are taken from the
+    # video's frame rate instead of the wall clock, so the same input always gives the same output.
+    # Imported here so that replaying a recording does not need OpenSeeFace and ONNX.
+    from facetracker import FaceTracker
+    capture = cv2.VideoCapture(video)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    capture.release()
+
+    renderer = HeadlessRenderer(width, height, zoom)
+    renderer.load(model_name)
+    # Batch rendering keeps every frame: the readback waits for its transfer and the encoder applies backpressure.
+    renderer.output = FrameOutput(create_sink(output, fps, drop_frames=False), width, height, wait=True)
+
+    tracker = FaceTracker()
+    tracker.capture = video
+    tracker.silent = 1
+    end = object()
+    samples = queue.Queue(maxsize=4)
+
+    def on_frame(capture_time):
+        face = FaceState(len(tracker.features))
+        if tracker.face_buffers[0].read(face) == 0:
+            face = None
+        samples.put(face)
+    tracker.on_frame = on_frame
+
+    def track():
+        try:
+            tracker.run()
+        finally:
+            samples.put(end)
+    tracker.terminate = False
+    thread = threading.Thread(target=track, daemon=True)
+    thread.start()
+
+    frames = 0
+    render_time = 0.
+    start = time.perf_counter()
+    while True:
+        face = samples.get()
+        if face is end:
+            break
+        video_time = frames / fps
+        if face is not None:
+            face.timestamp = video_time
+        render_start = time.perf_counter()
+        renderer.render(face, video_time)
+        render_time += time.perf_counter() - render_start
+        frames += 1
+        if max_frames and frames >= max_frames:
+            tracker.terminate = True
+            break
+
+    # Drain so that the tracker thread is not left blocked on a full queue.
+    while thread.is_alive():
+        try:
+            samples.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    renderer.close()
+
+    elapsed = time.perf_counter() - start
+    if frames > 0:
+        print("%d frames in %5.2f secs: %5.2f fps overall, %5.2f ms/frame render"%(frames, elapsed, frames / elapsed, render_time / frames * 1000))
+    return frames
+
+
+def render_recording(model_name, path, output, width=1024, height=1024, zoom=0.26, max_frames=0):
+    # Renders one frame per sample of a face recording (see facerecord), as fast as possible. Timestamps are the
+    # recorded capture times relative to the first sample, so the output does not depend on render speed.
+    recording = FaceRecording(path)
+    fps = (len(recording.faces()) - 1) / recording.duration if recording.duration > 0 else 30
+
+    renderer = HeadlessRenderer(width, height, zoom)
+    renderer.load(model_name)
+    renderer.output = FrameOutput(create_sink(output, fps, drop_frames=False), width, height, wait=True)
+
+    frames = 0
+    render_time = 0.
+    start = time.perf_counter()
+    first = None
+    for face in recording.states():
+        if first is None:
+            first = face.timestamp
+        face.timestamp -= first
+        render_start = time.perf_counter()
+        renderer.render(face, face.timestamp)
+        render_time += time.perf_counter() - render_start
+        frames += 1
+        if max_frames and frames >= max_frames:
+            break
+    renderer.close()
+
+    elapsed = time.perf_counter() - start
+    if frames > 0:
+        print("%d frames in %5.2f secs: %5.2f fps overall, %5.2f ms/frame render"%(frames, elapsed, frames / elapsed, render_time / frames * 1000))
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render an Inochi2D puppet driven by face tracking on a video file, without a display.")
+    parser.add_argument("model", help="Inochi2D model (.inp or .inx)")
+    parser.add_argument("video", help="Input video file to track, or face recording with --recording")
+    parser.add_argument("output", help="Output video file (%s, encoded by ffmpeg), raw RGBA file (%s), /dev/videoN, or directory for a PNG sequence"%(", ".join(VIDEO_EXTENSIONS), ", ".join(RAW_EXTENSIONS)))
+    parser.add_argument("--size", default="1024x1024", help="Output size as WIDTHxHEIGHT")
+    parser.add_argument("--zoom", type=float, default=0.26, help="Camera zoom")
+    parser.add_argument("--max-frames", type=int, default=0, help="Stop after this many frames")
+    parser.add_argument("--recording", action="store_true", help="The input is a face recording to replay instead of a video")
+    args = parser.parse_args(argv)
+    width, height = [int(v) for v in args.size.lower().split("x")]
+    if args.recording:
+        render_recording(args.model, args.video, args.output, width, height, args.zoom, args.max_frames)
+    else:
+        render_video(args.model, args.video, args.output, width, height, args.zoom, args.max_frames)
+
+
+if __name__ == "__main__":
+    main()
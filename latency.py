@@ -0,0 +1,88 @@
+import numpy as np
+
+
+# One row per rendered frame that showed a tracker sample; times are perf_counter seconds.
+RECORD = np.dtype([
+    ("seq",       np.int64),
+    ("capture",   np.float64),
+    ("inference", np.float64),
+    ("mapping",   np.float64),
+    ("draw",      np.float64),
+    ("swap",      np.float64),
+])
+
+# (name, from, to) for each reported latency.
+SEGMENTS = [
+    ("capture->inference", "capture",   "inference"),
+    ("inference->mapping", "inference", "mapping"),
+    ("mapping->draw",      "mapping",   "draw"),
+    ("draw->swap",         "draw",      "swap"),
+    ("motion-to-photon",   "capture",   "swap"),
+]
+
+
+class LatencyRecorder:
+    # Motion-to-photon latency of the last `capacity` frames, kept in a fixed-size structured ring.
+    # capture and inference come with the face sample (FaceState.timestamp / inference_time), mapping, draw and
+    # swap are taken by the renderer. A frame that shows the same sample as the previous one is counted as
+    # repeated; staleness is how old the sample was when its frame was drawn.
+    def __init__(self, capacity=1024):
+        self.records  = np.zeros((capacity,), dtype=RECORD)
+        self.count    = 0
+        self.repeated = 0
+        self.last_seq = 0
+
+    def record(self, face, mapping_time, draw_time, swap_time):
+        if face is None or face.seq == 0:
+            return
+        if face.seq == self.last_seq:
+            self.repeated += 1
+        self.last_seq = face.seq
+        row = self.records[self.count % len(self.records)]
+        row["seq"]       = face.seq
+        row["capture"]   = face.timestamp
+        row["inference"] = face.inference_time
+        row["mapping"]   = mapping_time
+        row["draw"]      = draw_time
+        row["swap"]      = swap_time
+        self.count += 1
+
+    def samples(self):
+        if self.count <= len(self.records):
+            return self.records[:self.count].copy()
+        start = self.count % len(self.records)
+        return np.concatenate([self.records[start:], self.records[:start]])
+
+    def summary(self):
+        # {segment: {"min", "mean", "p99", "max"}} in seconds, plus "staleness" (sample age at draw time),
+        # "frames" in the window and "repeated" samples since the last reset.
+        samples = self.samples()
+        result = {"frames": len(samples), "repeated": self.repeated}
+        if len(samples) == 0:
+            return result
+        segments = [(name, samples[end] - samples[start]) for name, start, end in SEGMENTS]
+        segments.append(("staleness", samples["draw"] - samples["capture"]))
+        for name, values in segments:
+            result[name] = {"min": float(np.min(values)), "mean": float(np.mean(values)),
+                            "p99": float(np.percentile(values, 99)), "max": float(np.max(values))}
+        return result
+
+    def format(self):
+        summary = self.summary()
+        lines = ["%d frames, %d repeated samples"%(summary["frames"], summary["repeated"])]
+        for name, _, _ in SEGMENTS + [("staleness", None, None)]:
+            if name in summary:
+                stats = summary[name]
+                lines.append("%-20s min %6.1f  mean %6.1f  p99 %6.1f ms"%(name, stats["min"] * 1000, stats["mean"] * 1000, stats["p99"] * 1000))
+        return "\n".join(lines)
+
+    def save(self, path):
+        # CSV of the per-frame records, oldest first.
+        samples = self.samples()
+        np.savetxt(path, np.column_stack([samples[name] for name in RECORD.names]), delimiter=",",
+                   header=",".join(RECORD.names), comments="", fmt=["%d"] + ["%.6f"] * (len(RECORD.names) - 1))
+        return len(samples)
+
+    def reset(self):
+        self.count    = 0
+        self.repeated = 0
@@ -0,0 +1,230 @@
+import os
+import json
+import numpy as np
+
+from facestate import FEATURES
+from smoothing import DEFAULT_FILTER, create_filter, validate_filter
+
+
+# Values a mapping can read from a FaceState, in the order of ParameterMapping.sources.
+SOURCES = ["euler_x", "euler_y", "euler_z", "eye_blink_l", "eye_blink_r"] + FEATURES + ["zero"]
+SOURCE_INDEX = {name: i for i, name in enumerate(SOURCES)}
+
+# value = clamp(curve(deadzone(wrap(source - origin)) * scale) + offset, min, max), then smoothed towards it.
+# smoothing is the fraction of the remaining distance covered per frame at REFERENCE_FPS; it is rescaled to the
+# actual render interval so that the response does not depend on the GL frame rate.
+DEFAULT_RULES = [
+    {"param": "Eye:: Left:: Blink",  "x": {"source": "eye_blink_l", "scale": -1, "offset": 1}},
+    {"param": "Eye:: Right:: Blink", "x": {"source": "eye_blink_r", "scale": -1, "offset": 1}},
+    {"param": "Mouth:: Shape",       "x": {"source": "zero", "offset": 0.5}, "y": {"source": "mouth_open"}},
+    {"param": "Mouth:: Width",       "x": {"source": "mouth_wide"}},
+    {"param": "Head:: Yaw-Pitch",    "x": {"source": "euler_y", "scale": -1 / 30, "min": -1, "max": 1},
+                                     "y": {"source": "euler_x", "origin": 180, "wrap": 360, "scale": 1 / 30, "min": -1, "max": 1}},
+    {"param": "Body:: Yaw-Pitch",    "x": {"source": "euler_y", "scale": -1 / 30, "min": -1, "max": 1},
+                                     "y": {"source": "euler_x", "origin": 180, "wrap": 360, "scale": 1 / 30, "min": -1, "max": 1}},
+    {"param": "Head:: Roll",         "x": {"source": "euler_z", "origin": 90, "scale": 1 / 30, "min": -1, "max": 1}},
+    {"param": "Body:: Roll",         "x": {"source": "euler_z", "origin": 90, "scale": 1 / 30, "min": -1, "max": 1}},
+]
+
+
+REFERENCE_FPS = 60
+RULE_KEYS = {"param", "x", "y", "smoothing"}
+AXIS_KEYS = {"source", "origin", "wrap", "scale", "offset", "min", "max", "deadzone", "curve"}
+
+
+def profile_path(model_name):
+    # Mapping profiles live next to the model: foo.inx -> foo.mapping.json
+    return os.path.splitext(model_name)[0] + ".mapping.json"
+
+
+def validate_rules(rules, smoothing=0.5):
+    errors = []
+    def number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if not number(smoothing) or not 0 < smoothing <= 1:
+        errors.append("smoothing must be in (0, 1]")
+    if not isinstance(rules, list):
+        raise ValueError("parameters must be a list")
+    for i, rule in enumerate(rules):
+        if not isinstance(rule, dict) or not isinstance(rule.get("param"), str):
+            errors.append("#%d: missing parameter name"%i)
+            continue
+        name = rule["param"]
+        for key in set(rule) - RULE_KEYS:
+            errors.append("%s: unknown key '%s'"%(name, key))
+        if "smoothing" in rule and (not number(rule["smoothing"]) or not 0 < rule["smoothing"] <= 1):
+            errors.append("%s: smoothing must be in (0, 1]"%name)
+        for axis_name in ("x", "y"):
+            if axis_name not in rule:
+                continue
+            axis = rule[axis_name]
+            where = "%s.%s"%(name, axis_name)
+            if not isinstance(axis, dict):
+                errors.append("%s: must be an object"%where)
+                continue
+            for key in set(axis) - AXIS_KEYS:
+                errors.append("%s: unknown key '%s'"%(where, key))
+            if axis.get("source") not in SOURCE_INDEX:
+                errors.append("%s: unknown source '%s'"%(where, axis.get("source")))
+            for key in AXIS_KEYS - {"source"}:
+                if key in axis and not number(axis[key]):
+                    errors.append("%s: '%s' must be a number"%(where, key))
+            if number(axis.get("min", 0)) and number(axis.get("max", 0)) and axis.get("min", -np.inf) > axis.get("max", np.inf):
+                errors.append("%s: min is larger than max"%where)
+            if number(axis.get("deadzone", 0)) and axis.get("deadzone", 0) < 0:
+                errors.append("%s: deadzone must not be negative"%where)
+            if number(axis.get("curve", 1)) and axis.get("curve", 1) <= 0:
+                errors.append("%s: curve must be positive"%where)
+            if number(axis.get("wrap", 0)) and axis.get("wrap", 0) < 0:
+                errors.append("%s: wrap must not be negative"%where)
+    if errors:
+        raise ValueError("\n".join(errors))
+
+
+def load_profile(path):
+    # Returns (rules, smoothing, filter); the built-in rules are used when there is no profile file.
+    if not os.path.exists(path):
+        return DEFAULT_RULES, 0.5, DEFAULT_FILTER
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+    if not isinstance(profile, dict):
+        raise ValueError("profile must be an object")
+    rules = profile.get("parameters", [])
+    smoothing = profile.get("smoothing", 0.5)
+    filter_config = profile.get("filter", DEFAULT_FILTER)
+    validate_rules(rules, smoothing)
+    validate_filter(filter_config)
+    return rules, smoothing, filter_config
+
+
+class ParameterMapping:
+    # Tracking -> parameter rules compiled into flat arrays, one row per parameter axis.
+    # Each frame is evaluated in a handful of NumPy calls and only parameters whose value moved are written back.
+    EPSILON = 1e-4
+
+    def __init__(self, params, rules=DEFAULT_RULES, smoothing=0.5, filter_config=DEFAULT_FILTER):
+        self.targets = []
+        rows = []
+        for rule in rules:
+            if rule["param"] not in params:
+                continue
+            param, list_item = params[rule["param"]]
+            self.targets.append((param, list_item))
+            for axis in ("x", "y"):
+                rows.append((rule.get(axis, {"source": "zero"}), rule.get("smoothing", smoothing)))
+
+        n = len(rows)
+        self.source_index = np.zeros((n,), dtype=np.intp)
+        self.origin       = np.zeros((n,), dtype=np.float32)
+        self.wrap         = np.ones((n,), dtype=np.float32)
+        self.has_wrap     = np.zeros((n,), dtype=bool)
+        self.scale        = np.ones((n,), dtype=np.float32)
+        self.offset       = np.zeros((n,), dtype=np.float32)
+        self.lower        = np.full((n,), -np.inf, dtype=np.float32)
+        self.upper        = np.full((n,), np.inf, dtype=np.float32)
+        self.deadzone     = np.zeros((n,), dtype=np.float32)
+        self.curve        = np.ones((n,), dtype=np.float32)
+        self.smoothing    = np.ones((n,), dtype=np.float32)
+        for i, (axis, smoothing) in enumerate(rows):
+            self.source_index[i] = SOURCE_INDEX[axis["source"]]
+            self.origin[i]       = axis.get("origin", 0)
+            if axis.get("wrap"):
+                self.wrap[i]     = axis["wrap"]
+                self.has_wrap[i] = True
+            self.scale[i]        = axis.get("scale", 1)
+            self.offset[i]       = axis.get("offset", 0)
+            self.lower[i]        = axis.get("min", -np.inf)
+            self.upper[i]        = axis.get("max", np.inf)
+            self.deadzone[i]     = axis.get("deadzone", 0)
+            self.curve[i]        = axis.get("curve", 1)
+            self.smoothing[i]    = smoothing
+
+        self.retain  = 1 - self.smoothing
+        self.alpha   = np.ones((n,), dtype=np.float32)
+        self.raw     = np.zeros((len(SOURCES),), dtype=np.float64)
+        self.sources = np.zeros((len(SOURCES),), dtype=np.float64)
+        self.filter  = create_filter(len(SOURCES), filter_config)
+        self.face_seq   = 0
+        self.frame_time = None
+        self.target  = np.zeros((n,), dtype=np.float32)
+        self.values  = np.zeros((n,), dtype=np.float32)
+        self.applied = np.zeros((n,), dtype=np.float32)
+        self.delta   = np.zeros((n,), dtype=np.float32)
+        self.magnitude = np.zeros((n,), dtype=np.float32)
+        self.moved   = np.zeros((n,), dtype=bool)
+        self.changed = np.zeros((len(self.targets),), dtype=bool)
+        self.sync()
+
+    def __len__(self):
+        return len(self.targets)
+
+    def sync(self):
+        # Re-read the current parameter values, e.g. after they were edited by hand.
+        for i, (param, _) in enumerate(self.targets):
+            value = np.atleast_1d(param.value)
+            self.values[2 * i]     = value[0]
+            self.values[2 * i + 1] = value[1] if len(value) > 1 else 0
+        self.applied[:] = self.values
+
+    def load_sources(self, face):
+        raw = self.raw
+        raw[0:3] = face.euler
+        raw[3:5] = face.eye_blink
+        raw[5:5 + len(face.features)] = face.features
+
+    def set_interval(self, dt):
+        # alpha = 1 - (1 - smoothing) ** (dt * REFERENCE_FPS)
+        np.power(self.retain, dt * REFERENCE_FPS, out=self.alpha)
+        np.subtract(1, self.alpha, out=self.alpha)
+
+    def evaluate(self):
+        target = self.target
+        np.take(self.sources, self.source_index, out=target)
+        np.subtract(target, self.origin, out=target)
+        np.mod(target, self.wrap, out=target, where=self.has_wrap)
+        magnitude = self.magnitude
+        # Dead zone: shrink |v| by the dead zone width, keeping the sign.
+        np.abs(target, out=magnitude)
+        np.subtract(magnitude, self.deadzone, out=magnitude)
+        np.maximum(magnitude, 0, out=magnitude)
+        np.copysign(magnitude, target, out=target)
+        np.multiply(target, self.scale, out=target)
+        # Response curve: sign(v) * |v| ** curve
+        np.abs(target, out=magnitude)
+        np.power(magnitude, self.curve, out=magnitude)
+        np.copysign(magnitude, target, out=target)
+        np.add(target, self.offset, out=target)
+        np.clip(target, self.lower, self.upper, out=target)
+
+        # values += (target - values) * alpha
+        np.subtract(target, self.values, out=self.delta)
+        np.multiply(self.delta, self.alpha, out=self.delta)
+        np.add(self.values, self.delta, out=self.values)
+
+        np.subtract(self.values, self.applied, out=self.delta)
+        np.abs(self.delta, out=self.delta)
+        np.greater(self.delta, self.EPSILON, out=self.moved)
+        np.any(self.moved.reshape((-1, 2)), axis=1, out=self.changed)
+        return np.flatnonzero(self.changed)
+
+    def update(self, face, now):
+        # face is the latest tracker sample, now the render time on the same perf_counter clock.
+        # Returns the number of parameters that were written.
+        if not self.targets:
+            return 0
+        if face.seq != self.face_seq:
+            self.face_seq = face.seq
+            self.load_sources(face)
+            self.filter.update(self.raw, face.timestamp, now)
+        self.filter.sample(now, self.sources)
+        if self.frame_time is not None:
+            self.set_interval(now - self.frame_time)
+        self.frame_time = now
+        changed = self.evaluate()
+        for i in changed:
+            param, list_item = self.targets[i]
+            value = (float(self.values[2 * i]), float(self.values[2 * i + 1]))
+            param.value = value
+            self.applied[2 * i:2 * i + 2] = self.values[2 * i:2 * i + 2]
+            list_item.setValue(value)
+        return len(changed)
@@ -0,0 +1,217 @@
+import numpy as np
+
+
+def edges_from_triangles(triangles):
+    # Unique undirected edges (a < b) of a triangle list, sorted by (a, b).
+    if triangles is None or len(triangles) == 0:
+        return np.zeros((0, 2), dtype=np.ushort)
+    triangles = np.asarray(triangles).reshape((-1, 3))
+    edges = triangles[:, [0, 1, 1, 2, 0, 2]].reshape((-1, 2))
+    edges = np.sort(edges, axis=1)
+    return np.unique(edges, axis=0).astype(np.ushort)
+
+
+def triangles_from_edges(edges):
+    # Every triangle (a < b < c) whose three edges are present, sorted by (a, b, c).
+    # For each edge (a, b) the candidates c are the later neighbours of a, i.e. the rest of a's run in the sorted
+    # edge list, and each candidate is kept if (b, c) is an edge too; that is O(E * d) work for E edges of degree d,
+    # done in a few vectorized passes.
+    if edges is None or len(edges) == 0:
+        return np.zeros((0, 3), dtype=np.ushort)
+    edges = np.unique(np.sort(np.asarray(edges, dtype=np.int64).reshape((-1, 2)), axis=1), axis=0)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    if len(edges) == 0:
+        return np.zeros((0, 3), dtype=np.ushort)
+    n = int(edges.max()) + 1
+    keys = edges[:, 0] * n + edges[:, 1]
+    # End of each edge's run of edges sharing the same first vertex.
+    run_end = np.searchsorted(edges[:, 0], edges[:, 0], side="right")
+    counts  = run_end - np.arange(len(edges)) - 1
+    total   = int(np.sum(counts))
+    if total == 0:
+        return np.zeros((0, 3), dtype=np.ushort)
+    first   = np.repeat(np.arange(len(edges)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    second  = first + offsets
+    b = edges[first, 1]
+    c = edges[second, 1]
+    wanted = b * n + c
+    found  = np.searchsorted(keys, wanted)
+    found  = np.minimum(found, len(keys) - 1)
+    hit    = keys[found] == wanted
+    triangles = np.stack([edges[first, 0][hit], b[hit], c[hit]], axis=1)
+    return triangles.astype(np.ushort)
+
+
+class MeshTopology:
+    # Edge graph of a mesh being edited, with the triangles it implies kept up to date incrementally.
+    # Toggling a link only visits the common neighbours of its two ends; the flat arrays for drawing and for
+    # inochi2d are materialized on demand and cached until the next change.
+    def __init__(self, links=None):
+        self.adjacency = {}
+        self.triangles = set()
+        self.edge_count = 0
+        self._links     = None
+        self._triangles = None
+        if links is not None and len(links) > 0:
+            links = np.unique(np.sort(np.asarray(links, dtype=np.int64).reshape((-1, 2)), axis=1), axis=0)
+            for a, b in links.tolist():
+                if a != b:
+                    self.adjacency.setdefault(a, set()).add(b)
+                    self.adjacency.setdefault(b, set()).add(a)
+                    self.edge_count += 1
+            self.triangles = set(map(tuple, triangles_from_edges(links).tolist()))
+
+    @classmethod
+    def from_triangles(cls, triangles):
+        return cls(edges_from_triangles(triangles))
+
+    def _changed(self):
+        self._links     = None
+        self._triangles = None
+
+    def has_link(self, a, b):
+        return b in self.adjacency.get(a, ())
+
+    def add_link(self, a, b):
+        if a == b or self.has_link(a, b):
+            return False
+        adjacency_a = self.adjacency.setdefault(a, set())
+        adjacency_b = self.adjacency.setdefault(b, set())
+        for c in adjacency_a & adjacency_b:
+            self.triangles.add(tuple(sorted((a, b, c))))
+        adjacency_a.add(b)
+        adjacency_b.add(a)
+        self.edge_count += 1
+        self._changed()
+        return True
+
+    def remove_link(self, a, b):
+        if not self.has_link(a, b):
+            return False
+        adjacency_a = self.adjacency[a]
+        adjacency_b = self.adjacency[b]
+        adjacency_a.discard(b)
+        adjacency_b.discard(a)
+        for c in adjacency_a & adjacency_b:
+            self.triangles.discard(tuple(sorted((a, b, c))))
+        self.edge_count -= 1
+        self._changed()
+        return True
+
+    def toggle_link(self, a, b):
+        # Returns True if the link was added, False if it was removed.
+        if self.remove_link(a, b):
+            return False
+        return self.add_link(a, b)
+
+    def remove_vertex(self, v):
+        # Drops every link of v together with the triangles they bound.
+        for u in list(self.adjacency.get(v, ())):
+            self.remove_link(v, u)
+        self.adjacency.pop(v, None)
+
+    def triangles_at(self, v):
+        # Triangles (a < b < c) containing v, from the links between its neighbours.
+        neighbours = self.adjacency.get(v, set())
+        return [tuple(sorted((v, u, w))) for u in neighbours for w in self.adjacency[u] & neighbours if u < w]
+
+    def links(self):
+        # (E, 2) array of links (a < b), sorted.
+        if self._links is None:
+            links = [(a, b) for a, neighbours in self.adjacency.items() for b in neighbours if a < b]
+            links = np.array(sorted(links), dtype=np.ushort).reshape((-1, 2))
+            self._links = links
+        return self._links
+
+    def triangle_array(self):
+        # (T, 3) array of triangles (a < b < c), sorted.
+        if self._triangles is None:
+            self._triangles = np.array(sorted(self.triangles), dtype=np.ushort).reshape((-1, 3))
+        return self._triangles
+
+
+class EditableMesh:
+    # Vertices and links of a mesh under edit, in slot arrays with spare capacity and a free list, so that adding
+    # or removing a vertex and toggling a link are O(1) amortized (plus the vertex's degree for removal).
+    # Slots of removed vertices stay in place until materialize() compacts everything into the flat arrays
+    # inochi2d expects; editing code, selections and the VertexGrid all work in slot indices.
+    def __init__(self, verts, deformation=None, triangles=None):
+        n = len(verts)
+        capacity = max(16, n)
+        self._verts       = np.zeros((capacity, 2), dtype=np.float32)
+        self._deformation = np.zeros((capacity, 2), dtype=np.float32)
+        self._alive       = np.zeros((capacity,), dtype=bool)
+        self._verts[:n] = np.asarray(verts).reshape((-1, 2))
+        if deformation is not None and len(deformation) == n:
+            self._deformation[:n] = np.asarray(deformation).reshape((-1, 2))
+        self._alive[:n] = True
+        self.size     = n
+        self.free     = []
+        self.topology = MeshTopology.from_triangles(triangles)
+
+    def __len__(self):
+        # Number of live vertices.
+        return self.size - len(self.free)
+
+    @property
+    def verts(self):
+        return self._verts[:self.size]
+
+    @verts.setter
+    def verts(self, value):
+        self._verts[:self.size] = value
+
+    @property
+    def deformation(self):
+        return self._deformation[:self.size]
+
+    @property
+    def alive(self):
+        return self._alive[:self.size]
+
+    def _grow(self):
+        capacity = 2 * len(self._verts)
+        for name in ("_verts", "_deformation", "_alive"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add_vertex(self, position, deformation=(0, 0)):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.size == len(self._verts):
+                self._grow()
+            slot = self.size
+            self.size += 1
+        self._verts[slot]       = position[0:2]
+        self._deformation[slot] = deformation
+        self._alive[slot]       = True
+        return slot
+
+    def remove_vertex(self, slot):
+        if not self._alive[slot]:
+            return
+        self.topology.remove_vertex(slot)
+        self._alive[slot] = False
+        self.free.append(slot)
+
+    def toggle_link(self, a, b):
+        return self.topology.toggle_link(a, b)
+
+    def links(self):
+        return self.topology.links()
+
+    def triangles_at(self, slot):
+        return self.topology.triangles_at(slot)
+
+    def materialize(self):
+        # Returns (verts, deformation, triangles) with removed slots squeezed out and indices remapped.
+        alive = self.alive
+        remap = (np.cumsum(alive) - 1).astype(np.ushort)
+        triangles = self.topology.triangle_array()
+        return (np.ascontiguousarray(self.verts[alive]),
+                np.ascontiguousarray(self.deformation[alive]),
+                remap[triangles].reshape((-1, 3)).astype(np.ushort))
@@ -0,0 +1,322 @@
+import os
+import stat
+import time
+import ctypes
+import struct
+import threading
+import subprocess
+import collections
+import queue
+import traceback
+import numpy as np
+import cv2
+from OpenGL import GL
+
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".webm")
+RAW_EXTENSIONS   = (".raw", ".rgba")
+
+
+class PixelReadback:
+    # Reads back the current framebuffer through a ring of pixel buffer objects.
+    # capture() queues an asynchronous glReadPixels into one PBO and returns the frame queued
+    # len(pbos) - 1 captures ago, mapped only once its fence has signalled, so the CPU never
+    # stalls on the GPU. A frame whose transfer has not finished in time is dropped unless wait is set.
+    def __init__(self, width, height, count=2):
+        self.width   = width
+        self.height  = height
+        self.count   = count
+        self.size    = width * height * 4
+        self.pbos    = None
+        self.pending = [None] * count
+        self.index   = 0
+        self.free    = queue.SimpleQueue()
+        self.dropped = 0
+        self.frames  = 0
+        self.latency = 0.
+        self.max_latency = 0.
+
+    def _create(self):
+        self.pbos = [int(pbo) for pbo in np.atleast_1d(GL.glGenBuffers(self.count))]
+        for pbo in self.pbos:
+            GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo)
+            GL.glBufferData(GL.GL_PIXEL_PACK_BUFFER, self.size, None, GL.GL_STREAM_READ)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+    def resize(self, width, height):
+        # Frames still in flight at the old size are discarded.
+        if (width, height) == (self.width, self.height):
+            return
+        self.delete()
+        self.width  = width
+        self.height = height
+        self.size   = width * height * 4
+        self.free   = queue.SimpleQueue()
+
+    def delete(self):
+        for i, pending in enumerate(self.pending):
+            if pending is not None:
+                GL.glDeleteSync(pending[0])
+                self.pending[i] = None
+        if self.pbos:
+            GL.glDeleteBuffers(len(self.pbos), self.pbos)
+            self.pbos = None
+
+    def release(self, frame):
+        # Hand a frame returned by capture() back for reuse.
+        if frame.base is not None and frame.base.nbytes == self.size:
+            self.free.put(frame.base)
+
+    def _buffer(self):
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            return np.empty((self.height, self.width, 4), dtype=np.uint8)
+
+    def capture(self, timestamp=None, wait=False):
+        # Returns (frame, timestamp) for an earlier capture, or None. frame is bottom-up flipped to top-down.
+        if self.pbos is None:
+            self._create()
+        i = self.index
+        if self.pending[i] is not None:
+            # Still unread after a full cycle; collect it before its PBO is reused.
+            self._collect(i, True)
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self.pbos[i])
+        GL.glReadPixels(0, 0, self.width, self.height, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        fence = GL.glFenceSync(GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        self.pending[i] = (fence, time.perf_counter(), timestamp)
+        self.index = (i + 1) % self.count
+        return self._collect(self.index, wait)
+
+    def flush(self):
+        # Collects every transfer still in flight, oldest first.
+        frames = []
+        for k in range(self.count):
+            result = self._collect((self.index + k) % self.count, True)
+            if result is not None:
+                frames.append(result)
+        return frames
+
+    def _collect(self, i, wait):
+        pending = self.pending[i]
+        if pending is None:
+            return None
+        fence, issued, timestamp = pending
+        status = GL.glClientWaitSync(fence, GL.GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000 if wait else 0)
+        self.pending[i] = None
+        GL.glDeleteSync(fence)
+        if status not in (GL.GL_ALREADY_SIGNALED, GL.GL_CONDITION_SATISFIED):
+            self.dropped += 1
+            return None
+        buffer = self._buffer()
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self.pbos[i])
+        ptr = GL.glMapBufferRange(GL.GL_PIXEL_PACK_BUFFER, 0, self.size, GL.GL_MAP_READ_BIT)
+        ctypes.memmove(buffer.ctypes.data, ptr, self.size)
+        GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+        latency = time.perf_counter() - issued
+        self.latency += (latency - self.latency) * 0.1
+        self.max_latency = max(self.max_latency, latency)
+        self.frames += 1
+        return buffer[::-1], timestamp
+
+
+class OutputSink:
+    # Encodes frames on a worker thread. With drop_frames the oldest queued frame is discarded when the
+    # encoder falls behind, otherwise submit() blocks until there is room.
+    def __init__(self, fps=30, drop_frames=True, queue_size=3):
+        self.fps         = fps
+        self.drop_frames = drop_frames
+        self.queue_size  = queue_size
+        self.frames      = collections.deque()
+        self.cond        = threading.Condition()
+        self.closed      = False
+        self.started     = False
+        self.dropped     = 0
+        self.written     = 0
+        self.encode_time = 0.
+        self.thread      = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame, timestamp=None, release=None):
+        with self.cond:
+            if self.drop_frames:
+                while len(self.frames) >= self.queue_size:
+                    old_frame, _, old_release = self.frames.popleft()
+                    self.dropped += 1
+                    if old_release:
+                        old_release(old_frame)
+            else:
+                while len(self.frames) >= self.queue_size and not self.closed:
+                    self.cond.wait(0.1)
+            self.frames.append((frame, timestamp, release))
+            self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.frames and not self.closed:
+                    self.cond.wait()
+                if not self.frames:
+                    break
+                frame, timestamp, release = self.frames.popleft()
+                self.cond.notify_all()
+            try:
+                if not self.started:
+                    self.start(frame.shape[1], frame.shape[0])
+                    self.started = True
+                start = time.perf_counter()
+                self.encode(frame, timestamp)
+                self.encode_time += (time.perf_counter() - start - self.encode_time) * 0.1
+                self.written += 1
+            except Exception:
+                traceback.print_exc()
+            finally:
+                if release:
+                    release(frame)
+        if self.started:
+            self.finish()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def start(self, width, height):
+        pass
+
+    def encode(self, frame, timestamp):
+        pass
+
+    def finish(self):
+        pass
+
+
+class RawFileSink(OutputSink):
+    # Appends tightly packed RGBA frames to a single file.
+    def __init__(self, path, **kwargs):
+        self.path = path
+        super(RawFileSink, self).__init__(**kwargs)
+
+    def start(self, width, height):
+        self.file = open(self.path, "wb")
+
+    def encode(self, frame, timestamp):
+        self.file.write(np.ascontiguousarray(frame).data)
+
+    def finish(self):
+        self.file.close()
+
+
+class PngSequenceSink(OutputSink):
+    def __init__(self, path, **kwargs):
+        self.path  = path
+        self.index = 0
+        super(PngSequenceSink, self).__init__(**kwargs)
+
+    def start(self, width, height):
+        os.makedirs(self.path, exist_ok=True)
+
+    def encode(self, frame, timestamp):
+        cv2.imwrite(os.path.join(self.path, "frame_%06d.png"%self.index), cv2.cvtColor(frame, cv2.COLOR_RGBA2BGRA))
+        self.index += 1
+
+
+class FfmpegSink(OutputSink):
+    # Pipes raw RGBA frames into an ffmpeg process; args are passed to ffmpeg before the output path.
+    def __init__(self, path, args=("-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p"), **kwargs):
+        self.path = path
+        self.args = list(args)
+        super(FfmpegSink, self).__init__(**kwargs)
+
+    def start(self, width, height):
+        command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba",
+                   "-s", "%dx%d"%(width, height), "-r", str(self.fps), "-i", "-"] + self.args + [self.path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def encode(self, frame, timestamp):
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def finish(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class V4l2Sink(OutputSink):
+    # Writes frames to a v4l2loopback output device. When path is a regular file (a stand-in for the
+    # device) the converted frames are simply appended to it.
+    VIDIOC_S_FMT = 0xC0D05605
+    V4L2_BUF_TYPE_VIDEO_OUTPUT = 2
+    V4L2_FIELD_NONE = 1
+    FORMATS = {
+        "YU12":  (cv2.COLOR_RGBA2YUV_I420, lambda w, h: (w, w * h * 3 // 2)),
+        "BGR3":  (cv2.COLOR_RGBA2BGR, lambda w, h: (w * 3, w * h * 3)),
+        "RGB3":  (cv2.COLOR_RGBA2RGB, lambda w, h: (w * 3, w * h * 3)),
+    }
+
+    def __init__(self, path, pixel_format="YU12", **kwargs):
+        self.path         = path
+        self.pixel_format = pixel_format
+        super(V4l2Sink, self).__init__(**kwargs)
+
+    def start(self, width, height):
+        self.file = open(self.path, "wb", buffering=0)
+        conversion, layout = self.FORMATS[self.pixel_format]
+        self.conversion = conversion
+        if stat.S_ISCHR(os.fstat(self.file.fileno()).st_mode):
+            # Imported here: fcntl only exists on POSIX, and output is imported by the GUI on every platform.
+            import fcntl
+            bytes_per_line, size_image = layout(width, height)
+            fourcc = struct.unpack("<I", self.pixel_format.encode("ascii"))[0]
+            pix = struct.pack("<IIIIIIII", width, height, fourcc, self.V4L2_FIELD_NONE, bytes_per_line, size_image, 0, 0)
+            fmt = struct.pack("<II", self.V4L2_BUF_TYPE_VIDEO_OUTPUT, 0) + pix.ljust(200, b"\0")
+            fcntl.ioctl(self.file.fileno(), self.VIDIOC_S_FMT, fmt)
+
+    def encode(self, frame, timestamp):
+        self.file.write(cv2.cvtColor(np.ascontiguousarray(frame), self.conversion).data)
+
+    def finish(self):
+        self.file.close()
+
+
+def create_sink(path, fps=30, drop_frames=True):
+    lower = path.lower()
+    if lower.startswith("/dev/video"):
+        return V4l2Sink(path, fps=fps, drop_frames=drop_frames)
+    elif lower.endswith(RAW_EXTENSIONS):
+        return RawFileSink(path, fps=fps, drop_frames=drop_frames)
+    elif lower.endswith(VIDEO_EXTENSIONS):
+        return FfmpegSink(path, fps=fps, drop_frames=drop_frames)
+    return PngSequenceSink(path, fps=fps, drop_frames=drop_frames)
+
+
+class FrameOutput:
+    # Readback plus sink, driven once per rendered frame.
+    def __init__(self, sink, width, height, wait=False):
+        self.sink     = sink
+        self.readback = PixelReadback(width, height)
+        self.wait     = wait
+
+    def capture(self, width, height, timestamp=None):
+        self.readback.resize(width, height)
+        result = self.readback.capture(timestamp, self.wait)
+        if result is not None:
+            self.sink.submit(result[0], result[1], self.readback.release)
+
+    @property
+    def dropped(self):
+        return self.readback.dropped + self.sink.dropped
+
+    @property
+    def latency(self):
+        return self.readback.latency
+
+    def close(self):
+        for frame, timestamp in self.readback.flush():
+            self.sink.submit(frame, timestamp, self.readback.release)
+        self.readback.delete()
+        self.sink.close()
@@ -0,0 +1,82 @@
+import gc
+import time
+
+
+class FrameScheduler:
+    PACING_DEADLINE = "deadline"
+    PACING_CAMERA   = "camera"
+
+    # Capture clock correction, applied by sync() once per frame to the error between the capture time of the
+    # frame and when the loop woke up for it. DRIFT_GAIN is the fraction of that error added to the next
+    # deadline (phase); RATE_GAIN the fraction added to the period (rate), so that a camera whose clock runs
+    # slightly fast or slow is tracked with no steady-state offset. With these gains the error decays by about
+    # 5% per frame. The period never moves more than MAX_RATE_ADJUST of the target, so a camera running at a
+    # different frame rate cannot drag the tracker's rate with it; errors of a frame or more are ignored.
+    DRIFT_GAIN      = 0.1
+    RATE_GAIN       = 0.01
+    MAX_RATE_ADJUST = 0.05
+
+    # Idle time before a deadline that is worth a young-generation collection; gc_slack=None never collects.
+    GC_SLACK = 0.004
+
+    def __init__(self, fps, pacing=PACING_DEADLINE, gc_slack=GC_SLACK):
+        self.target_duration = 1. / float(fps) if fps > 0 else 0
+        self.period          = self.target_duration
+        self.pacing          = pacing
+        self.gc_slack        = gc_slack
+        self.deadline        = None
+        self.frame_start     = None
+        self.jitter          = 0.
+        self.max_jitter      = 0.
+        self.late_frames     = 0
+
+    def paced(self):
+        return self.pacing == self.PACING_DEADLINE and self.target_duration > 0
+
+    def start(self):
+        now = time.perf_counter()
+        self.deadline    = now + self.target_duration
+        self.frame_start = now
+
+    def sync(self, capture_time):
+        # Pull the deadlines towards the camera's own cadence so that frames are picked up right after capture.
+        # Positive error means we woke up before the frame was captured, negative error that it was waiting.
+        if not self.paced() or self.frame_start is None:
+            return
+        error = capture_time - self.frame_start
+        if abs(error) >= self.target_duration:
+            return
+        self.deadline += error * self.DRIFT_GAIN
+        limit = self.target_duration * self.MAX_RATE_ADJUST
+        self.period = min(max(self.period + error * self.RATE_GAIN, self.target_duration - limit), self.target_duration + limit)
+
+    def wait(self):
+        if self.deadline is None:
+            self.start()
+            return
+        if self.paced():
+            now = time.perf_counter()
+            slack = self.deadline - now
+            if self.gc_slack is not None and slack > self.gc_slack:
+                # Spend idle time on the young generation only, instead of a full collection per frame.
+                gc.collect(0)
+                slack = self.deadline - time.perf_counter()
+            if slack > 0:
+                time.sleep(slack)
+            now = time.perf_counter()
+            if now - self.deadline > self.target_duration:
+                # More than a frame behind: re-anchor instead of bursting to catch up.
+                self.late_frames += 1
+                self.deadline = now
+            self.deadline += self.period
+        now = time.perf_counter()
+        interval = now - self.frame_start
+        self.frame_start = now
+        if self.target_duration > 0:
+            deviation = abs(interval - self.target_duration)
+            self.jitter += (deviation - self.jitter) * 0.1
+            self.max_jitter = max(self.max_jitter, deviation)
+
+    def reset_stats(self):
+        self.max_jitter  = 0.
+        self.late_frames = 0
@@ -0,0 +1,191 @@
+import numpy as np
+
+
+FILTER_TYPES = ["none", "one_euro", "kalman"]
+SAMPLE_MODES = ["extrapolate", "interpolate", "hold"]
+DEFAULT_FILTER = {"type": "one_euro"}
+# Tuning keys each filter type accepts, besides "type" and "mode".
+FILTER_KEYS = {
+    "none":     [],
+    "one_euro": ["min_cutoff", "beta", "d_cutoff"],
+    "kalman":   ["process_noise", "measurement_noise"],
+}
+
+
+class FeatureFilter:
+    # Filters all tracked values at once, driven by the tracker's capture timestamps rather than render frames,
+    # and resamples the filtered signal at render time.
+    # Values are normalized by units (angles are divided by 30 degrees, like the default mapping) so that one set
+    # of tuning constants fits both euler angles and the 0..1 features. The first `angles` entries are unwrapped
+    # so that a jump across +-180 degrees is filtered as the small step it really is.
+    # latency is a running average of how long samples take from capture until they reach update(); interpolate
+    # uses it to line render time up with the capture clock.
+    RESET_AFTER  = 1.0
+    LATENCY_GAIN = 0.1
+
+    def __init__(self, n, angles=3, mode="extrapolate"):
+        self.n        = n
+        self.angles   = angles
+        self.mode     = mode
+        self.units    = np.ones((n,), dtype=np.float64)
+        self.units[:angles] = 1 / 30
+        self.value    = np.zeros((n,), dtype=np.float64)
+        self.velocity = np.zeros((n,), dtype=np.float64)
+        self.previous = np.zeros((n,), dtype=np.float64)
+        self.input    = np.zeros((n,), dtype=np.float64)
+        self.time          = None
+        self.previous_time = None
+        self.interval      = 0.
+        self.latency       = 0.
+
+    def reset(self):
+        self.time = None
+
+    def update(self, raw, t, arrival=None):
+        # t is the capture time of raw, arrival when it became available on the render clock.
+        x = self.input
+        np.copyto(x, raw)
+        if self.time is not None:
+            # Unwrap angles against the last filtered value.
+            last = self.value[:self.angles] / self.units[:self.angles]
+            x[:self.angles] = last + (x[:self.angles] - last + 180) % 360 - 180
+        x *= self.units
+        reset = self.time is None or t - self.time > self.RESET_AFTER
+        if arrival is not None:
+            if reset:
+                self.latency = arrival - t
+            else:
+                self.latency += (arrival - t - self.latency) * self.LATENCY_GAIN
+        if reset:
+            self.value[:]    = x
+            self.previous[:] = x
+            self.velocity[:] = 0
+            self.previous_time = self.time = t
+            self.interval = 0.
+            self._reset_state(x)
+            return
+        dt = t - self.time
+        if dt <= 0:
+            return
+        np.copyto(self.previous, self.value)
+        self._filter(x, dt)
+        self.previous_time = self.time
+        self.time          = t
+        self.interval      = dt
+
+    def sample(self, t, out):
+        # Resample the filtered signal at render time t into out.
+        if self.time is None:
+            return out
+        if self.mode == "extrapolate" and self.interval > 0:
+            ahead = min(max(t - self.time, 0.), self.interval)
+            np.multiply(self.velocity, ahead, out=out)
+            np.add(out, self.value, out=out)
+        elif self.mode == "interpolate" and self.interval > 0:
+            # Render one sample interval behind the newest sample as it arrives, so that there is always a sample on
+            # both sides: the previous sample is shown when the newest one arrives and the newest one is reached
+            # when the next is due.
+            alpha = min(max((t - self.latency - self.time) / self.interval, 0.), 1.)
+            np.subtract(self.value, self.previous, out=out)
+            np.multiply(out, alpha, out=out)
+            np.add(out, self.previous, out=out)
+        else:
+            np.copyto(out, self.value)
+        np.divide(out, self.units, out=out)
+        return out
+
+    def _reset_state(self, x):
+        pass
+
+    def _filter(self, x, dt):
+        self.velocity[:] = (x - self.value) / dt
+        self.value[:]    = x
+
+
+class OneEuroFilter(FeatureFilter):
+    # Casiez et al., "1 Euro Filter": a low-pass filter whose cutoff rises with the (filtered) speed.
+    def __init__(self, n, angles=3, mode="extrapolate", min_cutoff=1.0, beta=5.0, d_cutoff=1.0):
+        super(OneEuroFilter, self).__init__(n, angles, mode)
+        self.min_cutoff = min_cutoff
+        self.beta       = beta
+        self.d_cutoff   = d_cutoff
+
+    @staticmethod
+    def _alpha(dt, cutoff):
+        return 1 / (1 + 1 / (2 * np.pi * cutoff * dt))
+
+    def _filter(self, x, dt):
+        dx = (x - self.value) / dt
+        self.velocity += self._alpha(dt, self.d_cutoff) * (dx - self.velocity)
+        cutoff = self.min_cutoff + self.beta * np.abs(self.velocity)
+        self.value += self._alpha(dt, cutoff) * (x - self.value)
+
+
+class KalmanFilter(FeatureFilter):
+    # Independent constant-velocity Kalman filters, one per value, sharing dt.
+    def __init__(self, n, angles=3, mode="extrapolate", process_noise=5.0, measurement_noise=0.001):
+        super(KalmanFilter, self).__init__(n, angles, mode)
+        self.q   = process_noise
+        self.r   = measurement_noise
+        self.p00 = np.zeros((n,), dtype=np.float64)
+        self.p01 = np.zeros((n,), dtype=np.float64)
+        self.p11 = np.zeros((n,), dtype=np.float64)
+
+    def _reset_state(self, x):
+        self.p00[:] = self.r
+        self.p01[:] = 0
+        self.p11[:] = self.q
+
+    def _filter(self, x, dt):
+        # Predict
+        self.value += self.velocity * dt
+        self.p00 += dt * (2 * self.p01 + dt * self.p11) + self.q * dt ** 3 / 3
+        self.p01 += dt * self.p11 + self.q * dt ** 2 / 2
+        self.p11 += self.q * dt
+        # Update
+        s  = self.p00 + self.r
+        k0 = self.p00 / s
+        k1 = self.p01 / s
+        y  = x - self.value
+        self.value    += k0 * y
+        self.velocity += k1 * y
+        self.p11 -= k1 * self.p01
+        self.p01 *= 1 - k0
+        self.p00 *= 1 - k0
+
+
+def validate_filter(config):
+    errors = []
+    if not isinstance(config, dict):
+        raise ValueError("filter must be an object")
+    kind = config.get("type", "one_euro")
+    if kind not in FILTER_TYPES:
+        errors.append("filter: unknown type '%s'"%kind)
+    if config.get("mode", "extrapolate") not in SAMPLE_MODES:
+        errors.append("filter: unknown mode '%s'"%config.get("mode"))
+    allowed = FILTER_KEYS.get(kind, [])
+    for key in config:
+        if key in ("type", "mode"):
+            continue
+        if key not in allowed:
+            errors.append("filter: unknown key '%s' for type '%s'"%(key, kind))
+        elif not isinstance(config[key], (int, float)) or isinstance(config[key], bool) or config[key] < 0:
+            errors.append("filter: '%s' must be a non-negative number"%key)
+    for key in ("min_cutoff", "d_cutoff", "measurement_noise"):
+        if config.get(key, 1) == 0:
+            errors.append("filter: '%s' must be positive"%key)
+    if errors:
+        raise ValueError("\n".join(errors))
+
+
+def create_filter(n, config=DEFAULT_FILTER):
+    # Raises ValueError for a config validate_filter rejects.
+    validate_filter(config)
+    config = dict(config)
+    kind = config.pop("type", "one_euro")
+    mode = config.pop("mode", "extrapolate")
+    if kind == "one_euro":
+        return OneEuroFilter(n, mode=mode, **config)
+    elif kind == "kalman":
+        return KalmanFilter(n, mode=mode, **config)
+    return FeatureFilter(n, mode="hold")
@@ -0,0 +1,134 @@
+import numpy as np
+
+
+class VertexGrid:
+    # Uniform grid over 2D points for radius picks and rectangle selection.
+    # Points are bucketed by cell and stored sorted by cell key, so the points of one row of cells are a single
+    # contiguous run found with searchsorted; a query only touches the cells it overlaps and the points in them.
+    # Points moved after the build are detached from their bucket and kept in a small loose list that is
+    # tested exhaustively, and the grid is rebuilt once that list grows past REBUILD_FRACTION of the points.
+    # Indices may be removed and re-added (e.g. the slots of an EditableMesh); removed points are never returned.
+    POINTS_PER_CELL  = 2
+    REBUILD_FRACTION = 0.25
+
+    def __init__(self, points, cell_size=None):
+        self.cell_size = cell_size
+        self.build(points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def build(self, points, alive=None):
+        self.points = np.array(points, dtype=np.float64).reshape((-1, 2))
+        n = len(self.points)
+        self.alive = np.ones((n,), dtype=bool) if alive is None else np.array(alive, dtype=bool)
+        live = np.flatnonzero(self.alive)
+        if len(live) > 0:
+            self.origin = np.min(self.points[live], axis=0)
+            extent = np.max(self.points[live], axis=0) - self.origin
+        else:
+            self.origin = np.zeros((2,), dtype=np.float64)
+            extent = np.zeros((2,), dtype=np.float64)
+        cell = self.cell_size
+        if not cell:
+            # Aim for a few points per cell on average, whatever the mesh density.
+            area = max(extent[0], 1e-6) * max(extent[1], 1e-6)
+            cell = np.sqrt(area * self.POINTS_PER_CELL / max(len(live), 1))
+        self.cell    = max(float(cell), 1e-6)
+        self.columns = int(extent[0] // self.cell) + 1
+        self.rows    = int(extent[1] // self.cell) + 1
+        keys = self._keys(self.points[live])
+        order = np.argsort(keys, kind="stable")
+        self.order    = live[order]
+        self.keys     = keys[order]
+        self.detached = np.zeros((n,), dtype=bool)
+        self.loose    = np.zeros((0,), dtype=np.intp)
+
+    def _cells(self, points):
+        cells = np.floor((points - self.origin) / self.cell).astype(np.int64)
+        cells[:, 0] = np.clip(cells[:, 0], 0, self.columns - 1)
+        cells[:, 1] = np.clip(cells[:, 1], 0, self.rows - 1)
+        return cells
+
+    def _keys(self, points):
+        cells = self._cells(points)
+        return cells[:, 1] * self.columns + cells[:, 0]
+
+    def update(self, indices, points):
+        # Move the given points. Only they are touched unless the loose list has grown large enough to rebuild.
+        # Indices past the end add new points.
+        indices = np.asarray(indices, dtype=np.intp).ravel()
+        if len(indices) == 0:
+            return
+        if indices.max() >= len(self.points):
+            self._grow(int(indices.max()) + 1)
+        self.points[indices] = np.asarray(points, dtype=np.float64).reshape((-1, 2))
+        self.alive[indices] = True
+        fresh = indices[~self.detached[indices]]
+        self.detached[indices] = True
+        if len(fresh) > 0:
+            self.loose = np.concatenate([self.loose, np.unique(fresh)])
+        if len(self.loose) > self.REBUILD_FRACTION * max(len(self.order), 1):
+            self.build(self.points, self.alive)
+
+    def remove(self, indices):
+        self.alive[np.asarray(indices, dtype=np.intp)] = False
+
+    def _grow(self, size):
+        capacity = max(size, 2 * len(self.points))
+        extra = capacity - len(self.points)
+        self.points   = np.concatenate([self.points, np.zeros((extra, 2), dtype=np.float64)])
+        self.alive    = np.concatenate([self.alive, np.zeros((extra,), dtype=bool)])
+        self.detached = np.concatenate([self.detached, np.zeros((extra,), dtype=bool)])
+
+    def sync(self, points):
+        # Bring the grid up to date with points, updating only those that moved; rebuilds if the count changed.
+        points = np.asarray(points).reshape((-1, 2))
+        if len(points) != len(self.points):
+            self.build(points)
+            return
+        moved = np.flatnonzero(np.any(points != self.points, axis=1))
+        self.update(moved, points[moved])
+
+    def _candidates(self, lower, upper):
+        if len(self.order) == 0:
+            return self.loose[self.alive[self.loose]]
+        cells = self._cells(np.array([lower, upper], dtype=np.float64))
+        (x0, y0), (x1, y1) = cells
+        rows  = np.arange(y0, y1 + 1, dtype=np.int64) * self.columns
+        start = np.searchsorted(self.keys, rows + x0, side="left")
+        end   = np.searchsorted(self.keys, rows + x1, side="right")
+        counts = end - start
+        total  = int(np.sum(counts))
+        if total == 0:
+            found = np.zeros((0,), dtype=np.intp)
+        else:
+            # Concatenate the runs [start, end) without a Python loop.
+            offsets = np.repeat(start - np.cumsum(counts) + counts, counts)
+            found   = self.order[np.arange(total) + offsets]
+            found   = found[~self.detached[found]]
+        if len(self.loose) > 0:
+            found = np.concatenate([found, self.loose])
+        return found[self.alive[found]]
+
+    def query_radius(self, center, radius):
+        # Indices of the points strictly closer than radius to center, in ascending order.
+        center = np.asarray(center, dtype=np.float64)[0:2]
+        found  = self._candidates(center - radius, center + radius)
+        delta  = self.points[found] - center
+        hit    = np.einsum("ij,ij->i", delta, delta) < radius * radius
+        return np.sort(found[hit])
+
+    def query_rect(self, corner1, corner2):
+        # Indices of the points inside the rectangle spanned by two corners (inclusive), in ascending order.
+        corners = np.array([np.asarray(corner1)[0:2], np.asarray(corner2)[0:2]], dtype=np.float64)
+        lower, upper = np.min(corners, axis=0), np.max(corners, axis=0)
+        found  = self._candidates(lower, upper)
+        points = self.points[found]
+        hit    = np.all((lower <= points) & (points <= upper), axis=1)
+        return np.sort(found[hit])
+
+    def mask(self, indices, size=None):
+        result = np.zeros((len(self.points) if size is None else size,), dtype=bool)
+        result[indices] = True
+        return result
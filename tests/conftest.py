@@ -0,0 +1,14 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The player's modules import each other as top-level modules (python -m runs them from the checkout).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def rng():
+    # Seeded, so that the randomized comparisons against brute force are reproducible.
+    return np.random.default_rng(1234)
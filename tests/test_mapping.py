@@ -0,0 +1,123 @@
+import json
+
+import numpy as np
+import pytest
+
+from facestate import FEATURE_INDEX, FaceState
+from mapping import DEFAULT_RULES, ParameterMapping, load_profile
+
+
+class Param:
+    def __init__(self, name):
+        self.name  = name
+        self.value = (0., 0.)
+
+
+class ListItem:
+    def setValue(self, value):
+        self.value = value
+
+
+def baseline_value(name, face):
+    # The hard-coded mapping paintGL applied before DEFAULT_RULES, without its smoothing.
+    euler, blink = face.euler.astype(np.float64), face.eye_blink.astype(np.float64)
+    feature = lambda name: float(face.features[FEATURE_INDEX[name]])
+    if name == "Eye:: Left:: Blink":
+        return [1 - blink[0], 0]
+    elif name == "Eye:: Right:: Blink":
+        return [1 - blink[1], 0]
+    elif name == "Mouth:: Shape":
+        return [0.5, feature("mouth_open")]
+    elif name == "Mouth:: Width":
+        return [feature("mouth_wide"), 0]
+    elif name == "Head:: Yaw-Pitch" or name == "Body:: Yaw-Pitch":
+        return [min(1, max(-1, -euler[1]/30)), min(1, max(-1, -(180 - euler[0])%360/30))]
+    elif name == "Head:: Roll" or name == "Body:: Roll":
+        return [min(1, max(-1, (euler[2]-90)/30)), 0]
+
+
+def sample_states(count=200, seed=1234):
+    rng = np.random.default_rng(seed)
+    for seq in range(1, count + 1):
+        face = FaceState()
+        face.seq = seq
+        face.timestamp = face.inference_time = seq / 30
+        face.euler[:] = rng.uniform((140, -60, 40), (220, 60, 140))
+        face.eye_blink[:] = rng.uniform(0, 1, 2)
+        face.features[:] = rng.uniform(0, 1, len(face.features))
+        yield face
+
+
+def test_default_rules_match_baseline():
+    names = [rule["param"] for rule in DEFAULT_RULES]
+    for face in sample_states():
+        # A fresh mapping per state, unsmoothed and unfiltered, so that each value is the rule applied to the state.
+        params = {name: (Param(name), ListItem()) for name in names}
+        mapping = ParameterMapping(params, DEFAULT_RULES, smoothing=1, filter_config={"type": "none"})
+        mapping.update(face, face.timestamp)
+        for name in names:
+            assert list(params[name][0].value) == pytest.approx(baseline_value(name, face), abs=ParameterMapping.EPSILON), name
+
+
+def test_unknown_parameters_are_skipped():
+    params = {"Mouth:: Width": (Param("Mouth:: Width"), ListItem())}
+    mapping = ParameterMapping(params, DEFAULT_RULES, smoothing=1, filter_config={"type": "none"})
+    assert len(mapping) == 1
+
+
+def write_profile(tmp_path, profile):
+    path = tmp_path / "model.mapping.json"
+    path.write_text(json.dumps(profile), encoding="utf-8")
+    return str(path)
+
+
+def test_missing_profile_uses_defaults(tmp_path):
+    rules, smoothing, filter_config = load_profile(str(tmp_path / "missing.mapping.json"))
+    assert rules is DEFAULT_RULES
+
+
+def test_profile_loads(tmp_path):
+    path = write_profile(tmp_path, {"smoothing": 0.25, "parameters": [
+        {"param": "Mouth:: Width", "x": {"source": "mouth_wide", "scale": 2, "min": 0, "max": 1}}]})
+    rules, smoothing, filter_config = load_profile(path)
+    assert smoothing == 0.25
+    assert rules[0]["x"]["scale"] == 2
+
+
+@pytest.mark.parametrize("profile", [
+    [],
+    {"smoothing": 0},
+    {"parameters": [{"param": "Mouth:: Width", "scale": 2}]},
+    {"parameters": [{"param": "Mouth:: Width", "x": {"source": "mouth_wide", "scael": 2}}]},
+    {"parameters": [{"param": "Mouth:: Width", "x": {"source": "mouth_wid"}}]},
+    {"parameters": [{"param": "Mouth:: Width", "x": {"source": "mouth_wide", "min": 1, "max": 0}}]},
+    {"parameters": [{"param": "Mouth:: Width", "x": {"source": "mouth_wide", "curve": "2"}}]},
+])
+def test_bad_profile_raises_value_error(tmp_path, profile):
+    with pytest.raises(ValueError):
+        load_profile(write_profile(tmp_path, profile))
+
+
+@pytest.mark.parametrize("filter_config", [
+    {"type": "kalman", "beta": 1},
+    {"type": "one_euro", "process_noise": 1},
+    {"type": "none", "min_cutoff": 1},
+    {"type": "one_euro", "min_cutof": 1},
+    {"type": "one_euro", "min_cutoff": 0},
+    {"type": "median"},
+    {"mode": "nearest"},
+])
+def test_bad_filter_raises_value_error(tmp_path, filter_config):
+    with pytest.raises(ValueError):
+        load_profile(write_profile(tmp_path, {"filter": filter_config}))
+    # Constructing the mapping directly fails the same way instead of with a constructor TypeError.
+    with pytest.raises(ValueError):
+        ParameterMapping({}, DEFAULT_RULES, filter_config=filter_config)
+
+
+def test_filter_keys_of_each_type_load(tmp_path):
+    for filter_config in ({"type": "one_euro", "mode": "interpolate", "min_cutoff": 0.5, "beta": 2, "d_cutoff": 1},
+                          {"type": "kalman", "process_noise": 2, "measurement_noise": 0.01},
+                          {"type": "none"}):
+        _, _, loaded = load_profile(write_profile(tmp_path, {"filter": filter_config}))
+        ParameterMapping({}, DEFAULT_RULES, filter_config=loaded)
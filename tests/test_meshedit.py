@@ -0,0 +1,108 @@
+import itertools
+
+import numpy as np
+
+from meshedit import EditableMesh, MeshTopology, edges_from_triangles, triangles_from_edges
+
+
+def brute_edges(triangles):
+    # Baseline NodeMeshEditor._tri2edge.
+    edges = np.asarray(triangles)[:, [0, 1, 1, 2, 0, 2]].reshape((-1, 2))
+    return np.unique(np.sort(edges, axis=1), axis=0)
+
+
+def brute_triangles(edges):
+    # Every vertex triple whose three edges are all present.
+    links = set(map(tuple, np.sort(np.asarray(edges), axis=1).tolist()))
+    vertices = sorted({v for link in links for v in link})
+    triangles = [(a, b, c) for a, b, c in itertools.combinations(vertices, 3)
+                 if (a, b) in links and (b, c) in links and (a, c) in links]
+    return np.array(triangles, dtype=np.int64).reshape((-1, 3))
+
+
+def grid_triangles(columns, rows):
+    index = np.arange(columns * rows).reshape((rows, columns))
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    return np.concatenate([np.stack([a, b, c], axis=1), np.stack([b, d, c], axis=1)])
+
+
+def test_edges_from_triangles_matches_baseline():
+    triangles = grid_triangles(6, 5)
+    np.testing.assert_array_equal(edges_from_triangles(triangles), brute_edges(triangles))
+
+
+def test_triangles_from_edges_matches_brute_force(rng):
+    edges = rng.integers(0, 25, (120, 2))
+    np.testing.assert_array_equal(triangles_from_edges(edges), brute_triangles(edges[edges[:, 0] != edges[:, 1]]))
+
+
+def test_toggle_link_matches_rebuild(rng):
+    topology = MeshTopology.from_triangles(grid_triangles(5, 5))
+    links = set(map(tuple, topology.links().tolist()))
+    for _ in range(200):
+        a, b = sorted(int(v) for v in rng.choice(25, 2, replace=False))
+        added = topology.toggle_link(a, b)
+        assert added == ((a, b) not in links)
+        if added:
+            links.add((a, b))
+        else:
+            links.remove((a, b))
+        expected = np.array(sorted(links), dtype=np.int64).reshape((-1, 2))
+        np.testing.assert_array_equal(topology.links(), expected)
+        np.testing.assert_array_equal(topology.triangle_array(), brute_triangles(expected))
+
+
+def test_remove_vertex_drops_its_triangles():
+    topology = MeshTopology.from_triangles(grid_triangles(4, 4))
+    topology.remove_vertex(5)
+    links = topology.links()
+    assert not np.any(links == 5)
+    np.testing.assert_array_equal(topology.triangle_array(), brute_triangles(links))
+    assert topology.triangles_at(5) == []
+
+
+def brute_compact(verts, deformation, triangles, removed):
+    # Baseline NodeMeshEditor vertex removal: drop the vertices, the triangles using them, and renumber.
+    keep = np.setdiff1d(np.arange(len(verts)), removed)
+    remap = np.cumsum(np.isin(np.arange(len(verts)), keep)) - 1
+    triangles = triangles[np.all(np.isin(triangles, keep), axis=1)]
+    return verts[keep], deformation[keep], remap[triangles]
+
+
+def test_materialize_compacts_removed_slots(rng):
+    triangles = grid_triangles(6, 6)
+    verts = rng.uniform(-100, 100, (36, 2)).astype(np.float32)
+    deformation = rng.uniform(-1, 1, (36, 2)).astype(np.float32)
+    mesh = EditableMesh(verts, deformation, triangles)
+    removed = [0, 7, 14, 20, 35]
+    for slot in removed:
+        mesh.remove_vertex(slot)
+    assert len(mesh) == 31
+    expected_verts, expected_deformation, expected_triangles = brute_compact(verts, deformation, triangles, removed)
+    result_verts, result_deformation, result_triangles = mesh.materialize()
+    np.testing.assert_array_equal(result_verts, expected_verts)
+    np.testing.assert_array_equal(result_deformation, expected_deformation)
+    assert np.all(np.diff(result_triangles.astype(np.int64), axis=1) > 0)
+    assert set(map(tuple, result_triangles.tolist())) == set(map(tuple, np.sort(expected_triangles, axis=1).tolist()))
+
+
+def test_materialize_after_adding_into_free_slots():
+    verts = np.array([[0, 0], [1, 0], [0, 1], [1, 1]], dtype=np.float32)
+    mesh = EditableMesh(verts, None, [[0, 1, 2], [1, 3, 2]])
+    mesh.remove_vertex(1)
+    slot = mesh.add_vertex(np.array([2, 2]))
+    assert slot == 1
+    extra = mesh.add_vertex(np.array([3, 3]))
+    assert extra == 4
+    # The reused slot starts without links; (2, 3) survived the removal.
+    assert mesh.toggle_link(1, 3) and mesh.toggle_link(1, 2)
+    result_verts, result_deformation, result_triangles = mesh.materialize()
+    np.testing.assert_array_equal(result_verts, [[0, 0], [2, 2], [0, 1], [1, 1], [3, 3]])
+    np.testing.assert_array_equal(result_deformation, np.zeros((5, 2)))
+    np.testing.assert_array_equal(result_triangles, [[1, 2, 3]])
+    mesh.remove_vertex(0)
+    mesh.remove_vertex(4)
+    result_verts, _, result_triangles = mesh.materialize()
+    np.testing.assert_array_equal(result_verts, [[2, 2], [0, 1], [1, 1]])
+    np.testing.assert_array_equal(result_triangles, [[0, 1, 2]])
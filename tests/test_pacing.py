@@ -0,0 +1,69 @@
+import pytest
+
+import pacing
+from pacing import FrameScheduler
+
+
+class FakeClock:
+    # Stands in for the time module: sleep() advances perf_counter() instantly.
+    def __init__(self):
+        self.now = 0.
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0.)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(pacing, "time", clock)
+    return clock
+
+
+def run(clock, scheduler, captures, work=0.01):
+    # The tracker loop: wake up, process the frame captured for this wake-up, report its capture time.
+    errors = []
+    for capture_time in captures:
+        scheduler.wait()
+        errors.append(capture_time - scheduler.frame_start)
+        clock.sleep(work)
+        scheduler.sync(capture_time)
+    return errors
+
+
+def test_deadline_converges_to_drifting_capture_clock(clock):
+    scheduler = FrameScheduler(30, gc_slack=None)
+    # The camera runs 0.5 ms per frame slower than the nominal 30 fps and starts 4 ms out of phase.
+    camera_period = scheduler.target_duration + 0.0005
+    errors = run(clock, scheduler, [0.004 + k * camera_period for k in range(300)])
+    assert abs(errors[1]) > 0.003
+    assert max(abs(error) for error in errors[-50:]) < 1e-5
+    assert scheduler.period == pytest.approx(camera_period, abs=1e-6)
+
+
+def test_fixed_deadline_drifts_without_sync(clock):
+    scheduler = FrameScheduler(30, gc_slack=None)
+    camera_period = scheduler.target_duration + 0.0005
+    errors = []
+    for k in range(40):
+        scheduler.wait()
+        errors.append(0.004 + k * camera_period - scheduler.frame_start)
+    assert errors[-1] == pytest.approx(errors[1] + 38 * 0.0005)
+
+
+def test_rate_correction_is_bounded(clock):
+    scheduler = FrameScheduler(30, gc_slack=None)
+    # A camera 20% slower than the requested rate must not drag the tracker along with it.
+    camera_period = scheduler.target_duration * 1.2
+    run(clock, scheduler, [k * camera_period for k in range(300)])
+    limit = scheduler.target_duration * FrameScheduler.MAX_RATE_ADJUST
+    assert scheduler.target_duration - limit <= scheduler.period <= scheduler.target_duration + limit
+
+
+def test_unpaced_scheduler_ignores_sync(clock):
+    scheduler = FrameScheduler(30, FrameScheduler.PACING_CAMERA, gc_slack=None)
+    run(clock, scheduler, [k * 0.05 for k in range(10)])
+    assert scheduler.period == scheduler.target_duration
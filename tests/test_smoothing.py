@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from facestate import FEATURE_INDEX, FaceState
+from mapping import ParameterMapping
+from smoothing import FeatureFilter, create_filter
+
+
+class Param:
+    def __init__(self):
+        self.value = (0., 0.)
+
+
+class ListItem:
+    def setValue(self, value):
+        pass
+
+
+def test_interpolate_blends_between_samples():
+    # 30 Hz samples that become available 50 ms after capture, rendered at 240 Hz.
+    f = FeatureFilter(1, angles=0, mode="interpolate")
+    interval, latency = 1 / 30, 0.05
+    out = np.zeros((1,))
+    rendered = []
+    for i in range(10):
+        capture = i * interval
+        f.update(np.array([float(i)]), capture, capture + latency)
+        for step in range(8):
+            rendered.append(f.sample(capture + latency + step * interval / 8, out)[0])
+    # After the first sample the value moves from sample i-1 to sample i between arrivals.
+    for i in range(1, 10):
+        frames = rendered[i * 8:(i + 1) * 8]
+        assert frames == pytest.approx([i - 1 + step / 8 for step in range(8)])
+
+
+def test_hold_repeats_latest_sample():
+    f = create_filter(1, {"type": "none"})
+    out = np.zeros((1,))
+    f.update(np.array([1.]), 0., 0.05)
+    f.update(np.array([2.]), 1 / 30, 1 / 30 + 0.05)
+    assert f.sample(0.2, out)[0] == 2.
+
+
+def run_filter(f, values, rate=30.):
+    # Feeds one value per sample at rate Hz and returns the filtered value after each sample.
+    out = np.zeros((f.n,))
+    result = []
+    for i, value in enumerate(values):
+        t = i / rate
+        f.update(np.full((f.n,), value), t, t)
+        result.append(f.sample(t, out)[0])
+    return np.array(result)
+
+
+# (type, largest overshoot of a unit step, largest std of the output relative to the noise) with the default
+# tuning: the One Euro filter approaches a step monotonically, the constant-velocity Kalman filter overshoots in
+# exchange for less lag and smooths less.
+FILTERS = [("one_euro", 0., 0.5), ("kalman", 0.2, 0.8)]
+
+
+@pytest.mark.parametrize("kind, overshoot, noise", FILTERS)
+def test_step_response_settles(kind, overshoot, noise):
+    f = create_filter(1, {"type": kind, "mode": "hold"})
+    f.angles = 0
+    f.units[:] = 1
+    response = run_filter(f, [0.] * 30 + [1.] * 60)
+    assert np.all(response[:30] == 0)
+    # The step is followed, but not in a single sample, and it settles on the new value.
+    assert 0 < response[30] < 1
+    assert response[-1] == pytest.approx(1, abs=0.01)
+    assert np.max(response) <= 1 + overshoot + 1e-6
+    if overshoot == 0:
+        assert np.all(np.diff(response[30:]) >= 0)
+
+
+@pytest.mark.parametrize("kind, overshoot, noise", FILTERS)
+def test_noise_is_reduced(kind, overshoot, noise, rng):
+    f = create_filter(1, {"type": kind, "mode": "hold"})
+    f.angles = 0
+    f.units[:] = 1
+    raw = 0.5 + rng.normal(0, 0.02, 300)
+    response = run_filter(f, raw)
+    assert np.std(response[30:]) < noise * np.std(raw[30:])
+    assert np.mean(response[30:]) == pytest.approx(0.5, abs=0.01)
+
+
+@pytest.mark.parametrize("kind", ["none", "one_euro", "kalman"])
+def test_angles_unwrap_across_180(kind):
+    # A head turned around, jittering across +-180 degrees: the filter must not average through 0.
+    f = create_filter(1, {"type": kind, "mode": "hold"})
+    response = run_filter(f, [179., -179.] * 30)
+    assert np.all(np.abs(np.diff(response)) < 5)
+    wrapped = (response + 180) % 360 - 180
+    assert np.all(np.abs(np.abs(wrapped) - 180) < 2)
+
+
+def test_extrapolate_is_clamped_to_one_interval():
+    f = FeatureFilter(1, angles=0, mode="extrapolate")
+    out = np.zeros((1,))
+    f.update(np.array([0.]), 0.)
+    f.update(np.array([1.]), 0.1)
+    # 10 units per second, predicted ahead from the last sample for at most one sample interval.
+    assert f.sample(0.05, out)[0] == pytest.approx(1.)
+    assert f.sample(0.15, out)[0] == pytest.approx(1.5)
+    assert f.sample(0.2, out)[0] == pytest.approx(2.)
+    assert f.sample(1.0, out)[0] == pytest.approx(2.)
+
+
+def test_smoothing_does_not_depend_on_render_rate():
+    # The same mapping rendered at 60 and 144 Hz must follow the same trajectory, the one smoothing describes at
+    # the 60 fps reference rate.
+    face = FaceState()
+    face.seq = 1
+    face.features[FEATURE_INDEX["mouth_wide"]] = 1
+    rules = [{"param": "Mouth:: Width", "x": {"source": "mouth_wide"}}]
+    trajectories = []
+    for rate in (60, 144):
+        param = Param()
+        mapping = ParameterMapping({"Mouth:: Width": (param, ListItem())}, rules, smoothing=0.1,
+                                   filter_config={"type": "none"})
+        # Start from a settled value of 0, then step the target to 1.
+        mapping.frame_time = 0.
+        values = {}
+        for frame in range(1, rate + 1):
+            mapping.update(face, frame / rate)
+            if frame % (rate // 12) == 0:
+                values[frame // (rate // 12)] = float(mapping.values[0])
+        trajectories.append(values)
+    assert trajectories[0].keys() == trajectories[1].keys()
+    for k, value in trajectories[0].items():
+        assert value == pytest.approx(1 - 0.9 ** (60 * k / 12), abs=1e-4)
+        assert trajectories[1][k] == pytest.approx(value, abs=1e-4)
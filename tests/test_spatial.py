@@ -0,0 +1,72 @@
+import numpy as np
+
+from spatial import VertexGrid
+
+
+def brute_radius(points, alive, center, radius):
+    # The selection NodeMeshEditor did before the grid: every point strictly within radius.
+    hit = np.linalg.norm(points - np.asarray(center)[0:2], axis=1) < radius
+    return np.flatnonzero(hit & alive)
+
+
+def brute_rect(points, alive, corner1, corner2):
+    lower = np.minimum(corner1, corner2)
+    upper = np.maximum(corner1, corner2)
+    hit = np.all((lower <= points) & (points <= upper), axis=1)
+    return np.flatnonzero(hit & alive)
+
+
+def check_queries(grid, points, alive, rng, count=50):
+    for _ in range(count):
+        center = rng.uniform(-120, 120, 2)
+        radius = rng.uniform(0, 40)
+        np.testing.assert_array_equal(grid.query_radius(center, radius), brute_radius(points, alive, center, radius))
+        corner1, corner2 = rng.uniform(-120, 120, (2, 2))
+        np.testing.assert_array_equal(grid.query_rect(corner1, corner2), brute_rect(points, alive, corner1, corner2))
+
+
+def test_queries_match_brute_force(rng):
+    points = rng.uniform(-100, 100, (500, 2))
+    grid = VertexGrid(points)
+    check_queries(grid, points, np.ones((len(points),), dtype=bool), rng)
+
+
+def test_queries_after_update(rng):
+    points = rng.uniform(-100, 100, (500, 2))
+    alive = np.ones((len(points),), dtype=bool)
+    grid = VertexGrid(points)
+    # A few points moved, some of them outside the original bounds; stays below the rebuild threshold.
+    moved = rng.choice(len(points), 20, replace=False)
+    points[moved] = rng.uniform(-120, 120, (len(moved), 2))
+    grid.update(moved, points[moved])
+    assert len(grid.loose) > 0
+    check_queries(grid, points, alive, rng)
+    # Enough moves to trigger a rebuild.
+    moved = rng.choice(len(points), 200, replace=False)
+    points[moved] = rng.uniform(-100, 100, (len(moved), 2))
+    grid.update(moved, points[moved])
+    check_queries(grid, points, alive, rng)
+
+
+def test_queries_after_add_and_remove(rng):
+    points = rng.uniform(-100, 100, (200, 2))
+    grid = VertexGrid(points)
+    added = rng.uniform(-100, 100, (10, 2))
+    grid.update(np.arange(200, 210), added)
+    points = np.concatenate([points, added])
+    alive = np.ones((len(points),), dtype=bool)
+    removed = rng.choice(len(points), 30, replace=False)
+    grid.remove(removed)
+    alive[removed] = False
+    check_queries(grid, points, alive, rng)
+
+
+def test_sync_only_moves_changed_points(rng):
+    points = rng.uniform(-100, 100, (300, 2))
+    grid = VertexGrid(points)
+    points = points.copy()
+    points[5] = (150, 150)
+    grid.sync(points)
+    np.testing.assert_array_equal(grid.loose, [5])
+    check_queries(grid, points, np.ones((len(points),), dtype=bool), rng)
+    np.testing.assert_array_equal(grid.query_radius((150, 150), 1), [5])
@@ -0,0 +1,56 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from tracing import Tracer, child_trace_path
+
+
+def test_child_trace_path_adds_pid():
+    assert child_trace_path("/tmp/trace.json") == "/tmp/trace.%d.json"%os.getpid()
+
+
+def test_dump_writes_chrome_trace(tmp_path):
+    tracer = Tracer()
+    tracer.start()
+    with tracer.span("work", "test"):
+        pass
+    tracer.stop()
+    path = tmp_path / "trace.json"
+    assert tracer.dump(str(path)) == 1
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [event["name"] for event in events if event["ph"] == "X"] == ["work"]
+
+
+CHILD = """
+import multiprocessing, sys
+sys.path.insert(0, %r)
+
+def child():
+    from tracing import TRACER
+    with TRACER.span("child"):
+        pass
+
+if __name__ == "__main__":
+    from tracing import TRACER
+    with TRACER.span("parent"):
+        pass
+    process = multiprocessing.get_context("spawn").Process(target=child)
+    process.start()
+    process.join()
+    print("pid=%%d"%%process.pid)
+"""
+
+
+def test_child_process_writes_its_own_trace(tmp_path):
+    # A spawned child inherits CUTE_PLAYER_TRACE and must not dump over the parent's trace.
+    script = tmp_path / "run.py"
+    script.write_text(CHILD%os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    path = tmp_path / "trace.json"
+    env = dict(os.environ, CUTE_PLAYER_TRACE=str(path))
+    output = subprocess.run([sys.executable, str(script)], env=env, check=True, capture_output=True, text=True).stdout
+    pid = int(re.search(r"pid=(\d+)", output).group(1))
+    names = lambda path: [event["name"] for event in json.loads(path.read_text())["traceEvents"] if event["ph"] == "X"]
+    assert names(path) == ["parent"]
+    assert names(tmp_path / ("trace.%d.json"%pid)) == ["child"]
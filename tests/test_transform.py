@@ -0,0 +1,36 @@
+import numpy as np
+
+from transform import FLIP_Y, inverse_affine, screen_to_local
+
+
+def random_affine(rng):
+    matrix = np.eye(4, dtype=np.float32)
+    angle = rng.uniform(-np.pi, np.pi)
+    scale = rng.uniform(0.2, 4, 2)
+    matrix[0, 0:2] = np.cos(angle) * scale[0], -np.sin(angle) * scale[1]
+    matrix[1, 0:2] = np.sin(angle) * scale[0], np.cos(angle) * scale[1]
+    matrix[0:2, 3] = rng.uniform(-500, 500, 2)
+    return matrix
+
+
+def test_inverse_affine_matches_general_inverse(rng):
+    for _ in range(20):
+        matrix = random_affine(rng)
+        np.testing.assert_allclose(inverse_affine(matrix), np.linalg.inv(matrix), rtol=1e-4, atol=1e-3)
+
+
+def test_screen_to_local_matches_per_point_conversion(rng):
+    # What the mouse handlers do for one event: screen_to_global, flip y, then the node's inverse transform.
+    screen_matrix = random_affine(rng)
+    inverse_transform = inverse_affine(random_affine(rng))
+    points = rng.uniform(0, 1920, (64, 2)).astype(np.float32)
+    expected = []
+    for x, y in points:
+        pos = screen_matrix @ np.array([x, y, 0, 1], dtype=np.float32)
+        pos[1] *= -1
+        expected.append(inverse_transform @ pos)
+    np.testing.assert_allclose(screen_to_local(points, screen_matrix, inverse_transform), expected, rtol=1e-4, atol=1e-3)
+
+
+def test_flip_y():
+    np.testing.assert_array_equal(FLIP_Y @ np.array([1, 2, 3, 1], dtype=np.float32), [1, -2, 3, 1])
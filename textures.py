@@ -0,0 +1,111 @@
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+
+# Inochi2D puppet container (.inp, and .inx which adds extension sections):
+#   "TRNSRTS\0", u32 json length, json,
+#   "TEX_SECT", u32 texture count, then per texture: u32 data length, u8 encoding, data
+# All integers are big endian.
+MAGIC       = b"TRNSRTS\0"
+TEX_SECTION = b"TEX_SECT"
+ENCODING_PNG = 0
+ENCODING_TGA = 1
+ENCODING_BC7 = 2
+
+
+class TextureStore:
+    # Textures of one model file, decoded on demand straight from a read-only memory map.
+    # Only the section headers are parsed up front; encoded() is a zero-copy view into the map and get() decodes
+    # into an RGBA array that is shared (read-only) by every caller until it is released or evicted. Decoded
+    # arrays are kept in LRU order and dropped once resident_bytes exceeds budget; release() drops one as soon as
+    # its consumer (e.g. a thumbnail) is done with it. Safe to use from the thumbnail worker and the GUI thread.
+    # Encodings OpenCV cannot decode (TGA, BC7) return None, and callers fall back to the pixels inochi2d holds.
+    def __init__(self, path, budget=256 << 20):
+        self.path    = path
+        self.budget  = budget
+        self.lock    = threading.Lock()
+        self.decoded = OrderedDict()
+        self.resident_bytes = 0
+        self.entries = []
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._parse()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def mapped_bytes(self):
+        return sum(length for _, length, _ in self.entries)
+
+    def _parse(self):
+        data = self.map
+        if data[0:8] != MAGIC:
+            raise ValueError("%s: not an Inochi2D puppet"%self.path)
+        json_length, = struct.unpack_from(">I", data, 8)
+        offset = 12 + json_length
+        if data[offset:offset + 8] != TEX_SECTION:
+            return
+        count, = struct.unpack_from(">I", data, offset + 8)
+        offset += 12
+        for _ in range(count):
+            length, encoding = struct.unpack_from(">IB", data, offset)
+            offset += 5
+            if offset + length > len(data):
+                raise ValueError("%s: truncated texture section"%self.path)
+            self.entries.append((offset, length, encoding))
+            offset += length
+
+    def encoded(self, texture_id):
+        # The encoded bytes of a texture, without copying them out of the map.
+        offset, length, _ = self.entries[texture_id]
+        return np.frombuffer(self.map, dtype=np.uint8, count=length, offset=offset)
+
+    def get(self, texture_id):
+        # (h, w, 4) read-only uint8 RGBA array, or None if the texture cannot be decoded here.
+        with self.lock:
+            pixels = self.decoded.get(texture_id)
+            if pixels is not None:
+                self.decoded.move_to_end(texture_id)
+                return pixels
+        if not 0 <= texture_id < len(self.entries) or self.entries[texture_id][2] != ENCODING_PNG:
+            return None
+        pixels = cv2.imdecode(self.encoded(texture_id), cv2.IMREAD_UNCHANGED)
+        if pixels is None:
+            return None
+        if pixels.ndim == 2:
+            pixels = cv2.cvtColor(pixels, cv2.COLOR_GRAY2RGBA)
+        elif pixels.shape[2] == 3:
+            pixels = cv2.cvtColor(pixels, cv2.COLOR_BGR2RGBA)
+        else:
+            pixels = cv2.cvtColor(pixels, cv2.COLOR_BGRA2RGBA)
+        pixels.setflags(write=False)
+        with self.lock:
+            if texture_id not in self.decoded:
+                self.decoded[texture_id] = pixels
+                self.resident_bytes += pixels.nbytes
+                self._evict()
+        return pixels
+
+    def release(self, texture_id):
+        # Drop the decoded copy; arrays already handed out stay valid for as long as they are referenced.
+        with self.lock:
+            pixels = self.decoded.pop(texture_id, None)
+            if pixels is not None:
+                self.resident_bytes -= pixels.nbytes
+
+    def _evict(self):
+        while self.resident_bytes > self.budget and len(self.decoded) > 1:
+            _, pixels = self.decoded.popitem(last=False)
+            self.resident_bytes -= pixels.nbytes
+
+    def close(self):
+        # The map is unmapped once the last view into it is gone.
+        with self.lock:
+            self.decoded.clear()
+            self.resident_bytes = 0
+        self.map = None
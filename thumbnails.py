@@ -0,0 +1,149 @@
+import os
+import json
+import queue
+import hashlib
+import threading
+import traceback
+import numpy as np
+import cv2
+from PySide2 import QtCore
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "cute_player", "thumbnails")
+
+
+class ThumbnailCache(QtCore.QObject):
+    # Node tree icons, generated off the GUI thread and kept on disk per model.
+    # Icons live in <cache_dir>/<model hash>/<size>/<texture id>.png. The model hash is a digest of the file
+    # contents, remembered per (path, size, mtime) in index.json so an unchanged model is not hashed twice.
+    # Decoding cached icons, downscaling and PNG encoding run on a worker thread. Icons missing from the cache are
+    # made from the model's TextureStore on the worker too; only textures it cannot decode are read out of
+    # inochi2d (fetch), which has to happen on the GUI thread.
+    # ready is emitted on the GUI thread with (generation, texture_id, RGBA array) for every requested icon;
+    # generation is the value returned by open_model(), so late icons of a previous model can be told apart.
+    ready = QtCore.Signal(object, object, object)
+    _missing = QtCore.Signal(object, object)
+
+    CHUNK = 1 << 20
+
+    def __init__(self, size=16, cache_dir=None, parent=None):
+        super(ThumbnailCache, self).__init__(parent)
+        self.size       = size
+        self.cache_dir  = cache_dir or default_cache_dir()
+        self.requests   = queue.Queue()
+        self.generation = 0
+        self.model_dir  = None
+        self.fetch      = None
+        self.store      = None
+        self._missing.connect(self._on_missing)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def open_model(self, path, fetch, store=None):
+        # fetch(texture_id) -> (h, w, channels) uint8 array; called on the GUI thread for cache misses the
+        # store (a TextureStore, optional) cannot decode. Requests for a previous model still queued are dropped.
+        self.generation += 1
+        self.fetch = fetch
+        self.store = store
+        self.requests.put(("open", self.generation, path, None))
+        return self.generation
+
+    def request(self, texture_id):
+        self.requests.put(("lookup", self.generation, texture_id, None))
+
+    def close(self):
+        self.requests.put(None)
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _model_hash(self, path):
+        stat = os.stat(path)
+        key = "%s:%d:%d"%(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        try:
+            with open(self._index_path(), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        if key in index:
+            return index[key]
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self.CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        index[key] = digest.hexdigest()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, self._index_path())
+        return index[key]
+
+    def _icon_path(self, texture_id):
+        return os.path.join(self.model_dir, "%d.png"%texture_id)
+
+    def _run(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                break
+            kind, generation, key, pixels = item
+            if generation != self.generation:
+                continue
+            try:
+                if kind == "open":
+                    self.model_dir = None
+                    self.model_dir = os.path.join(self.cache_dir, self._model_hash(key), str(self.size))
+                    os.makedirs(self.model_dir, exist_ok=True)
+                elif kind == "lookup":
+                    icon = cv2.imread(self._icon_path(key), cv2.IMREAD_UNCHANGED) if self.model_dir else None
+                    if icon is not None and icon.ndim == 3 and icon.shape[2] == 4:
+                        self.ready.emit(generation, key, cv2.cvtColor(icon, cv2.COLOR_BGRA2RGBA))
+                        continue
+                    store = self.store
+                    pixels = store.get(key) if store is not None else None
+                    if pixels is None:
+                        self._missing.emit(generation, key)
+                        continue
+                    self._store(generation, key, pixels)
+                    # The full-size pixels were only needed for the icon.
+                    store.release(key)
+                elif kind == "store":
+                    self._store(generation, key, pixels)
+            except Exception:
+                traceback.print_exc()
+
+    def _store(self, generation, texture_id, pixels):
+        icon = self._downscale(pixels)
+        self.ready.emit(generation, texture_id, icon)
+        if self.model_dir:
+            cv2.imwrite(self._icon_path(texture_id), cv2.cvtColor(icon, cv2.COLOR_RGBA2BGRA))
+
+    def _downscale(self, img):
+        h, w = img.shape[0:2]
+        scale = min(self.size / w, self.size / h)
+        icon = cv2.resize(img, None, None, scale, scale, interpolation=cv2.INTER_AREA)
+        if icon.ndim == 2:
+            icon = icon[:, :, None]
+        if icon.shape[2] == 1:
+            icon = np.repeat(icon, 3, axis=2)
+        if icon.shape[2] == 3:
+            icon = np.concatenate([icon, np.full(icon.shape[0:2] + (1,), 255, dtype=icon.dtype)], axis=2)
+        return np.ascontiguousarray(icon)
+
+    def _on_missing(self, generation, texture_id):
+        # GUI thread: read the pixels out of the puppet and hand them back to the worker.
+        if generation != self.generation or self.fetch is None:
+            return
+        try:
+            pixels = self.fetch(texture_id)
+        except Exception:
+            traceback.print_exc()
+            return
+        if pixels is not None:
+            self.requests.put(("store", generation, texture_id, pixels))
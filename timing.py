@@ -0,0 +1,105 @@
+import os
+import time
+import numpy as np
+
+
+class StageTimes:
+    # Fixed-size ring of the most recent durations (seconds) of one stage.
+    # A single thread writes each stage; readers copy the ring and may see one sample being replaced, which is
+    # fine for statistics.
+    def __init__(self, name, capacity=512):
+        self.name   = name
+        self.values = np.zeros((capacity,), dtype=np.float64)
+        self.count  = 0
+
+    def add(self, seconds):
+        self.values[self.count % len(self.values)] = seconds
+        self.count += 1
+
+    def samples(self):
+        return self.values[:min(self.count, len(self.values))].copy()
+
+    def summary(self, percentiles=(50, 95, 99)):
+        samples = self.samples()
+        if len(samples) == 0:
+            return None
+        result = {"count": self.count, "mean": float(np.mean(samples)), "max": float(np.max(samples))}
+        for p, value in zip(percentiles, np.percentile(samples, percentiles)):
+            result["p%d"%p] = float(value)
+        return result
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stage.add(time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Timings:
+    # Named per-stage timing on the perf_counter clock.
+    #   with TIMINGS.span("puppet.draw"): ...
+    # When disabled, span() returns a shared no-op context manager and record() returns immediately, so
+    # instrumented code only pays for a method call. Stages are created on first use, in that order.
+    # Spans are per process: with ProcessFaceTracker, the inference stages are recorded in the tracker process.
+    def __init__(self, enabled=False, capacity=512):
+        self.enabled  = enabled
+        self.capacity = capacity
+        self.stages   = {}
+
+    def stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages.setdefault(name, StageTimes(name, self.capacity))
+        return stage
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self.stage(name))
+
+    def record(self, name, seconds):
+        if self.enabled:
+            self.stage(name).add(seconds)
+
+    def summary(self):
+        # {stage: {"count", "mean", "max", "p50", "p95", "p99"}}, in seconds.
+        result = {}
+        for name, stage in list(self.stages.items()):
+            stats = stage.summary()
+            if stats is not None:
+                result[name] = stats
+        return result
+
+    def format(self):
+        lines = ["%-14s %8s %8s %8s %8s"%("stage (ms)", "p50", "p95", "p99", "max")]
+        for name, stats in self.summary().items():
+            lines.append("%-14s %8.2f %8.2f %8.2f %8.2f"%(name, stats["p50"] * 1000, stats["p95"] * 1000, stats["p99"] * 1000, stats["max"] * 1000))
+        return "\n".join(lines)
+
+    def reset(self):
+        self.stages = {}
+
+
+TIMINGS = Timings(enabled=os.environ.get("CUTE_PLAYER_TIMING", "") not in ("", "0"))
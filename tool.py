@@ -5,78 +5,179 @@ from PySide2 import QtCore, QtWidgets
 import qtawesome as qta
 import traceback
 
+from spatial import VertexGrid
+from meshedit import EditableMesh, edges_from_triangles, triangles_from_edges
+from transform import inverse_affine, screen_to_local
+
+
+BLACK  = np.array([0, 0, 0, 1.0], dtype=np.float32)
+ORANGE = np.array([1, 0.6, 0, 1.0], dtype=np.float32)
+RED    = np.array([1, 0, 0, 1.0], dtype=np.float32)
+YELLOW = np.array([1, 1, 0, 1.0], dtype=np.float32)
+GREEN  = np.array([0, 1.0, 0, 1.0], dtype=np.float32)
+CYAN   = np.array([0, 1, 1, 1.0], dtype=np.float32)
+BLUE   = np.array([0, 0.6, 1, 1.0], dtype=np.float32)
+GREY   = np.array([0.5, 0.5, 0.5, 1.0], dtype=np.float32)
+
+
+class OverlayBuffer:
+    # Persistent (n, 3) float32 vertex buffer for inochi2d.dbg. Storage only grows, and owners rebuild the
+    # contents only when the key they were built for changes, so an unchanged overlay costs no allocations.
+    def __init__(self):
+        self.storage = np.zeros((0, 3), dtype=np.float32)
+        self.data    = self.storage
+        self.key     = None
+
+    def resize(self, n):
+        if n > len(self.storage):
+            self.storage = np.zeros((max(n, 2 * len(self.storage)), 3), dtype=np.float32)
+        self.data = self.storage[:n]
+        return self.data
+
+    def set_xy(self, xy, key=None):
+        data = self.resize(len(xy))
+        data[:, 0:2] = xy
+        self.key = key
+        return data
+
+    def add_xy(self, a, b, key=None):
+        data = self.resize(len(a))
+        np.add(a, b, out=data[:, 0:2])
+        self.key = key
+        return data
+
+    def gather(self, source, indices, key=None):
+        data = self.resize(len(indices))
+        np.take(source, indices, axis=0, out=data)
+        self.key = key
+        return data
+
+    def set_rect(self, bounds):
+        # Outline of (x0, y0, x1, y1) as 4 line segments.
+        key = tuple(bounds)
+        if key != self.key:
+            x0, y0, x1, y1 = key
+            self.resize(8)[:, 0:2] = ((x0, y0), (x1, y0), (x1, y0), (x1, y1), (x1, y1), (x0, y1), (x0, y1), (x0, y0))
+            self.key = key
+        return self.data
+
+
+class BindingTransaction:
+    # Binding writes made during a drag. Pointer events only record the latest value per binding; flush() writes
+    # each binding once and reinterpolates it once, and is called once per rendered frame and on release.
+    def __init__(self):
+        self.pending = {}
+
+    def set(self, binding, keypoint, value):
+        self.pending[id(binding)] = (binding, keypoint, value)
+
+    def flush(self):
+        if not self.pending:
+            return False
+        pending = list(self.pending.values())
+        self.pending.clear()
+        for binding, keypoint, value in pending:
+            binding.value[keypoint[0], keypoint[1]] = value
+        for binding, _, _ in pending:
+            binding.reinterpolate()
+        return True
+
+    def cancel(self):
+        self.pending.clear()
+
 
 class Tool:
     def __init__(self, window):
         self.window = window
         self.puppet = window.puppet
         self.camera = window.camera
+        self.matrix = None
+        self.matrix_version = None
+        self.transform = None
+        self.inverse_transform = None
+        self.transaction = BindingTransaction()
+        self.overlays = {}
 
     def init(self):
         pass
 
+    def flush(self):
+        # Apply the binding edits accumulated since the last frame; called from paintGL before the puppet updates.
+        return self.transaction.flush()
+
     def show_toolbar(self, toolbar, sibling):
         pass
 
     def switch_node(self, target_node):
         pass
 
+    def screen_matrix(self):
+        # camera.screen_to_global, fetched again only after the view reports a camera or viewport change.
+        version = getattr(self.window, "camera_version", None)
+        if self.matrix is None or version is None or version != self.matrix_version:
+            self.matrix = self.camera.screen_to_global
+            self.matrix_version = version
+        return self.matrix
+
+    def set_transform(self, transform):
+        # Node transform for the current interaction and its inverse, computed once instead of per event.
+        self.transform = transform
+        self.inverse_transform = inverse_affine(transform)
+
+    def screen_to_local(self, points):
+        # Batched conversion of (n, 2) screen positions into (n, 4) positions local to self.transform, e.g. for
+        # all the points of a high-rate tablet stroke at once.
+        return screen_to_local(points, self.screen_matrix(), self.inverse_transform)
+
+    def _event_pos(self, event):
+        return self.screen_matrix() @ np.array([event.pos().x(), event.pos().y(), 0, 1], dtype=np.float32)
+
     def mousePressEvent(self, event):
-        self.pos = np.array([event.pos().x(), event.pos().y(), 0, 1], dtype=np.float32)
-        self.matrix = self.camera.screen_to_global
-        self.pos = self.matrix @ self.pos
+        self.pos = self._event_pos(event)
 
     def mouseMoveEvent(self, event):
-        self.pos = np.array([event.pos().x(), event.pos().y(), 0, 1], dtype=np.float32)
-        self.pos = self.matrix @ self.pos
+        self.pos = self._event_pos(event)
 
     def mouseReleaseEvent(self, event):
-        self.pos = np.array([event.pos().x(), event.pos().y(), 0, 1], dtype=np.float32)
-        self.pos = self.matrix @ self.pos
+        self.pos = self._event_pos(event)
 
     def mouseDoubleClickEvent(self, event):
-        self.pos = np.array([event.pos().x(), event.pos().y(), 0, 1], dtype=np.float32)
-        self.pos = self.matrix @ self.pos
+        self.pos = self._event_pos(event)
 
     def draw(self, node):
         pass
 
-    def _draw_rect(self, bounds, color, matrix=None):
-        bounds_x, bounds_y, bounds_z, bounds_w = bounds
-        position = np.array([[bounds_x, bounds_y, 0], [bounds_z, bounds_y, 0], 
-                                [bounds_z, bounds_y, 0], [bounds_z, bounds_w, 0], 
-                                [bounds_z, bounds_w, 0], [bounds_x, bounds_w, 0],
-                                [bounds_x, bounds_w, 0], [bounds_x, bounds_y, 0]], dtype=np.float32)
-        inochi2d.dbg.set_buffer(position)
+    def overlay(self, name):
+        buffer = self.overlays.get(name)
+        if buffer is None:
+            buffer = self.overlays[name] = OverlayBuffer()
+        return buffer
+
+    def _draw_rect(self, bounds, color, matrix=None, name="rect"):
+        inochi2d.dbg.set_buffer(self.overlay(name).set_rect(bounds))
         inochi2d.dbg.line_width(3)
         inochi2d.dbg.draw_lines(color, matrix)
 
+    def _draw_points(self, position, outline, fill, size, matrix):
+        # Outlined points: one buffer upload, two draws.
+        inochi2d.dbg.set_buffer(position)
+        inochi2d.dbg.points_size(size + 2)
+        inochi2d.dbg.draw_points(outline, matrix)
+        inochi2d.dbg.points_size(size)
+        inochi2d.dbg.draw_points(fill, matrix)
+
 
 
 class NodeTool(Tool):
     def draw(self, node):
         # Bounds
-        bounds_x, bounds_y, bounds_z, bounds_w = node.combined_bounds
-        position = np.array([[bounds_x, bounds_y, 0], [bounds_z, bounds_y, 0], 
-                                [bounds_z, bounds_y, 0], [bounds_z, bounds_w, 0], 
-                                [bounds_z, bounds_w, 0], [bounds_x, bounds_w, 0],
-                                [bounds_x, bounds_w, 0], [bounds_x, bounds_y, 0]], dtype=np.float32)
-        inochi2d.dbg.set_buffer(position)
-        inochi2d.dbg.line_width(3)
-        inochi2d.dbg.draw_lines(np.array([1, 0.6, 0, 1.0], dtype=np.float32), None)
+        self._draw_rect(node.combined_bounds, ORANGE, None, "bounds")
 
         # Points
         try:
             drawable = inochi2d.Drawable(node)
-            position = drawable.vertices + drawable.deformation
-            new_position = np.zeros((len(position), 3), dtype=np.float32)
-            new_position[:, 0:2] = position
-            dynamic_matrix = drawable.dynamic_matrix
-            inochi2d.dbg.set_buffer(new_position)
-            inochi2d.dbg.points_size(5)
-            inochi2d.dbg.draw_points(np.array([0, 0, 0, 1.0], dtype=np.float32), dynamic_matrix)
-            inochi2d.dbg.points_size(3)
-            inochi2d.dbg.draw_points(np.array([1, 0.6, 0, 1.0], dtype=np.float32), dynamic_matrix)
+            position = self.overlay("points").add_xy(drawable.vertices, drawable.deformation)
+            self._draw_points(position, BLACK, ORANGE, 3, drawable.dynamic_matrix)
         except Exception:
             pass
 
@@ -126,8 +227,8 @@ class NodeRotation(NodeTool):
         target_node  = self.window.active_node
         if target_node:
             self.drag = True
-            self.transform    = target_node.transform
-            local_pos = np.linalg.inv(self.transform) @ self.pos
+            self.set_transform(target_node.transform)
+            local_pos = self.inverse_transform @ self.pos
             unit_pos = local_pos[0:2] / np.linalg.norm(local_pos[0:2])
             self.start_angle = np.arctan2(unit_pos[1], unit_pos[0])
             self.start_value = np.array(target_node.rotation)
@@ -137,7 +238,7 @@ class NodeRotation(NodeTool):
         if self.drag:
             target_node = self.window.active_node
             self.pos[1] *= -1
-            local_pos = np.linalg.inv(self.transform) @ self.pos
+            local_pos = self.inverse_transform @ self.pos
             unit_pos = local_pos[0:2] / np.linalg.norm(local_pos[0:2])
             cur_angle   = np.arctan2(unit_pos[1], unit_pos[0])
             diff_angle  = cur_angle - self.start_angle
@@ -191,13 +292,14 @@ class NodeMeshEditor(NodeTool):
         self.drag          = False
         self.selected      = None
         self.mesh          = None
-        self.deformation   = None
+        self.edit          = None
         self.target_node   = None
         self.selecting     = None
         self.transform     = None
         self.draw_position = None
+        self.grid          = None
+        self.version       = 0
         self.mode          = self.MODE_POINT
-        self.editing_links = np.array([]).reshape((0,2))
 
     def init(self):
         self.window.setCursor(QtCore.Qt.PointingHandCursor)
@@ -225,38 +327,26 @@ class NodeMeshEditor(NodeTool):
         toolbar.option_widgets.append(action)
 
     def _tri2edge(self, triangles):
-        if triangles is None:
-            return np.array([], dtype=np.ushort)
-        edges = np.zeros((len(triangles),6), dtype=np.ushort)
-        edges[:,0] = triangles[:, 0]
-        edges[:,1] = triangles[:, 1]
-        edges[:,2] = triangles[:, 1]
-        edges[:,3] = triangles[:, 2]
-        edges[:,4] = triangles[:, 0]
-        edges[:,5] = triangles[:, 2]
-        edges = edges.reshape(-1, 2)
-        new_edges = np.zeros((len(edges), 2), dtype=np.ushort)
-        new_edges[:, 0] = np.min(edges, axis=1)
-        new_edges[:, 1] = np.max(edges, axis=1)
-        new_edges = np.unique(new_edges.reshape((-1, 2)), axis=0)
-        return new_edges.astype(np.ushort)
-    
+        return edges_from_triangles(triangles)
+
     def _edge2tri(self, edge_indices):
-        triangles = {}
-        for i,e1 in enumerate(edge_indices):
-            for j,e2 in enumerate(edge_indices[i+1:]):
-                if e1[0] == e2[0]:
-                    for k,e3 in enumerate(edge_indices[j+1:]):
-                        if e3[0] == e1[1] and e3[1] == e2[1]:
-                            triangles[(e1[0], e1[1], e2[1])] = True
-        triangles = np.array(list(triangles.keys()), dtype=np.ushort)
-        return triangles
+        return triangles_from_edges(edge_indices)
+
+    @property
+    def editing_links(self):
+        return self.edit.links()
+
+    def _changed(self):
+        # Mesh, links or selection changed; the overlay is rebuilt on the next draw.
+        self.version += 1
 
     def apply(self):
+        # Edits live in self.edit; only here are they flattened into the inochi2d mesh.
         if self.target_node:
-            if self.mesh and not self.mesh.is_empty():
+            if self.mesh and self.edit is not None and len(self.edit) > 0:
                 drawable = inochi2d.Drawable(self.target_node)
-                self.mesh.verts = self.mesh.verts.astype(np.float32)
+                verts, _, indices = self.edit.materialize()
+                self.mesh.verts = verts
                 part = inochi2d.Part(self.target_node)
                 texture = part.textures
                 if texture:
@@ -268,14 +358,14 @@ class NodeMeshEditor(NodeTool):
                     bound_max = np.max(self.mesh.verts, axis=0)
 
                 self.mesh.uvs = ((self.mesh.verts - bound_min) / (bound_max - bound_min)).astype(np.float32)
-                self.editing_links = self.editing_links[np.argsort(self.editing_links[:,0] * len(self.mesh.verts) + self.editing_links[:,1])]
-                self.mesh.indices = self._edge2tri(self.editing_links)
+                self.mesh.indices = indices
                 drawable.mesh = self.mesh
 
     def deactivate(self):
         self.apply()
         self.target_node = None
         self.mesh = None
+        self.edit = None
 
     def switch_node(self, target_node):
         if target_node != self.target_node:
@@ -284,15 +374,16 @@ class NodeMeshEditor(NodeTool):
 
             drawable = inochi2d.Drawable(target_node)
             self.mesh         = drawable.mesh
-            self.deformation  = drawable.deformation
-            self.transform    = drawable.dynamic_matrix
+            self.edit         = EditableMesh(self.mesh.verts, drawable.deformation, self.mesh.indices)
+            self.set_transform(drawable.dynamic_matrix)
             self.selected     = None
-            self.editing_links = self._tri2edge(self.mesh.indices)
+            self.grid         = VertexGrid(self.edit.verts)
+            self._changed()
 
     def calculateSelection(self, local_pos):
-        selected = np.where(np.linalg.norm(self.mesh.verts - local_pos[0:2], axis=1) < self.RADIUS / self.window.scale)
-        selected_map = np.zeros((len(self.mesh.verts),), dtype=np.int)
-        if len(selected[0]) > 0:
+        selected = self.grid.query_radius(local_pos, self.RADIUS / self.window.scale)
+        selected_map = np.zeros((self.edit.size,), dtype=int)
+        if len(selected) > 0:
             selected_map[selected] = 1
             if self.selected is None or np.sum(self.selected * selected_map) == 0:
                 self.selected = selected_map
@@ -306,13 +397,14 @@ class NodeMeshEditor(NodeTool):
         self.pos[1] *= -1
         target_node  = self.window.active_node
         self.switch_node(target_node)
+        self._changed()
 
-        local_pos = np.linalg.inv(self.transform) @ self.pos
+        local_pos = self.inverse_transform @ self.pos
 
         if self.mode == self.MODE_POINT:
             self.drag = True
             self.drag_start = local_pos
-            self.start_point = np.copy(self.mesh.verts)
+            self.start_point = np.copy(self.edit.verts)
             self.calculateSelection(local_pos)
         
         elif self.mode == self.MODE_CONNECT:
@@ -325,13 +417,7 @@ class NodeMeshEditor(NodeTool):
                 selected = np.where(self.selected == 1)
                 if len(selected[0]) == 1 and len(prev_selected[0]) == 1:
                     if selected[0][0] != prev_selected[0][0]:
-                        target_edge = np.array([min(selected[0][0], prev_selected[0][0]), max(selected[0][0], prev_selected[0][0])])
-                        # Test removing.
-                        links_len = len(self.editing_links)
-                        self.editing_links = self.editing_links[np.any(self.editing_links != target_edge, axis=1)]
-                        if len(self.editing_links) == links_len:
-                            ## This should be 1. add link, 2. remove duplication.
-                            self.editing_links = np.append(self.editing_links, [target_edge], axis=0)
+                        self.edit.toggle_link(int(selected[0][0]), int(prev_selected[0][0]))
                         self.selected = None
 
                     else:
@@ -341,159 +427,128 @@ class NodeMeshEditor(NodeTool):
     def mouseDoubleClickEvent(self, event):
         if self.mode == self.MODE_CONNECT:
             return
-        self.pos = np.array([event.pos().x(), event.pos().y(), 0, 1], dtype=np.float32)
-        self.matrix = self.camera.screen_to_global
-        self.pos = self.matrix @ self.pos
+        self.pos = self._event_pos(event)
         self.pos[1] *= -1
-        self.target_node  = self.window.active_node
+        self.switch_node(self.window.active_node)
         drawable = inochi2d.Drawable(self.target_node)
-        self.transform    = drawable.dynamic_matrix
-        local_pos = np.linalg.inv(self.transform) @ self.pos
+        self.set_transform(drawable.dynamic_matrix)
+        local_pos = self.inverse_transform @ self.pos
         self.drag_start = local_pos
-        selected = np.where(np.linalg.norm(self.mesh.verts - local_pos[0:2], axis=1) >= self.RADIUS / self.window.scale)
-        if len(selected[0]) < len(self.mesh.verts):
-            selected_map = np.isin(np.arange(len(self.mesh.verts)), selected)
-            cumsum = np.cumsum(selected_map) - 1
-
-            self.mesh.verts   = self.mesh.verts[selected]
-            self.mesh.uvs     = self.mesh.uvs[selected]
-            self.deformation  = self.deformation[selected]
-
-            ind_map = np.all(np.isin(self.mesh.indices, selected), axis=1)
-            self.mesh.indices = self.mesh.indices[ind_map]
-            self.mesh.indices = cumsum[self.mesh.indices]
+        self._changed()
+        hits = self.grid.query_radius(local_pos, self.RADIUS / self.window.scale)
+        if len(hits) > 0:
+            # Remove the vertices under the cursor along with their links.
+            for slot in hits:
+                self.edit.remove_vertex(int(slot))
+            self.grid.remove(hits)
             self.selected = None
         else:
-            self.mesh.verts  = np.append(self.mesh.verts, [local_pos[0:2]], axis=0)
-            self.mesh.uvs    = np.append(self.mesh.uvs, [local_pos[0:2]], axis=0)
-            self.deformation = np.append(self.deformation, [[0, 0]], axis=0)
+            slot = self.edit.add_vertex(local_pos[0:2])
+            self.grid.update([slot], [local_pos[0:2]])
             if self.selected is not None:
-                self.selected    = np.append(self.selected, [1], axis = 0)
+                if slot >= len(self.selected):
+                    self.selected = np.append(self.selected, np.zeros((self.edit.size - len(self.selected),), dtype=int))
+                self.selected[slot] = 1
 
     def mouseMoveEvent(self, event):
         super(NodeMeshEditor, self).mouseMoveEvent(event)
         self.pos[1] *= -1
-        local_pos = np.linalg.inv(self.transform) @ self.pos
+        local_pos = self.inverse_transform @ self.pos
 
         if self.mode == self.MODE_POINT:
             if self.selecting is not None:
                 rect = np.array([self.drag_start[0:2], local_pos[0:2]])
-                self.selecting = (np.min(rect, axis=0) <= self.mesh.verts) & (self.mesh.verts <= np.max(rect, axis=0))
-                self.selecting = self.selecting[:, 0] & self.selecting[:, 1]
+                self.selecting = self.grid.mask(self.grid.query_rect(rect[0], rect[1]), self.edit.size)
                 self.rect = rect
+                self._changed()
             elif self.drag:
                 diff_pos = local_pos - self.drag_start
                 selected = np.append([self.selected], [self.selected], axis=0).T
                 pos      = np.repeat([diff_pos[0:2]], len(self.selected), axis=0)
-                self.mesh.verts = self.start_point + selected * pos
+                self.edit.verts = self.start_point + selected * pos
+                self._changed()
 
     def mouseReleaseEvent(self, event):
         super(NodeMeshEditor, self).mouseReleaseEvent(event)
+        self._changed()
         if self.mode == self.MODE_POINT:
             if self.selecting is not None:
                 self.selected = self.selecting
                 self.selecting = None
             if self.drag:
                 self.drag     = False
+                if self.selected is not None:
+                    moved = np.flatnonzero(self.selected)
+                    self.grid.update(moved, self.edit.verts[moved])
 
     def draw(self, node):
         # Bounds
-        bounds_x, bounds_y, bounds_z, bounds_w = node.combined_bounds
-        position = np.array([[bounds_x, bounds_y, 0], [bounds_z, bounds_y, 0], 
-                                [bounds_z, bounds_y, 0], [bounds_z, bounds_w, 0], 
-                                [bounds_z, bounds_w, 0], [bounds_x, bounds_w, 0],
-                                [bounds_x, bounds_w, 0], [bounds_x, bounds_y, 0]], dtype=np.float32)
-        inochi2d.dbg.set_buffer(position)
-        inochi2d.dbg.line_width(3)
-        inochi2d.dbg.draw_lines(np.array([1, 0.6, 0, 1.0], dtype=np.float32), None)
+        self._draw_rect(node.combined_bounds, ORANGE, None, "bounds")
 
-        dynamic_matrix = None
-        new_position   = None
         try:
-            # Lines
             if self.mesh is None:
                 self.switch_node(self.window.active_node)
-            if self.target_node is None or self.mesh.is_empty():
+            if self.target_node is None or self.edit is None or len(self.edit) == 0:
                 return
-            drawable = inochi2d.Drawable(self.target_node)
+            dynamic_matrix = inochi2d.Drawable(self.target_node).dynamic_matrix
+            # Buffers are only rebuilt when the edit version moved on; otherwise the same arrays are re-sent.
+            key = (id(self.edit), self.version)
+            slots = self.overlay("slots")
+            if slots.key != key:
+                slots.add_xy(self.edit.verts, self.edit.deformation, key)
+                self.overlay("links").gather(slots.data, self.editing_links.ravel(), key)
+                if self.edit.free:
+                    self.overlay("points").gather(slots.data, np.flatnonzero(self.edit.alive), key)
+                else:
+                    self.overlay("points").set_xy(slots.data[:, 0:2], key)
 
-            position = self.mesh.verts + self.deformation
-            new_position = np.zeros((len(position), 3), dtype=np.float32)
-            new_position[:, 0:2] = position
-            dynamic_matrix = drawable.dynamic_matrix
-            new_links = new_position[self.editing_links.ravel()]
-            inochi2d.dbg.set_buffer(new_links)
+            # Lines
+            inochi2d.dbg.set_buffer(self.overlay("links").data)
             inochi2d.dbg.line_width(3)
-            inochi2d.dbg.draw_lines(np.array([1, 0.6, 0, 1.0], dtype=np.float32), dynamic_matrix)
+            inochi2d.dbg.draw_lines(ORANGE, dynamic_matrix)
 
             # Points
-            inochi2d.dbg.set_buffer(new_position)
-            inochi2d.dbg.points_size(5)
-            inochi2d.dbg.draw_points(np.array([0, 0, 0, 1.0], dtype=np.float32), dynamic_matrix)
-            inochi2d.dbg.points_size(3)
-            inochi2d.dbg.draw_points(np.array([1, 0.6, 0, 1.0], dtype=np.float32), dynamic_matrix)
+            self._draw_points(self.overlay("points").data, BLACK, ORANGE, 3, dynamic_matrix)
         except Exception as e:
             traceback.print_exc()
-            pass
+            return
 
         if self.target_node and self.target_node.uuid == node.uuid:
             if self.selected is not None and len(self.selected) > 0:
                 # Selected point
-                selected = new_position[np.where(self.selected == 1)]
-                inochi2d.dbg.set_buffer(selected)
-                inochi2d.dbg.points_size(self.RADIUS)
-                inochi2d.dbg.draw_points(np.array([0, 0, 0, 1.0], dtype=np.float32), dynamic_matrix)
-                inochi2d.dbg.points_size(self.RADIUS - 2)
-                inochi2d.dbg.draw_points(np.array([1, 0, 0, 1.0], dtype=np.float32), dynamic_matrix)
+                selected = self.overlay("selected")
+                if selected.key != key:
+                    selected.gather(slots.data, np.flatnonzero(self.selected == 1), key)
+                self._draw_points(selected.data, BLACK, RED, self.RADIUS - 2, dynamic_matrix)
             if self.selecting is not None and len(self.selecting) > 0:
                 # Selection floating
-                local_pos = np.linalg.inv(self.transform) @ self.pos
-                self._draw_rect((self.drag_start[0], self.drag_start[1], local_pos[0], local_pos[1]), np.array([1, 1, 0, 1], dtype=np.float32), self.transform)
-                selecting = new_position[np.where(self.selecting)]
-                inochi2d.dbg.set_buffer(selecting)
+                local_pos = self.inverse_transform @ self.pos
+                self._draw_rect((self.drag_start[0], self.drag_start[1], local_pos[0], local_pos[1]), YELLOW, self.transform, "selection")
+                selecting = self.overlay("selecting")
+                if selecting.key != key:
+                    selecting.gather(slots.data, np.flatnonzero(self.selecting), key)
+                inochi2d.dbg.set_buffer(selecting.data)
                 inochi2d.dbg.points_size(self.RADIUS)
-                inochi2d.dbg.draw_points(np.array([1, 1, 0, 1.0], dtype=np.float32), dynamic_matrix)
+                inochi2d.dbg.draw_points(YELLOW, dynamic_matrix)
 
 
 
 class DeformationTool(Tool):
     def draw(self, node):
+        color = BLUE if self.window.active_param else GREY
         # Bounds
-        if self.window.active_param:
-            self._draw_rect(node.combined_bounds, np.array([0, 0.6, 1.0, 1.0], dtype=np.float32), None)
-        else:
-            self._draw_rect(node.combined_bounds, np.array([0.5, 0.5, 0.5, 1.0], dtype=np.float32), None)
+        self._draw_rect(node.combined_bounds, color, None, "bounds")
 
         try:
-            #Lines
+            # Deformed positions change with the parameters, so they are refreshed every frame, in place.
             drawable = inochi2d.Drawable(node)
-            position = drawable.vertices + drawable.deformation
-            new_position = np.zeros((len(position), 3), dtype=np.float32)
-            new_position[:, 0:2] = position
             self.dynamic_matrix = drawable.dynamic_matrix
-#            indice_map = np.zeros((self.mesh.indices.shape[0], self.mesh.indices.shape[1] * 2), dtype=np.int16)
-#            indice_map[:, 0] = self.mesh.indices[:, 0]
-#            indice_map[:, 1] = self.mesh.indices[:, 1]
-#            indice_map[:, 2] = self.mesh.indices[:, 1]
-#            indice_map[:, 3] = self.mesh.indices[:, 2]
-#            indice_map[:, 4] = self.mesh.indices[:, 2]
-#            indice_map[:, 5] = self.mesh.indices[:, 0]
-#            new_lines = new_position[indice_map.reshape((len(indice_map) * 6,))]
-#            inochi2d.dbg.set_buffer(new_lines)
-#            inochi2d.dbg.points_size(3)
-#            inochi2d.dbg.draw_lines(np.array([0, 0, 0, 1.0], dtype=np.float32), self.dynamic_matrix)
+            position = self.overlay("points").add_xy(drawable.vertices, drawable.deformation)
 
             # Points
-            inochi2d.dbg.set_buffer(new_position)
-            inochi2d.dbg.points_size(5)
-            inochi2d.dbg.draw_points(np.array([0, 0, 0, 1.0], dtype=np.float32), self.dynamic_matrix)
-            inochi2d.dbg.points_size(3)
-            if self.window.active_param:
-                inochi2d.dbg.draw_points(np.array([0, 0.6, 1, 1.0], dtype=np.float32), self.dynamic_matrix)
-            else:
-                inochi2d.dbg.draw_points(np.array([0.5, 0.5, 0.5, 1.0], dtype=np.float32), self.dynamic_matrix)
+            self._draw_points(position, BLACK, color, 3, self.dynamic_matrix)
 
-            self.draw_position = new_position
+            self.draw_position = position
         except Exception:
             traceback.print_exc()
 
@@ -520,20 +575,23 @@ class DeformTranslation(DeformationTool):
             self.start_value_x = self.binding_x.value[self.keypoint[0], self.keypoint[1]]
             self.start_value_y = self.binding_y.value[self.keypoint[0], self.keypoint[1]]
 
+    def _drag_to(self):
+        self.pos[1] *= -1
+        diff_pos = self.pos - self.drag_start
+        self.transaction.set(self.binding_x, self.keypoint, self.start_value_x + diff_pos[0])
+        self.transaction.set(self.binding_y, self.keypoint, self.start_value_y + diff_pos[1])
+
     def mouseMoveEvent(self, event):
         super(DeformTranslation, self).mouseMoveEvent(event)
         if self.drag:
-            self.pos[1] *= -1
-            diff_pos = self.pos - self.drag_start
-            self.binding_x.value[self.keypoint[0], self.keypoint[1]] = self.start_value_x + diff_pos[0]
-            self.binding_y.value[self.keypoint[0], self.keypoint[1]] = self.start_value_y + diff_pos[1]
-            self.binding_x.reinterpolate()
-            self.binding_y.reinterpolate()
+            self._drag_to()
 
     def mouseReleaseEvent(self, event):
         super(DeformTranslation, self).mouseReleaseEvent(event)
         if self.drag:
             self.drag = False
+            self._drag_to()
+            self.transaction.flush()
 
 
 class DeformRotation(DeformationTool):
@@ -551,29 +609,33 @@ class DeformRotation(DeformationTool):
         target_param = self.window.active_param
         if target_node and target_param:
             self.drag = True
-            self.transform    = target_node.transform
-            local_pos = np.linalg.inv(self.transform) @ self.pos
+            self.set_transform(target_node.transform)
+            local_pos = self.inverse_transform @ self.pos
             unit_pos = local_pos[0:2] / np.linalg.norm(local_pos[0:2])
             self.start_angle = np.arctan2(unit_pos[1], unit_pos[0])
             self.keypoint = target_param.find_closest_keypoint()
             self.binding_z = target_param.get_or_add_binding(target_node, "transform.r.z")
             self.start_value_z = self.binding_z.value[self.keypoint[0], self.keypoint[1]]
 
+    def _drag_to(self):
+        self.pos[1] *= -1
+        local_pos = self.inverse_transform @ self.pos
+        unit_pos = local_pos[0:2] / np.linalg.norm(local_pos[0:2])
+        cur_angle   = np.arctan2(unit_pos[1], unit_pos[0])
+        diff_angle  = cur_angle - self.start_angle
+        self.transaction.set(self.binding_z, self.keypoint, (self.start_value_z + diff_angle + np.pi)%(2*np.pi) - np.pi)
+
     def mouseMoveEvent(self, event):
         super(DeformRotation, self).mouseMoveEvent(event)
         if self.drag:
-            self.pos[1] *= -1
-            local_pos = np.linalg.inv(self.transform) @ self.pos
-            unit_pos = local_pos[0:2] / np.linalg.norm(local_pos[0:2])
-            cur_angle   = np.arctan2(unit_pos[1], unit_pos[0])
-            diff_angle  = cur_angle - self.start_angle
-            self.binding_z.value[self.keypoint[0], self.keypoint[1]] = (self.start_value_z + diff_angle + np.pi)%(2*np.pi) - np.pi
-            self.binding_z.reinterpolate()
+            self._drag_to()
 
     def mouseReleaseEvent(self, event):
         super(DeformRotation, self).mouseReleaseEvent(event)
         if self.drag:
             self.drag = False
+            self._drag_to()
+            self.transaction.flush()
 
 
 class DeformScaling(DeformationTool):
@@ -599,18 +661,22 @@ class DeformScaling(DeformationTool):
             self.start_value_x = self.binding_x.value[self.keypoint[0], self.keypoint[1]]
             self.start_value_y = self.binding_y.value[self.keypoint[0], self.keypoint[1]]
 
+    def _drag_to(self):
+        local_pos = self.transform @ self.pos
+        scale = np.abs(np.nan_to_num(local_pos[0:2] / self.drag_start[0:2], nan = 1.0))
+        self.transaction.set(self.binding_x, self.keypoint, scale[0] * self.start_value_x)
+        self.transaction.set(self.binding_y, self.keypoint, scale[1] * self.start_value_y)
+
     def mouseMoveEvent(self, event):
         super(DeformScaling, self).mouseMoveEvent(event)
         if self.drag:
-            local_pos = self.transform @ self.pos
-            scale = np.abs(np.nan_to_num(local_pos[0:2] / self.drag_start[0:2], nan = 1.0))
-            self.binding_x.value[self.keypoint[0], self.keypoint[1]] = scale[0] * self.start_value_x
-            self.binding_y.value[self.keypoint[0], self.keypoint[1]] = scale[1] * self.start_value_y
-            self.binding_x.reinterpolate()
-            self.binding_y.reinterpolate()
+            self._drag_to()
 
     def mouseReleaseEvent(self, event):
         super(DeformScaling, self).mouseReleaseEvent(event)
+        if self.drag:
+            self._drag_to()
+            self.transaction.flush()
         self.drag = False
 
 
@@ -628,10 +694,19 @@ class Deformer(DeformationTool):
         self.selecting    = None
         self.transform = None
         self.draw_position = None
+        self.grid = None
+        self.selected_indices = (None, None)
 
     def init(self):
         self.window.setCursor(QtCore.Qt.PointingHandCursor)
 
+    def _sync_grid(self):
+        # Deformed vertices change with the parameter value, so only the ones that moved since the last pick are re-bucketed.
+        if self.grid is None:
+            self.grid = VertexGrid(self.vertices)
+        else:
+            self.grid.sync(self.vertices)
+
     def mousePressEvent(self, event):
         super(Deformer, self).mousePressEvent(event)
         self.pos[1] *= -1
@@ -640,6 +715,7 @@ class Deformer(DeformationTool):
         if target_node and target_param:
             if target_node != self.target_node:
                 self.selected = None
+                self.grid = None
             if target_param != self.target_param:
                 self.keypoint = None
             self.target_node = target_node
@@ -651,13 +727,14 @@ class Deformer(DeformationTool):
             self.start_deform = np.copy(self.binding.value[self.keypoint[0], self.keypoint[1]])
             drawable = inochi2d.Drawable(target_node)
             self.vertices     = drawable.vertices + drawable.deformation
-            self.transform    = drawable.dynamic_matrix
+            self.set_transform(drawable.dynamic_matrix)
 
-            local_pos = np.linalg.inv(self.transform) @ self.pos
+            local_pos = self.inverse_transform @ self.pos
             self.drag_start = local_pos
-            selected = np.where(np.linalg.norm(self.vertices - local_pos[0:2], axis=1) < self.RADIUS / self.window.scale)
-            selected_map = np.zeros((len(self.vertices),), dtype=np.int)
-            if len(selected[0]) > 0:
+            self._sync_grid()
+            selected = self.grid.query_radius(local_pos, self.RADIUS / self.window.scale)
+            selected_map = np.zeros((len(self.vertices),), dtype=int)
+            if len(selected) > 0:
                 selected_map[selected] = 1
                 if self.selected is None or np.sum(self.selected * selected_map) == 0:
                     self.selected = selected_map
@@ -669,48 +746,53 @@ class Deformer(DeformationTool):
 
     def mouseMoveEvent(self, event):
         super(Deformer, self).mouseMoveEvent(event)
-        if self.transform is not None:
-            self.pos[1] *= -1
-            local_pos = np.linalg.inv(self.transform) @ self.pos
+        if self.transform is None:
+            return
+        local_pos = self.screen_to_local([(event.pos().x(), event.pos().y())])[0]
         if self.selecting is not None:
             rect = np.array([self.drag_start[0:2], local_pos[0:2]])
-            self.selecting = (np.min(rect, axis=0) <= self.vertices) & (self.vertices <= np.max(rect, axis=0))
-            self.selecting = self.selecting[:, 0] & self.selecting[:, 1]
+            self.selecting = self.grid.mask(self.grid.query_rect(rect[0], rect[1]))
             self.rect = rect
         elif self.drag:
-            diff_pos = local_pos - self.drag_start
-            selected = np.append([self.selected], [self.selected], axis=0).T
-            pos      = np.repeat([diff_pos[0:2]], len(self.selected), axis=0)
-            self.binding.value[self.keypoint[0], self.keypoint[1]] = (self.start_deform + selected * pos).astype(np.float32)
-            self.binding.reinterpolate()
+            self._drag_to(local_pos)
+
+    def _drag_to(self, local_pos):
+        if self.selected is None:
+            return
+        diff_pos = local_pos - self.drag_start
+        deform = self.start_deform + self.selected[:, None] * diff_pos[0:2]
+        self.transaction.set(self.binding, self.keypoint, deform.astype(np.float32))
 
     def mouseReleaseEvent(self, event):
         super(Deformer, self).mouseReleaseEvent(event)
         if self.selecting is not None:
             self.selected = self.selecting
             self.selecting = None
+        elif self.drag and self.transform is not None:
+            self.pos[1] *= -1
+            self._drag_to(self.inverse_transform @ self.pos)
         if self.drag:
             self.drag     = False
+            self.transaction.flush()
             drawable = inochi2d.Drawable(self.target_node)
             self.vertices = drawable.vertices + drawable.deformation
+            self._sync_grid()
 
     def draw(self, node):
         super(Deformer, self).draw(node)
         if self.draw_position is not None and self.target_node and self.target_node.uuid == node.uuid:
             dynamic_matrix = self.dynamic_matrix
-            if self.selected is not None and len(self.selected) > 0:
-                # Selected point
-                selected = self.draw_position[np.where(self.selected == 1)]
-                inochi2d.dbg.set_buffer(selected)
-                inochi2d.dbg.points_size(self.RADIUS)
-                inochi2d.dbg.draw_points(np.array([0, 0, 0, 1.0], dtype=np.float32), dynamic_matrix)
-                inochi2d.dbg.points_size(self.RADIUS - 2)
-                inochi2d.dbg.draw_points(np.array([0, 1, 1, 1.0], dtype=np.float32), dynamic_matrix)
-            if self.selecting is not None and len(self.selecting) > 0:
+            if self.selected is not None and len(self.selected) > 0 and len(self.selected) == len(self.draw_position):
+                # Selected point; the index list is kept until the selection changes.
+                if self.selected is not self.selected_indices[0]:
+                    self.selected_indices = (self.selected, np.flatnonzero(self.selected == 1))
+                selected = self.overlay("selected").gather(self.draw_position, self.selected_indices[1])
+                self._draw_points(selected, BLACK, CYAN, self.RADIUS - 2, dynamic_matrix)
+            if self.selecting is not None and len(self.selecting) > 0 and len(self.selecting) == len(self.draw_position):
                 # Selection floating
-                local_pos = np.linalg.inv(self.transform) @ self.pos
-                self._draw_rect((self.drag_start[0], self.drag_start[1], local_pos[0], local_pos[1]), np.array([0, 1, 0, 1], dtype=np.float32), self.transform)
-                selecting = self.draw_position[np.where(self.selecting)]
+                local_pos = self.inverse_transform @ self.pos
+                self._draw_rect((self.drag_start[0], self.drag_start[1], local_pos[0], local_pos[1]), GREEN, self.transform, "selection")
+                selecting = self.overlay("selecting").gather(self.draw_position, np.flatnonzero(self.selecting))
                 inochi2d.dbg.set_buffer(selecting)
                 inochi2d.dbg.points_size(self.RADIUS)
-                inochi2d.dbg.draw_points(np.array([0, 1.0, 0, 1.0], dtype=np.float32), dynamic_matrix)
\ No newline at end of file
+                inochi2d.dbg.draw_points(GREEN, dynamic_matrix)
@@ -0,0 +1,135 @@
+import os
+import gc
+import json
+import time
+import atexit
+import threading
+import collections
+import multiprocessing
+
+
+def _now_us():
+    return time.perf_counter_ns() / 1000
+
+
+class _TraceSpan:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name   = name
+        self.cat    = cat
+        self.args   = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.cat, self.start, _now_us() - self.start, self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    # Opt-in timeline of what every thread was doing, exported as Chrome trace event JSON
+    # (chrome://tracing, ui.perfetto.dev).
+    #   with TRACER.span("paintGL", "render"): ...
+    # Spans become complete ("X") events tagged with pid and thread id; garbage collections are recorded as
+    # begin/end pairs on the thread that triggered them, so GC pauses line up with the frames they hit.
+    # Events go into a bounded in-memory deque (oldest dropped first) and are only serialized by dump().
+    # When disabled, span() returns a shared no-op context manager.
+    def __init__(self, capacity=200000):
+        self.enabled = False
+        self.events  = collections.deque(maxlen=capacity)
+        self.pid     = os.getpid()
+        self.threads = {}
+        self.path    = None
+
+    def start(self, path=None):
+        # path, if given, is where the trace is written at exit.
+        if path is not None and self.path is None:
+            atexit.register(self._dump_at_exit)
+        if path is not None:
+            self.path = path
+        if not self.enabled:
+            self.enabled = True
+            gc.callbacks.append(self._on_gc)
+
+    def stop(self):
+        if self.enabled:
+            self.enabled = False
+            gc.callbacks.remove(self._on_gc)
+
+    def clear(self):
+        self.events.clear()
+
+    def _tid(self):
+        tid = threading.get_ident()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        return tid
+
+    def span(self, name, cat="app", args=None):
+        if not self.enabled:
+            return NULL_SPAN
+        return _TraceSpan(self, name, cat, args)
+
+    def complete(self, name, cat, start_us, duration_us, args=None):
+        event = {"name": name, "cat": cat, "ph": "X", "ts": start_us, "dur": duration_us, "pid": self.pid, "tid": self._tid()}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def instant(self, name, cat="app", args=None):
+        if not self.enabled:
+            return
+        event = {"name": name, "cat": cat, "ph": "i", "s": "t", "ts": _now_us(), "pid": self.pid, "tid": self._tid()}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def _on_gc(self, phase, info):
+        event = {"name": "gc gen %d"%info["generation"], "cat": "gc", "ph": "B" if phase == "start" else "E",
+                 "ts": _now_us(), "pid": self.pid, "tid": self._tid()}
+        if phase == "stop":
+            event["args"] = {"collected": info["collected"], "uncollectable": info["uncollectable"]}
+        self.events.append(event)
+
+    def dump(self, path):
+        events = list(self.events)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                    for tid, name in list(self.threads.items())]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+    def _dump_at_exit(self):
+        if self.path and self.events:
+            count = self.dump(self.path)
+            print("Wrote %d trace events to %s"%(count, self.path))
+
+
+def child_trace_path(path):
+    # Trace path for a child process (e.g. the --process tracker), which inherits CUTE_PLAYER_TRACE: the pid is
+    # added before the extension so that it does not overwrite the main process's trace at exit.
+    root, ext = os.path.splitext(path)
+    return "%s.%d%s"%(root, os.getpid(), ext)
+
+
+TRACER = Tracer()
+if os.environ.get("CUTE_PLAYER_TRACE"):
+    path = os.environ["CUTE_PLAYER_TRACE"]
+    TRACER.start(path if multiprocessing.parent_process() is None else child_trace_path(path))
@@ -0,0 +1,284 @@
+import os
+import time
+import threading
+import atexit
+import traceback
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import uuid
+import numpy as np
+
+from facetracker import FaceTracker
+from facestate import SharedFaceStateBuffer
+
+
+class SharedFrameRing:
+    # Cross-process version of FrameRing. Frame pixels live in a shared memory block that is
+    # reallocated (under a new generation name) if a larger frame shows up; only the small
+    # header is guarded by the condition variable, nothing is pickled per frame.
+    HEAD        = 0
+    COUNT       = 1
+    DROPPED     = 2
+    CLOSED      = 3
+    GENERATION  = 4
+    FRAME_BYTES = 5
+
+    def __init__(self, ctx, capacity=2, drop_frames=True, frame_bytes=640 * 480 * 3):
+        self.capacity    = capacity
+        self.drop_frames = drop_frames
+        self.cond        = ctx.Condition()
+        self.base_name   = "cute_player_%d_%s"%(os.getpid(), uuid.uuid4().hex[:8])
+        self.meta_shm    = shared_memory.SharedMemory(name=self.base_name, create=True, size=self._meta_size(capacity))
+        self._map_meta()
+        self.header[:] = 0
+        self.header[self.FRAME_BYTES] = frame_bytes
+        self.data_shm    = shared_memory.SharedMemory(name=self._data_name(0), create=True, size=frame_bytes * capacity)
+        self.generation  = 0
+        self.owner       = True
+
+    def __getstate__(self):
+        return (self.capacity, self.drop_frames, self.cond, self.base_name)
+
+    def __setstate__(self, state):
+        self.capacity, self.drop_frames, self.cond, self.base_name = state
+        self.meta_shm = shared_memory.SharedMemory(name=self.base_name)
+        self._map_meta()
+        self.data_shm   = None
+        self.generation = -1
+        self.owner      = False
+
+    @staticmethod
+    def _meta_size(capacity):
+        return 8 * 8 + capacity * 4 * 8 + capacity * 8
+
+    def _map_meta(self):
+        buf = self.meta_shm.buf
+        self.header = np.ndarray((8,), dtype=np.int64, buffer=buf)
+        self.shapes = np.ndarray((self.capacity, 4), dtype=np.int64, buffer=buf, offset=8 * 8)
+        self.times  = np.ndarray((self.capacity,), dtype=np.float64, buffer=buf, offset=8 * 8 + self.capacity * 4 * 8)
+
+    def _data_name(self, generation):
+        return "%s_%d"%(self.base_name, generation)
+
+    def _attach_data(self):
+        generation = int(self.header[self.GENERATION])
+        if generation != self.generation:
+            if self.data_shm is not None:
+                self.data_shm.close()
+            self.data_shm   = shared_memory.SharedMemory(name=self._data_name(generation))
+            self.generation = generation
+
+    def _reallocate(self, frame_bytes):
+        # Frames still queued are carried over slot by slot.
+        old = self.data_shm
+        old_bytes = int(self.header[self.FRAME_BYTES])
+        generation = int(self.header[self.GENERATION]) + 1
+        self.data_shm = shared_memory.SharedMemory(name=self._data_name(generation), create=True, size=frame_bytes * self.capacity)
+        for slot in range(self.capacity):
+            self.data_shm.buf[slot * frame_bytes:slot * frame_bytes + old_bytes] = old.buf[slot * old_bytes:(slot + 1) * old_bytes]
+        self.generation = generation
+        self.header[self.GENERATION]  = generation
+        self.header[self.FRAME_BYTES] = frame_bytes
+        old.close()
+        old.unlink()
+
+    @property
+    def dropped(self):
+        return int(self.header[self.DROPPED])
+
+    @property
+    def closed(self):
+        return bool(self.header[self.CLOSED])
+
+    def push(self, frame, capture_time, cancelled=None):
+        with self.cond:
+            if frame.nbytes > self.header[self.FRAME_BYTES]:
+                self._reallocate(frame.nbytes)
+            count = int(self.header[self.COUNT])
+            if self.drop_frames:
+                if count == self.capacity:
+                    self.header[self.DROPPED] += 1
+                    count -= 1
+            else:
+                while count >= self.capacity and not (cancelled and cancelled()):
+                    self.cond.wait(0.1)
+                    count = int(self.header[self.COUNT])
+                if count >= self.capacity:
+                    return
+            slot = int(self.header[self.HEAD])
+            frame_bytes = int(self.header[self.FRAME_BYTES])
+            dst = np.ndarray((frame.nbytes,), dtype=np.uint8, buffer=self.data_shm.buf, offset=slot * frame_bytes)
+            dst[:] = np.ascontiguousarray(frame).reshape(-1).view(np.uint8)
+            del dst
+            shape = frame.shape + (1,) * (3 - frame.ndim)
+            self.shapes[slot, 0:3] = shape
+            self.times[slot] = capture_time
+            self.header[self.HEAD]  = (slot + 1) % self.capacity
+            self.header[self.COUNT] = count + 1
+            self.cond.notify_all()
+
+    def pop(self, timeout=None):
+        with self.cond:
+            if self.header[self.COUNT] == 0 and not self.header[self.CLOSED]:
+                self.cond.wait(timeout)
+            count = int(self.header[self.COUNT])
+            if count == 0:
+                return None
+            self._attach_data()
+            head = int(self.header[self.HEAD])
+            if self.drop_frames:
+                slot = (head - 1) % self.capacity
+                self.header[self.DROPPED] += count - 1
+                self.header[self.COUNT] = 0
+            else:
+                slot = (head - count) % self.capacity
+                self.header[self.COUNT] = count - 1
+            h, w, c = self.shapes[slot, 0:3]
+            frame_bytes = int(self.header[self.FRAME_BYTES])
+            src = np.ndarray((h, w, c), dtype=np.uint8, buffer=self.data_shm.buf, offset=slot * frame_bytes)
+            frame = np.array(src)
+            del src
+            capture_time = float(self.times[slot])
+            self.cond.notify_all()
+            return frame, capture_time
+
+    def close(self):
+        with self.cond:
+            self.header[self.CLOSED] = 1
+            self.cond.notify_all()
+
+    def finished(self):
+        with self.cond:
+            return bool(self.header[self.CLOSED]) and self.header[self.COUNT] == 0
+
+    def release(self):
+        self.header = self.shapes = self.times = None
+        self.meta_shm.close()
+        if self.data_shm is not None:
+            self.data_shm.close()
+            if self.owner:
+                self.data_shm.unlink()
+        if self.owner:
+            self.meta_shm.unlink()
+
+
+class SharedStats:
+    NAMES = ["last_fps_counter", "last_jitter", "last_max_jitter", "last_frame_age", "last_tracking_time", "dropped_frames", "stale_frames"]
+    # Extra slot after the counters: capture time of the last processed frame, for forwarding on_frame.
+    CAPTURE_TIME = len(NAMES)
+
+    def __init__(self, name=None):
+        create = name is None
+        self.shm    = shared_memory.SharedMemory(name=name, create=create, size=8 * (len(self.NAMES) + 1))
+        self.name   = self.shm.name
+        self.values = np.ndarray((len(self.NAMES) + 1,), dtype=np.float64, buffer=self.shm.buf)
+        if create:
+            self.values[:] = 0
+
+    def copy_from(self, tracker):
+        for i, name in enumerate(self.NAMES):
+            self.values[i] = getattr(tracker, name)
+
+    def copy_to(self, tracker):
+        for i, name in enumerate(self.NAMES):
+            setattr(tracker, name, float(self.values[i]))
+
+    def release(self, unlink=False):
+        self.values = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _tracker_process_main(config, fps, ring, face_buffer_names, stats_name, stop, frame_event):
+    tracker = FaceTracker()
+    tracker.__dict__.update(config)
+    tracker.own_gc = True
+    tracker.face_buffers = [SharedFaceStateBuffer(len(tracker.features), name) for name in face_buffer_names]
+    stats = SharedStats(stats_name)
+    if frame_event is not None:
+        def on_frame(capture_time):
+            stats.values[SharedStats.CAPTURE_TIME] = capture_time
+            frame_event.set()
+        tracker.on_frame = on_frame
+
+    def bridge():
+        while not stop.wait(0.1):
+            stats.copy_from(tracker)
+        tracker.terminate = True
+    threading.Thread(target=bridge, daemon=True).start()
+
+    try:
+        tracker._inference_loop(ring, fps)
+    except Exception:
+        traceback.print_exc()
+    stats.copy_from(tracker)
+
+    for face_buffer in tracker.face_buffers:
+        face_buffer.close()
+    stats.release()
+    ring.release()
+
+
+class ProcessFaceTracker(FaceTracker):
+    # FaceTracker whose inference runs in a separate process, away from the GUI's GIL.
+    # Capture stays in this process and hands frames over through SharedFrameRing; face samples come
+    # back through SharedFaceStateBuffer. run(), terminate and the fps/jitter counters behave like FaceTracker.
+    # on_frame is forwarded from the tracker process and called from the thread running run(); frames processed
+    # while it runs are coalesced into one call with the latest capture time.
+    def __init__(self):
+        super(ProcessFaceTracker, self).__init__()
+        self.face_buffers = [SharedFaceStateBuffer(len(self.features)) for _ in range(self.faces)]
+        self.process = None
+        atexit.register(self.close)
+
+    def _config(self):
+        return {k: v for k, v in vars(self).items() if isinstance(v, (bool, int, float, str, tuple, type(None)))}
+
+    def run(self):
+        ctx = mp.get_context("spawn")
+        input_reader, fps, drop_frames = self._open_source()
+
+        ring  = SharedFrameRing(ctx, self.frame_queue_size, drop_frames, self.width * self.height * 3)
+        stats = SharedStats()
+        stop  = ctx.Event()
+        frame_event = ctx.Event() if self.on_frame is not None else None
+        self.process = ctx.Process(target=_tracker_process_main,
+                                   args=(self._config(), fps, ring, [b.name for b in self.face_buffers], stats.name, stop, frame_event),
+                                   daemon=True)
+        self.process.start()
+
+        stop_capture = threading.Event()
+        capture_thread = threading.Thread(target=self._capture_loop, args=(input_reader, ring, fps, stop_capture), daemon=True, name="capture")
+        capture_thread.start()
+
+        last_capture_time = None
+        while self.process.is_alive():
+            if self.terminate:
+                stop.set()
+            stats.copy_to(self)
+            if frame_event is None:
+                self.process.join(0.1)
+            elif frame_event.wait(0.1):
+                frame_event.clear()
+                capture_time = float(stats.values[SharedStats.CAPTURE_TIME])
+                if capture_time != last_capture_time:
+                    last_capture_time = capture_time
+                    self.on_frame(capture_time)
+        stats.copy_to(self)
+
+        stop_capture.set()
+        capture_thread.join()
+        self.process = None
+        stats.release(unlink=True)
+        ring.release()
+        print("Terminated")
+
+    def close(self):
+        if self.process is not None:
+            self.terminate = True
+            self.process.join(1)
+        for face_buffer in self.face_buffers:
+            face_buffer.close()
+            face_buffer.unlink()
+        self.face_buffers = []
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+# Screen space has y pointing down, the model y up; the tools flip y after applying camera.screen_to_global.
+FLIP_Y = np.diag(np.array([1, -1, 1, 1], dtype=np.float32))
+
+
+def inverse_affine(matrix):
+    # Inverse of a 4x4 affine transform, [A t; 0 1] -> [A^-1 -A^-1 t; 0 1], with the 3x3 inverse written out
+    # from its cofactors. Falls back to a general inverse for anything with a projective part.
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.shape != (4, 4):
+        return np.linalg.inv(matrix)
+    (a, b, c, x), (d, e, f, y), (g, h, i, z), last = matrix.tolist()
+    if last != [0, 0, 0, 1]:
+        return np.linalg.inv(matrix)
+    A = e * i - f * h
+    B = f * g - d * i
+    C = d * h - e * g
+    det = a * A + b * B + c * C
+    if det == 0:
+        return np.linalg.inv(matrix)
+    r = 1 / det
+    m00, m01, m02 = A * r, (c * h - b * i) * r, (b * f - c * e) * r
+    m10, m11, m12 = B * r, (a * i - c * g) * r, (c * d - a * f) * r
+    m20, m21, m22 = C * r, (b * g - a * h) * r, (a * e - b * d) * r
+    return np.array([[m00, m01, m02, -(m00 * x + m01 * y + m02 * z)],
+                     [m10, m11, m12, -(m10 * x + m11 * y + m12 * z)],
+                     [m20, m21, m22, -(m20 * x + m21 * y + m22 * z)],
+                     [0, 0, 0, 1]], dtype=np.float32)
+
+
+def screen_to_local(points, screen_matrix, inverse_transform):
+    # (n, 2) screen positions -> (n, 4) homogeneous positions local to a node, i.e. for each point
+    # inverse_transform @ FLIP_Y @ screen_matrix @ (x, y, 0, 1), as one matrix product for the whole batch.
+    matrix = np.asarray(inverse_transform, dtype=np.float32) @ FLIP_Y @ np.asarray(screen_matrix, dtype=np.float32)
+    points = np.asarray(points, dtype=np.float32).reshape((-1, 2))
+    homogeneous = np.zeros((len(points), 4), dtype=np.float32)
+    homogeneous[:, 0:2] = points
+    homogeneous[:, 3] = 1
+    return homogeneous @ matrix.T